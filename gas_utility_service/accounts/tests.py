@@ -2,6 +2,8 @@ from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
 from .models import CustomerProfile
+from customer_service.models import ServiceType, ServiceRequest
+from gas_utility.testing import QueryBudgetMixin
 
 class AccountsTestCase(TestCase):
     def setUp(self):
@@ -36,3 +38,29 @@ class AccountsTestCase(TestCase):
         response = self.client.get(reverse('profile'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'TEST12345')  # Account number should be on page
+
+
+class AccountsQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Every accounts view runs a fixed number of queries however much data exists"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser')
+        CustomerProfile.objects.create(user=self.user, account_number='TEST12345',
+                                       address='123 Test Street', phone_number='555-1234')
+        self.service_types = [
+            ServiceType.objects.create(name=f'Type {i}', description='Seeded type') for i in range(3)
+        ]
+    
+    def seed(self, n):
+        """Add n more service requests for the user and log them back in"""
+        for i in range(n):
+            ServiceRequest.objects.create(customer=self.user, service_type=self.service_types[i % 3],
+                                          description='Seeded request')
+        self.client.force_login(self.user)
+    
+    def test_views_run_constant_queries(self):
+        self.assertConstantQueries(reverse('login'), self.seed)
+        self.assertConstantQueries(reverse('register'), self.seed)
+        self.assertConstantQueries(reverse('profile'), self.seed)
+        self.assertConstantQueries(reverse('update_profile'), self.seed)
+        self.assertConstantQueries(reverse('logout'), self.seed, method='post')
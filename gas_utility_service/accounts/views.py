@@ -1,8 +1,13 @@
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .forms import CustomerRegistrationForm, ProfileUpdateForm, CustomerProfileUpdateForm
+from customer_service.caching import acached_fragment
 from customer_service.models import ServiceRequest
+from customer_service.registry import service_types
+from gas_utility.asyncviews import aresolve_user
+from .models import CustomerProfile
 
 def register(request):
     """View for registering new customers"""
@@ -19,20 +24,33 @@ def register(request):
     return render(request, 'accounts/register.html', {'form': form})
 
 @login_required
-def profile(request):
+async def profile(request):
     """View for displaying customer profile and service request history"""
-    user = request.user
+    user = await aresolve_user(request)
     
-    # Get service requests for this user
-    service_requests = ServiceRequest.objects.filter(customer=user).order_by('-created_at')
+    async def render_fragments():
+        # Get service requests for this user, with type names from the registry
+        service_requests = await service_types.aattach([
+            service_request async for service_request in
+            ServiceRequest.objects.filter(customer=user).order_by('-created_at')
+        ])
+        context = {
+            'user': user,
+            'profile': await CustomerProfile.objects.filter(user=user).afirst(),
+            'service_requests': service_requests
+        }
+        return {
+            'summary': render_to_string('accounts/_profile_summary.html', context),
+            'form_fields': render_to_string('accounts/_profile_form_fields.html', context),
+        }
     
-    context = {
-        'user': user,
-        'profile': user.profile,
-        'service_requests': service_requests
-    }
-    
-    return render(request, 'accounts/profile.html', context)
+    # The page only changes when the customer's profile or requests do
+    fragments, hit = await acached_fragment(
+        'profile', [('customer', user.pk), ('profile', user.pk), ('service_types', 'all')], render_fragments
+    )
+    response = render(request, 'accounts/profile.html', {'fragments': fragments})
+    response['X-Fragment-Cache'] = 'hit' if hit else 'miss'
+    return response
 
 @login_required
 def update_profile(request):
@@ -45,14 +63,10 @@ def update_profile(request):
             user_form.save()
             profile_form.save()
             messages.success(request, 'Your profile has been updated!')
-            return redirect('profile')
-    else:
-        user_form = ProfileUpdateForm(instance=request.user)
-        profile_form = CustomerProfileUpdateForm(instance=request.user.profile)
-    
-    context = {
-        'user_form': user_form,
-        'profile_form': profile_form
-    }
+        else:
+            # The form lives in a dialog on the profile page, so report problems there
+            for form in (user_form, profile_form):
+                for errors in form.errors.values():
+                    messages.error(request, ' '.join(errors))
     
-    return render(request, 'accounts/profile.html', context)
+    return redirect('profile')
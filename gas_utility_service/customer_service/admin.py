@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import ServiceRequest, ServiceType, RequestAttachment, RequestStatusUpdate
+from django.utils import timezone
+from .archive import restore_request
+from .forms import StaffChoiceField
+from .incidents import bulk_transition
+from .models import (
+    ServiceRequest, ServiceType, RequestAttachment, RequestStatusUpdate, Task, ArchivedServiceRequest, StaffWorkload,
+)
 
 # Register service types
 @admin.register(ServiceType)
@@ -12,6 +18,7 @@ class ServiceTypeAdmin(admin.ModelAdmin):
 class RequestAttachmentInline(admin.TabularInline):
     model = RequestAttachment
     extra = 0
+    raw_id_fields = ('blob',)
 
 # Inline for status updates
 class RequestStatusUpdateInline(admin.TabularInline):
@@ -20,6 +27,20 @@ class RequestStatusUpdateInline(admin.TabularInline):
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
 
+def bulk_status_action(status, label):
+    """Admin action moving the selected requests to ``status`` in one UPDATE"""
+    @admin.action(description=f'Move selected requests to {label}')
+    def action(modeladmin, request, queryset):
+        selected = queryset.count()
+        moved = bulk_transition(queryset, request.user, status, notes='Changed in bulk from the admin')
+        skipped = selected - moved
+        message = f'{moved} request(s) moved to {label}'
+        if skipped:
+            message += f'; {skipped} skipped because they cannot move to {label}'
+        modeladmin.message_user(request, message)
+    action.__name__ = f'move_to_{status}'
+    return action
+
 # Register service requests
 @admin.register(ServiceRequest)
 class ServiceRequestAdmin(admin.ModelAdmin):
@@ -29,6 +50,7 @@ class ServiceRequestAdmin(admin.ModelAdmin):
     readonly_fields = ('request_number', 'created_at', 'updated_at')
     date_hierarchy = 'created_at'
     inlines = [RequestAttachmentInline, RequestStatusUpdateInline]
+    actions = [bulk_status_action(status, label) for status, label in ServiceRequest.STATUS_CHOICES]
     
     fieldsets = (
         ('Basic Information', {
@@ -45,11 +67,51 @@ class ServiceRequestAdmin(admin.ModelAdmin):
         }),
     )
 
-    # Only show active users in the assigned_to dropdown
+    # Only show active staff in the assigned_to dropdown, with their open request counts
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "assigned_to":
-            kwargs["queryset"] = User.objects.filter(is_staff=True, is_active=True)
+            kwargs["form_class"] = StaffChoiceField
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-# Import needed for the assigned_to queryset modification
-from django.contrib.auth.models import User
+# Register background tasks so failed ones can be inspected and retried
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at', 'updated_at')
+    actions = ['retry_tasks']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_tasks(self, request, queryset):
+        retried = queryset.exclude(status='running').update(status='queued', attempts=0, run_at=timezone.now())
+        self.message_user(request, f'{retried} task(s) queued again')
+
+# Register archived requests so they can be found and restored
+@admin.register(ArchivedServiceRequest)
+class ArchivedServiceRequestAdmin(admin.ModelAdmin):
+    list_display = ('request_number', 'customer', 'service_type', 'status', 'updated_at', 'archived_at')
+    list_filter = ('status', 'service_type')
+    search_fields = ('request_number', 'customer__username', 'customer__email')
+    actions = ['restore_requests']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Restore selected requests')
+    def restore_requests(self, request, queryset):
+        restored = sum(1 for number in queryset.values_list('request_number', flat=True)
+                       if restore_request(number) is not None)
+        self.message_user(request, f'{restored} request(s) restored')
+
+# Register staff workloads so skills and automatic assignment can be set per staff member
+@admin.register(StaffWorkload)
+class StaffWorkloadAdmin(admin.ModelAdmin):
+    list_display = ('staff', 'open_count', 'open_load', 'auto_assign')
+    list_filter = ('auto_assign', 'skills')
+    search_fields = ('staff__username', 'staff__first_name', 'staff__last_name')
+    readonly_fields = ('open_count', 'open_load')
+    raw_id_fields = ('staff',)
+    filter_horizontal = ('skills',)
@@ -0,0 +1,299 @@
+"""
+SLA analytics: time to first response, time in each status and resolution time.
+
+Whenever a status update is written, ``record_status_update`` times the
+transition against the request's RequestTiming row and adds the durations
+to that day's SLARollup histograms, keyed by service type, priority and the
+staff member who made the change. Reports sum the rollups for a date range
+and estimate percentiles from the combined histogram, so they never read
+RequestStatusUpdate and cost the same however much history exists.
+
+Durations go into buckets growing by a factor of ``BUCKET_GROWTH`` from one
+minute upwards, so a percentile estimate is never further off than the
+width of the bucket it falls in (25%), and interpolating inside the bucket
+usually gets much closer.
+"""
+import math
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils.timezone import localdate
+
+from .bulk import batched
+from .models import RequestStatusUpdate, RequestTiming, ServiceRequest, SLARollup
+from .registry import service_types
+
+BUCKET_BASE_SECONDS = 60
+BUCKET_GROWTH = 1.25
+MAX_BUCKET = 80
+
+FIRST_RESPONSE = 'first_response'
+RESOLUTION = 'resolution'
+RESOLVED_STATUS = 'completed'
+
+METRICS = [FIRST_RESPONSE, RESOLUTION] + [f'in_{status}' for status, _ in ServiceRequest.STATUS_CHOICES]
+METRIC_LABELS = {
+    FIRST_RESPONSE: 'Time to first response',
+    RESOLUTION: 'Resolution time',
+    **{f'in_{status}': f'Time in {label.lower()}' for status, label in ServiceRequest.STATUS_CHOICES},
+}
+GROUPINGS = {
+    'service_type': 'service_type_id',
+    'priority': 'priority',
+    'staff': 'staff_id',
+}
+PERCENTILES = (50, 90, 95)
+
+
+def bucket_for(seconds):
+    """The histogram bucket a duration falls into"""
+    if seconds < BUCKET_BASE_SECONDS:
+        return 0
+    return min(int(math.log(seconds / BUCKET_BASE_SECONDS, BUCKET_GROWTH)) + 1, MAX_BUCKET)
+
+
+def bucket_bounds(bucket):
+    """(lower, upper) seconds covered by a bucket"""
+    if bucket == 0:
+        return 0.0, float(BUCKET_BASE_SECONDS)
+    return BUCKET_BASE_SECONDS * BUCKET_GROWTH ** (bucket - 1), BUCKET_BASE_SECONDS * BUCKET_GROWTH ** bucket
+
+
+def rollup_key(day, metric, service_type_id, priority, staff_id, seconds):
+    return (day, metric, service_type_id, priority, staff_id or 0, bucket_for(max(seconds, 0.0)))
+
+
+def increment_rollup(key, count, seconds):
+    """Add ``count`` durations totalling ``seconds`` to the rollup row identified by ``key``"""
+    day, metric, service_type_id, priority, staff_id, bucket = key
+    key = dict(day=day, metric=metric, service_type_id=service_type_id, priority=priority,
+               staff_id=staff_id, bucket=bucket)
+    row = SLARollup.objects.filter(**key)
+    if row.update(count=F('count') + count, total_seconds=F('total_seconds') + seconds):
+        return
+    try:
+        with transaction.atomic():
+            SLARollup.objects.create(count=count, total_seconds=seconds, **key)
+    except IntegrityError:
+        # Another writer created the row first
+        row.update(count=F('count') + count, total_seconds=F('total_seconds') + seconds)
+
+
+def increment_rollups(increments):
+    """Apply {key: (count, seconds)} to the rollup rows in a few bulk queries"""
+    if not increments:
+        return
+    days = {key[0] for key in increments}
+    metrics = {key[1] for key in increments}
+    with transaction.atomic():
+        existing = {}
+        for row in SLARollup.objects.select_for_update().filter(day__in=days, metric__in=metrics):
+            existing[(row.day, row.metric, row.service_type_id, row.priority, row.staff_id, row.bucket)] = row
+        changed = []
+        created = []
+        for key, (count, seconds) in increments.items():
+            row = existing.get(key)
+            if row is None:
+                day, metric, service_type_id, priority, staff_id, bucket = key
+                created.append(SLARollup(day=day, metric=metric, service_type_id=service_type_id, priority=priority,
+                                         staff_id=staff_id, bucket=bucket, count=count, total_seconds=seconds))
+            else:
+                row.count = F('count') + count
+                row.total_seconds = F('total_seconds') + seconds
+                changed.append(row)
+        SLARollup.objects.bulk_update(changed, ['count', 'total_seconds'], batch_size=500)
+    try:
+        with transaction.atomic():
+            SLARollup.objects.bulk_create(created, batch_size=500)
+    except IntegrityError:
+        # Another writer created some of the rows first; fall back to one upsert each
+        for row in created:
+            key = (row.day, row.metric, row.service_type_id, row.priority, row.staff_id, row.bucket)
+            increment_rollup(key, row.count, row.total_seconds)
+
+
+def add_to_rollup(day, metric, service_type_id, priority, staff_id, seconds):
+    """Count one duration in the day's histogram"""
+    seconds = max(seconds, 0.0)
+    increment_rollup(rollup_key(day, metric, service_type_id, priority, staff_id, seconds), 1, seconds)
+
+
+def advance_timing(timing, update, service_request, add):
+    """Move ``timing`` past ``update``, passing each duration it closes to ``add(day, metric, dims, seconds)``"""
+    at = update.created_at
+    timing.service_type_id = service_request.service_type_id
+    timing.priority = service_request.priority
+
+    if update.previous_status:
+        day = localdate(at)
+        dims = (timing.service_type_id, timing.priority, update.updated_by_id)
+        add(day, f'in_{update.previous_status}', dims, (at - timing.status_since).total_seconds())
+        if timing.first_response_at is None:
+            timing.first_response_at = at
+            add(day, FIRST_RESPONSE, dims, (at - timing.created_at).total_seconds())
+        if update.new_status == RESOLVED_STATUS and timing.resolved_at is None:
+            timing.resolved_at = at
+            add(day, RESOLUTION, dims, (at - timing.created_at).total_seconds())
+
+    timing.status = update.new_status
+    timing.status_since = at
+
+
+def new_timing(update, service_request):
+    return RequestTiming(request_id=service_request.pk, created_at=service_request.created_at,
+                         status=update.previous_status or update.new_status,
+                         status_since=service_request.created_at)
+
+
+def record_status_update(update, service_request=None):
+    """Time the transition in ``update`` and add it to the rollups
+
+    The first update of a request (no previous status) starts its clock.
+    Later ones close the time spent in the previous status and, the first
+    time round, record the first response and resolution.
+    """
+    service_request = service_request or update.service_request
+    with transaction.atomic():
+        timing = RequestTiming.objects.select_for_update().filter(request_id=service_request.pk).first()
+        if timing is None:
+            timing = new_timing(update, service_request)
+        advance_timing(timing, update, service_request,
+                       lambda day, metric, dims, seconds: add_to_rollup(day, metric, *dims, seconds))
+        timing.save()
+
+
+def record_status_updates(updates):
+    """Batch version of ``record_status_update`` for updates written together
+
+    Reads and writes the timing rows in bulk and sums the durations per
+    rollup row in memory before writing the rollups in bulk too, so the
+    number of queries doesn't grow with the number of updates.
+    """
+    updates = sorted(updates, key=lambda update: (update.created_at, update.pk))
+    request_ids = {update.service_request_id for update in updates}
+    requests = ServiceRequest.objects.in_bulk(request_ids)
+    increments = defaultdict(lambda: [0, 0.0])
+
+    def add(day, metric, dims, seconds):
+        seconds = max(seconds, 0.0)
+        entry = increments[rollup_key(day, metric, *dims, seconds)]
+        entry[0] += 1
+        entry[1] += seconds
+
+    with transaction.atomic():
+        timings = {timing.request_id: timing
+                   for timing in RequestTiming.objects.select_for_update().filter(request_id__in=request_ids)}
+        created = {}
+        for update in updates:
+            service_request = requests.get(update.service_request_id)
+            if service_request is None:
+                continue
+            timing = timings.get(service_request.pk) or created.get(service_request.pk)
+            if timing is None:
+                timing = created[service_request.pk] = new_timing(update, service_request)
+            advance_timing(timing, update, service_request, add)
+
+        RequestTiming.objects.bulk_create(created.values())
+        RequestTiming.objects.bulk_update(timings.values(), [
+            'service_type_id', 'priority', 'status', 'status_since', 'first_response_at', 'resolved_at',
+        ], batch_size=500)
+        increment_rollups(increments)
+
+
+def replay_history(request_ids, batch_size=500):
+    """Derive timing facts for requests whose history was written in bulk, e.g. by generate_data
+
+    Requests that already have timing facts are skipped. Each batch is
+    written with ``record_status_updates``, so the number of queries grows
+    with the number of batches rather than updates. Returns how many
+    requests were replayed.
+    """
+    replayed = 0
+    for batch in batched(request_ids, batch_size):
+        done = set(RequestTiming.objects.filter(request_id__in=batch).values_list('request_id', flat=True))
+        todo = [pk for pk in batch if pk not in done]
+        updates = list(RequestStatusUpdate.objects.filter(service_request_id__in=todo))
+        if updates:
+            record_status_updates(updates)
+        replayed += len(todo)
+    return replayed
+
+
+def estimate_percentile(histogram, pct):
+    """Estimate the ``pct`` percentile from {bucket: count}, interpolating inside the bucket"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = pct / 100 * total
+    seen = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if seen + count >= rank:
+            lower, upper = bucket_bounds(bucket)
+            return lower + (upper - lower) * ((rank - seen) / count)
+        seen += count
+    return bucket_bounds(max(histogram))[1]
+
+
+def sla_report(date_from, date_to, group_by='service_type', metrics=None):
+    """Summarize the rollups between two dates (inclusive), one row per group
+
+    Each row has the group's label and, for every metric, the count, mean
+    and estimated percentiles in seconds.
+    """
+    field = GROUPINGS[group_by]
+    metrics = metrics or METRICS
+    rows = (SLARollup.objects.filter(day__gte=date_from, day__lte=date_to, metric__in=metrics)
+            .values(field, 'metric', 'bucket').annotate(count=Sum('count'), total=Sum('total_seconds')))
+
+    histograms = defaultdict(lambda: defaultdict(dict))
+    totals = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        histograms[row[field]][row['metric']][row['bucket']] = row['count']
+        totals[row[field]][row['metric']] += row['total']
+
+    labels = group_labels(group_by, histograms.keys())
+    report = []
+    for key in sorted(histograms, key=lambda value: labels[value]):
+        summary = {}
+        for metric in metrics:
+            histogram = histograms[key].get(metric)
+            if not histogram:
+                continue
+            count = sum(histogram.values())
+            summary[metric] = {
+                'count': count,
+                'mean_seconds': round(totals[key][metric] / count, 1),
+                **{f'p{pct}_seconds': round(estimate_percentile(histogram, pct), 1) for pct in PERCENTILES},
+            }
+        report.append({'key': key, 'label': labels[key], 'metrics': summary})
+    return report
+
+
+def format_duration(seconds):
+    """Render seconds as a short duration such as '3d 4h' or '25m'"""
+    if seconds is None:
+        return '-'
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f'{days}d {hours}h'
+    if hours:
+        return f'{hours}h {minutes}m'
+    return f'{minutes}m' if minutes else f'{int(seconds)}s'
+
+
+def group_labels(group_by, keys):
+    if group_by == 'priority':
+        names = dict(ServiceRequest.PRIORITY_CHOICES)
+        return {key: names.get(key, key) for key in keys}
+    if group_by == 'staff':
+        users = User.objects.in_bulk([key for key in keys if key])
+        return {key: (users[key].get_full_name() or users[key].username) if key in users
+                else ('Nobody' if not key else f'User {key}') for key in keys}
+    # Service type names come from the in-process registry
+    return {key: service_type.name if (service_type := service_types.get(key)) else f'Service type {key}'
+            for key in keys}
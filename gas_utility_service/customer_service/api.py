@@ -0,0 +1,296 @@
+"""
+Versioned JSON API (``/api/v1/``) for the mobile app and other clients.
+
+Customers can list their requests and read one with its status history.
+Staff get the dashboard's filterable request list, request details, the
+claim-next work queue and status transitions. Authentication is the
+normal session login; POSTs need the CSRF token like any other form.
+
+Lists use the same keyset cursors as the support dashboard (``after`` and
+``before``). ``fields=a,b`` limits each request to the named fields.
+Responses carry an ETag and Last-Modified derived from the rows'
+``updated_at`` and ``version``, worked out with a narrow query before
+anything is serialized, so a poll that finds nothing new is answered with
+304 Not Modified. Larger responses are gzipped.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_POST
+
+from .filters import filter_requests, search_truncated
+from .models import ArchivedServiceRequest, ServiceRequest
+from .pagination import keyset_window
+from .registry import service_types
+from .transitions import InvalidTransition, TransitionConflict, apply_changes
+from .workqueue import claim_next_request
+
+API_VERSION = 'v1'
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def username(user):
+    return user.username if user else None
+
+
+# Serializers for each field a client can ask for
+REQUEST_FIELDS = {
+    'request_number': lambda r: r.request_number,
+    'status': lambda r: r.status,
+    'status_display': lambda r: r.get_status_display(),
+    'priority': lambda r: r.priority,
+    'service_type': lambda r: r.service_type.name,
+    'description': lambda r: r.description,
+    'version': lambda r: r.version,
+    'created_at': lambda r: isoformat(r.created_at),
+    'updated_at': lambda r: isoformat(r.updated_at),
+}
+STAFF_REQUEST_FIELDS = {
+    **REQUEST_FIELDS,
+    'customer': lambda r: username(r.customer),
+    'assigned_to': lambda r: username(r.assigned_to),
+    'support_notes': lambda r: r.support_notes,
+}
+HISTORY_FIELD = 'status_history'
+
+
+def serialize_update(update, staff):
+    data = {
+        'previous_status': update.previous_status or None,
+        'new_status': update.new_status,
+        'notes': update.notes,
+        'created_at': isoformat(update.created_at),
+    }
+    if staff:
+        data['updated_by'] = username(update.updated_by)
+    return data
+
+
+def serialize_request(service_request, fields, staff=False):
+    """Build the JSON object for a request with just ``fields``"""
+    serializers = STAFF_REQUEST_FIELDS if staff else REQUEST_FIELDS
+    data = {name: serializers[name](service_request) for name in fields if name in serializers}
+    if HISTORY_FIELD in fields:
+        data[HISTORY_FIELD] = [serialize_update(update, staff) for update in service_request.status_updates.all()]
+    return data
+
+
+class FieldsError(ValueError):
+    """Raised when ``fields=`` names a field the endpoint doesn't have"""
+
+
+def requested_fields(request, available, default):
+    """The fields asked for with ``fields=``, or ``default`` when the parameter is absent"""
+    value = request.GET.get('fields')
+    if not value:
+        return default
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise FieldsError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    return fields
+
+
+def api_error(message, status_code, **extra):
+    return JsonResponse({'error': message, **extra}, status=status_code)
+
+
+def api_view(staff=False):
+    """Decorate an API view: check authentication, gzip the response and report bad ``fields=``"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # API clients get a status code rather than a redirect to the login page
+            if not request.user.is_authenticated:
+                return api_error('Authentication required', 401)
+            if staff and not (request.user.is_active and request.user.is_staff):
+                return api_error('Staff access required', 403)
+            try:
+                return view(request, *args, **kwargs)
+            except FieldsError as exc:
+                return api_error(str(exc), 400)
+        return gzip_page(wrapper)
+    return decorator
+
+
+def json_response(data, status=200):
+    # No whitespace between tokens; it only adds bytes
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def conditional(request, rows, fields, build):
+    """Answer with 304 if ``rows`` haven't changed since the client's copy, else with ``build()``
+
+    ``rows`` are (pk, version, updated_at) tuples for what the response
+    shows. They are hashed, together with the requested fields, into the
+    ETag, and the newest ``updated_at`` is the Last-Modified date.
+    """
+    digest = hashlib.sha1(repr((API_VERSION, list(fields), rows)).encode()).hexdigest()[:32]
+    etag = quote_etag(digest)
+    last_modified = max((updated_at for _, _, updated_at in rows), default=None)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = json_response(build())
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep a copy but must check it is still current before using it
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('page_size', settings.API_PAGE_SIZE))
+    except ValueError:
+        size = settings.API_PAGE_SIZE
+    return max(1, min(size, settings.API_MAX_PAGE_SIZE))
+
+
+def request_list_response(request, queryset, fields, staff):
+    """One page of ``queryset``, newest first, with conditional GET"""
+    window, build_page = keyset_window(queryset, request.GET.get('after'), request.GET.get('before'),
+                                       page_size(request))
+    # The validators come from the index-backed window query alone
+    rows = list(window.values_list('pk', 'version', 'updated_at'))
+
+    def build():
+        related = ['customer', 'assigned_to'] if staff else []
+        page = build_page(list(window.select_related(*related)))
+        service_types.attach(page)
+        return {
+            'results': [serialize_request(service_request, fields, staff) for service_request in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        }
+    return conditional(request, rows, fields, build)
+
+
+def request_detail_response(request, queryset, number, fields, staff):
+    """One request with conditional GET, or 404"""
+    row = queryset.filter(request_number=number).values_list('pk', 'version', 'updated_at').first()
+    if row is None:
+        return None
+
+    def build():
+        # Archived requests have their own history table
+        updates = queryset.model._meta.get_field('status_updates').related_model.objects.order_by('-created_at')
+        if staff:
+            updates = updates.select_related('updated_by')
+        related = ['customer', 'assigned_to'] if staff else []
+        service_request = (queryset.select_related(*related)
+                           .prefetch_related(Prefetch('status_updates', queryset=updates)).get(pk=row[0]))
+        service_types.attach([service_request])
+        return serialize_request(service_request, fields, staff)
+    return conditional(request, [row], fields, build)
+
+
+@require_GET
+@api_view()
+def request_list(request):
+    """The customer's own requests, newest first"""
+    fields = requested_fields(request, list(REQUEST_FIELDS), list(REQUEST_FIELDS))
+    return request_list_response(request, ServiceRequest.objects.filter(customer=request.user), fields, staff=False)
+
+
+@require_GET
+@api_view()
+def request_detail(request, request_number):
+    """One of the customer's requests with its status history"""
+    available = [*REQUEST_FIELDS, HISTORY_FIELD]
+    fields = requested_fields(request, available, available)
+    for model in (ServiceRequest, ArchivedServiceRequest):
+        # Old closed requests live in the archive
+        response = request_detail_response(request, model.objects.filter(customer=request.user), request_number,
+                                           fields, staff=False)
+        if response is not None:
+            return response
+    return api_error('Not found', 404)
+
+
+@require_GET
+@api_view(staff=True)
+def support_request_list(request):
+    """Every request, with the support dashboard's filters"""
+    fields = requested_fields(request, list(STAFF_REQUEST_FIELDS), list(STAFF_REQUEST_FIELDS))
+    filters = {
+        'search': request.GET.get('search', ''),
+        'status': request.GET.get('status', ''),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+        'search_limit': settings.SEARCH_MAX_RESULTS,
+    }
+    queryset = filter_requests(ServiceRequest.objects.all(), **filters)
+    response = request_list_response(request, queryset, fields, staff=True)
+    # Only the best-ranked matches are listed; tell clients when some were left out
+    if search_truncated(ServiceRequest.objects.all(), **filters):
+        response['X-Search-Truncated'] = str(settings.SEARCH_MAX_RESULTS)
+    return response
+
+
+@require_GET
+@api_view(staff=True)
+def support_request_detail(request, request_number):
+    """Any request with its status history and internal notes"""
+    available = [*STAFF_REQUEST_FIELDS, HISTORY_FIELD]
+    fields = requested_fields(request, available, available)
+    for model in (ServiceRequest, ArchivedServiceRequest):
+        response = request_detail_response(request, model.objects.all(), request_number, fields, staff=True)
+        if response is not None:
+            return response
+    return api_error('Not found', 404)
+
+
+@require_POST
+@api_view(staff=True)
+def claim(request):
+    """Assign the most urgent unassigned request to the caller; 204 if there is none"""
+    service_request = claim_next_request(request.user)
+    if service_request is None:
+        return HttpResponse(status=204)
+    service_types.attach([service_request])
+    return json_response(serialize_request(service_request, list(STAFF_REQUEST_FIELDS), staff=True))
+
+
+@require_POST
+@api_view(staff=True)
+def transition(request, request_number):
+    """Change a request's status
+
+    Takes a JSON body with ``status``, the ``version`` the client last saw
+    and optional ``notes``. Answers 409 with the current version if someone
+    else changed the request first.
+    """
+    try:
+        body = json.loads(request.body or b'{}')
+        status = body['status']
+        version = int(body['version'])
+    except (ValueError, KeyError, TypeError):
+        return api_error('A JSON body with status and version is required', 400)
+
+    service_request = (ServiceRequest.objects.select_related('customer', 'assigned_to')
+                       .filter(request_number=request_number).first())
+    if service_request is None:
+        return api_error('Not found', 404)
+    try:
+        apply_changes(service_request, request.user, expected_status=service_request.status,
+                      expected_version=version, notes=str(body.get('notes', '')), status=status)
+    except InvalidTransition as exc:
+        return api_error(str(exc), 400)
+    except TransitionConflict:
+        current = ServiceRequest.objects.filter(pk=service_request.pk).values('status', 'version').first()
+        return api_error('The request was changed by someone else', 409, **(current or {}))
+    service_types.attach([service_request])
+    return json_response(serialize_request(service_request, list(STAFF_REQUEST_FIELDS), staff=True))
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import api
+
+urlpatterns = [
+    # Customer endpoints
+    path('requests/', api.request_list, name='api_request_list'),
+    path('requests/<str:request_number>/', api.request_detail, name='api_request_detail'),
+    
+    # Support staff endpoints
+    path('support/requests/', api.support_request_list, name='api_support_request_list'),
+    path('support/requests/<str:request_number>/', api.support_request_detail, name='api_support_request_detail'),
+    path('support/requests/<str:request_number>/transition/', api.transition, name='api_transition'),
+    path('support/claim/', api.claim, name='api_claim'),
+]
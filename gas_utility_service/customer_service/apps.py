@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CustomerServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customer_service'
+
+    def ready(self):
+        # Register signal handlers and background tasks
+        from . import signals, tasks  # noqa: F401
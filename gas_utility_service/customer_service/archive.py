@@ -0,0 +1,115 @@
+"""
+Hot/cold archival of closed service requests.
+
+Requests that were completed or cancelled more than ``ARCHIVE_AFTER_DAYS``
+ago are copied, with their status history and attachments, into the
+Archived* tables and deleted from the working tables, a batch per
+transaction. The dashboard, counters, search index and exports then only
+deal with open and recent work. Rows keep their ids in the archive, so
+attachment links keep working, and ``restore_request`` moves a request
+back unchanged.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from .bulk import bulk_create_keeping_timestamps
+from .caching import bump_versions
+from .counters import adjust_counter
+from .models import (
+    ServiceRequest, RequestStatusUpdate, RequestAttachment,
+    ArchivedServiceRequest, ArchivedStatusUpdate, ArchivedAttachment,
+)
+from .taskqueue import enqueue
+
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+# Hot model -> archive model, parents first
+ARCHIVE_MODELS = (
+    (ServiceRequest, ArchivedServiceRequest),
+    (RequestStatusUpdate, ArchivedStatusUpdate),
+    (RequestAttachment, ArchivedAttachment),
+)
+
+
+def copy_row(instance, model):
+    """Build a ``model`` instance from the fields it shares with ``instance``"""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if hasattr(instance, field.attname):
+            value = getattr(instance, field.attname)
+            # Files are copied by name; the stored file is shared
+            values[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return model(**values)
+
+
+def archivable_requests(older_than_days=None):
+    """Closed requests that haven't changed for ``older_than_days`` days"""
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    return ServiceRequest.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=cutoff)
+
+
+def archive_batch(request_ids, older_than_days=None):
+    """Move the given requests and their history into the archive, returning how many moved"""
+    with transaction.atomic():
+        # Lock the rows and skip anything reopened or changed since it was picked
+        requests = list(archivable_requests(older_than_days).select_for_update().filter(pk__in=request_ids))
+        if not requests:
+            return 0
+        ids = [service_request.pk for service_request in requests]
+        ArchivedServiceRequest.objects.bulk_create([copy_row(r, ArchivedServiceRequest) for r in requests])
+        for hot_model, archive_model in ARCHIVE_MODELS[1:]:
+            archive_model.objects.bulk_create([
+                copy_row(row, archive_model) for row in hot_model.objects.filter(service_request_id__in=ids)
+            ])
+        # Deleting through the ORM sends the usual signals, which take the
+        # requests out of the counters and search index and expire cached pages
+        ServiceRequest.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive_requests(older_than_days=None, batch_size=None, limit=None):
+    """Archive every due request, ``batch_size`` per transaction; returns how many were moved"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        ids = list(archivable_requests(older_than_days).order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            break
+        moved += archive_batch(ids, older_than_days)
+    return moved
+
+
+def restore_request(request_number):
+    """Move an archived request and its history back into the working tables
+
+    Returns the restored ServiceRequest, or None if no archived request has
+    that number.
+    """
+    with transaction.atomic():
+        archived = (ArchivedServiceRequest.objects.select_for_update()
+                    .filter(request_number=request_number).first())
+        if archived is None:
+            return None
+        service_request = copy_row(archived, ServiceRequest)
+        bulk_create_keeping_timestamps(ServiceRequest, [service_request])
+        bulk_create_keeping_timestamps(
+            RequestStatusUpdate, [copy_row(update, RequestStatusUpdate) for update in archived.status_updates.all()]
+        )
+        bulk_create_keeping_timestamps(
+            RequestAttachment, [copy_row(attachment, RequestAttachment) for attachment in archived.attachments.all()]
+        )
+        archived.delete()
+
+        # bulk_create skips signals, so update the counters, search index,
+        # duplicate signatures and cache here
+        adjust_counter(service_request.counter_key, 1)
+        enqueue('search.index_requests', request_ids=[service_request.pk])
+        enqueue('duplicates.index_requests', request_ids=[service_request.pk])
+        bump_versions(('customer', service_request.customer_id), ('request', service_request.request_number))
+    return service_request
@@ -0,0 +1,291 @@
+"""
+Workload-balanced assignment of service requests to support staff.
+
+Every member of staff has a StaffWorkload row holding how many open
+requests they have and their load, the same requests weighted by
+priority. The signals keep both up to date whenever a request is assigned,
+reassigned, reprioritized, closed or deleted, so nothing here ever counts
+requests.
+
+``AssignmentEngine`` keeps active staff in a min-heap keyed by load and
+hands each request to the least loaded member of staff who handles its
+service type, in O(log n) per request. New requests are assigned as they
+are created when ``AUTO_ASSIGN_NEW_REQUESTS`` is on, from an engine shared
+by the process and reloaded every ``ASSIGNMENT_REFRESH_SECONDS``; the
+``assign_requests`` command assigns whatever is still waiting in batches.
+"""
+import heapq
+import statistics
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .bulk import batched
+from .models import ServiceRequest, StaffWorkload
+from .taskqueue import enqueue
+from .transitions import TransitionConflict, apply_changes
+from .workqueue import queue
+
+# How much an open request of each priority adds to a staff member's load
+PRIORITY_WEIGHTS = {
+    'low': 1,
+    'medium': 2,
+    'high': 4,
+    'emergency': 8,
+}
+
+
+def weight(priority):
+    return PRIORITY_WEIGHTS.get(priority, 1)
+
+
+def adjust_workload(key, delta):
+    """Add ``delta`` requests to the workload identified by (staff id, priority)"""
+    staff_id, priority = key
+    changes = dict(open_count=F('open_count') + delta, open_load=F('open_load') + delta * weight(priority))
+    row = StaffWorkload.objects.filter(staff_id=staff_id)
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            StaffWorkload.objects.create(staff_id=staff_id, open_count=delta, open_load=delta * weight(priority))
+    except IntegrityError:
+        # Another writer created the row first
+        row.update(**changes)
+
+
+def move_workload(old_key, new_key):
+    """Move one request between workloads; either key may be None"""
+    if old_key == new_key:
+        return
+    with transaction.atomic():
+        if old_key is not None:
+            adjust_workload(old_key, -1)
+        if new_key is not None:
+            adjust_workload(new_key, 1)
+
+
+def reconcile_workloads():
+    """Recompute every staff member's open count and load from the request table
+
+    Returns a list of (staff id, stored count, actual count) tuples for the
+    workloads that were wrong.
+    """
+    with transaction.atomic():
+        counts = Counter()
+        loads = Counter()
+        rows = (ServiceRequest.objects.filter(status__in=ServiceRequest.OPEN_STATUSES, assigned_to__isnull=False)
+                .values('assigned_to_id', 'priority').annotate(total=Count('id')).order_by())
+        for row in rows:
+            counts[row['assigned_to_id']] += row['total']
+            loads[row['assigned_to_id']] += row['total'] * weight(row['priority'])
+        stored = {workload.staff_id: workload for workload in StaffWorkload.objects.select_for_update()}
+
+        drift = []
+        for staff_id in set(counts) | set(stored):
+            workload = stored.get(staff_id) or StaffWorkload(staff_id=staff_id)
+            if (workload.open_count, workload.open_load) == (counts[staff_id], loads[staff_id]):
+                continue
+            drift.append((staff_id, workload.open_count, counts[staff_id]))
+            workload.open_count, workload.open_load = counts[staff_id], loads[staff_id]
+            workload.save()
+        return drift
+
+
+class AssignmentEngine:
+    """Min-heap of staff ordered by (load, open count, staff id)
+
+    ``staff`` is an iterable of (staff id, load, open count, skills) tuples,
+    where skills is the set of service type ids the staff member handles
+    and an empty set means all of them. Staff who don't handle a request's
+    service type are popped and pushed back, so specialists cost a little
+    extra only when they are the least loaded.
+    """
+
+    def __init__(self, staff):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._skills = {}
+        for staff_id, load, count, skills in staff:
+            self._heap.append((load, count, staff_id))
+            self._skills[staff_id] = skills
+        heapq.heapify(self._heap)
+        self.pops = 0
+
+    @classmethod
+    def from_database(cls):
+        """Build an engine from the active staff who accept automatic assignment, in two queries"""
+        staff = (User.objects.filter(is_staff=True, is_active=True)
+                 .exclude(workload__auto_assign=False)
+                 .values_list('pk', 'workload__open_load', 'workload__open_count'))
+        skills = {}
+        for staff_id, service_type_id in StaffWorkload.skills.through.objects.values_list(
+            'staffworkload__staff_id', 'servicetype_id'
+        ):
+            skills.setdefault(staff_id, set()).add(service_type_id)
+        return cls((staff_id, load or 0, count or 0, skills.get(staff_id, set()))
+                   for staff_id, load, count in staff)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def pick(self, service_type_id, priority):
+        """Return the least loaded staff id for a request and count it against them, or None"""
+        with self._lock:
+            skipped = []
+            chosen = None
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                self.pops += 1
+                skills = self._skills[entry[2]]
+                if not skills or service_type_id in skills:
+                    chosen = entry
+                    break
+                skipped.append(entry)
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+            if chosen is None:
+                return None
+            load, count, staff_id = chosen
+            heapq.heappush(self._heap, (load + weight(priority), count + 1, staff_id))
+            return staff_id
+
+    def release(self, staff_id, priority):
+        """Take back a ``pick`` whose assignment wasn't saved"""
+        with self._lock:
+            for index, (load, count, entry_staff_id) in enumerate(self._heap):
+                if entry_staff_id == staff_id:
+                    self._heap[index] = (load - weight(priority), count - 1, staff_id)
+                    heapq.heapify(self._heap)
+                    return
+
+    def loads(self):
+        """{staff id: load} as the engine currently sees it"""
+        with self._lock:
+            return {staff_id: load for load, _, staff_id in self._heap}
+
+
+_engine = None
+_engine_loaded_at = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The engine shared by this process, reloaded every ``ASSIGNMENT_REFRESH_SECONDS``
+
+    Between reloads it only sees the requests this process assigned, so
+    closed requests and other processes' assignments catch up on reload.
+    """
+    global _engine, _engine_loaded_at
+    with _engine_lock:
+        if _engine is None or time.monotonic() - _engine_loaded_at > settings.ASSIGNMENT_REFRESH_SECONDS:
+            _engine = AssignmentEngine.from_database()
+            _engine_loaded_at = time.monotonic()
+        return _engine
+
+
+def reset_engine():
+    """Drop the shared engine so the next assignment reloads it"""
+    global _engine
+    with _engine_lock:
+        _engine = None
+
+
+@contextmanager
+def auto_assignment():
+    """Yield a function assigning unsaved new requests to the least loaded suitable staff member
+
+    The function sets ``assigned_to`` and returns the staff id, or None if
+    nobody can take the request; saving the request adds it to their
+    workload. Wrap the ``transaction.atomic()`` block that saves the
+    requests: if it raises, the transaction has rolled back and the picks
+    are given back to the shared engine, which would otherwise overstate
+    those staff members' load until it reloads.
+    """
+    engine = None
+    picks = []
+
+    def assign(service_request):
+        nonlocal engine
+        engine = engine or get_engine()
+        staff_id = engine.pick(service_request.service_type_id, service_request.priority)
+        service_request.assigned_to_id = staff_id
+        if staff_id is not None:
+            picks.append((staff_id, service_request.priority))
+        return staff_id
+
+    try:
+        yield assign
+    except BaseException:
+        for staff_id, priority in picks:
+            engine.release(staff_id, priority)
+        raise
+
+
+def assign_requests(limit=None, batch_size=None, engine=None):
+    """Assign unassigned pending requests, most urgent first; returns how many were assigned
+
+    Uses a freshly loaded engine unless one is passed in. Requests that
+    change while the batch runs are left for the next run.
+    """
+    engine = engine or AssignmentEngine.from_database()
+    if not len(engine):
+        return 0
+    batch_size = batch_size or settings.ASSIGNMENT_BATCH_SIZE
+    ids = list(queue().values_list('pk', flat=True)[:limit])
+    assigned = 0
+    for batch in batched(ids, batch_size):
+        requests = ServiceRequest.objects.in_bulk(batch)
+        with transaction.atomic():
+            for pk in batch:
+                service_request = requests[pk]
+                staff_id = engine.pick(service_request.service_type_id, service_request.priority)
+                if staff_id is None:
+                    continue
+                try:
+                    apply_changes(service_request, None, expected_status='pending',
+                                  expected_version=service_request.version, assigned_to_id=staff_id)
+                except TransitionConflict:
+                    # Someone else changed the request first; don't count it against the staff member
+                    engine.release(staff_id, service_request.priority)
+                    continue
+                enqueue('notifications.request_assigned', request_id=pk)
+                assigned += 1
+    return assigned
+
+
+def simulate(engine, requests):
+    """Replay (service type id, priority) pairs through ``engine`` without touching the database
+
+    Returns the per-assignment cost and how evenly the load ended up spread.
+    """
+    timings = []
+    unassigned = 0
+    pops_before = engine.pops
+    for service_type_id, priority in requests:
+        start = time.perf_counter()
+        staff_id = engine.pick(service_type_id, priority)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+        if staff_id is None:
+            unassigned += 1
+
+    loads = list(engine.loads().values()) or [0]
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'staff': len(engine),
+        'unassigned': unassigned,
+        'mean_us': round(statistics.fmean(timings), 2) if timings else 0,
+        'p95_us': round(timings[int(len(timings) * 0.95)], 2) if timings else 0,
+        'max_us': round(timings[-1], 2) if timings else 0,
+        'heap_pops_per_request': round((engine.pops - pops_before) / len(timings), 2) if timings else 0,
+        'min_load': min(loads),
+        'max_load': max(loads),
+        'load_stdev': round(statistics.pstdev(loads), 2),
+    }
@@ -0,0 +1,332 @@
+"""
+Latency benchmark for the customer and staff pages.
+
+Drives every page through Django's test client (in-process) or over HTTP
+against a running server, and reports latency percentiles, throughput and
+query counts per URL. ``compare_servers`` runs the same concurrent load
+against a WSGI and an ASGI server started on the current database, and
+``run_concurrent_writes`` measures how many requests many simultaneous
+customers can submit.
+"""
+import json
+import math
+import os
+import platform
+import shlex
+import socket
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from gas_utility.querycount import QueryRecorder
+
+from .models import ServiceRequest
+
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile of ``values`` using nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(name, url, timings, query_counts, statuses, elapsed=None, sizes=None):
+    """Summarize one URL's timings; ``elapsed`` is the wall-clock time for concurrent runs"""
+    total = sum(timings)
+    wall = elapsed if elapsed is not None else total
+    return {
+        'name': name,
+        'url': url,
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'mean_ms': round(total / len(timings) * 1000, 2) if timings else 0.0,
+        'throughput_rps': round(len(timings) / wall, 1) if wall else 0.0,
+        'queries': max(query_counts) if query_counts else None,
+        'errors': sum(1 for status in statuses if status >= 400),
+        'bytes': max(sizes) if sizes else None,
+    }
+
+
+def benchmark_targets():
+    """Pick a sample customer, staff member and request and return the pages to drive
+
+    Returns (customer, staff, [(name, url, user), ...]).
+    """
+    sample = (ServiceRequest.objects.filter(customer__profile__isnull=False, customer__is_staff=False)
+              .select_related('customer').order_by('-id').first())
+    if sample is None:
+        raise ValueError('No service requests with customer profiles found; run generate_data first')
+    customer = sample.customer
+    staff = User.objects.filter(is_staff=True, is_active=True).order_by('id').first()
+    if staff is None:
+        raise ValueError('No active staff user found; run generate_data first')
+    word = sample.description.split()[0]
+
+    number = sample.request_number
+    return customer, staff, [
+        ('request_list', reverse('request_list'), customer),
+        ('create_request', reverse('create_request'), customer),
+        ('request_detail', reverse('request_detail', args=[number]), customer),
+        ('profile', reverse('profile'), customer),
+        ('support_dashboard', reverse('support_dashboard'), staff),
+        ('support_dashboard_search', f"{reverse('support_dashboard')}?search={word}", staff),
+        ('support_dashboard_status', f"{reverse('support_dashboard')}?status=pending", staff),
+        ('support_request_detail', reverse('support_request_detail', args=[number]), staff),
+        ('update_request', reverse('update_request', args=[number]), staff),
+        ('api_request_list', reverse('api_request_list'), customer),
+        ('api_request_detail', reverse('api_request_detail', args=[number]), customer),
+        ('api_support_requests', reverse('api_support_request_list'), staff),
+    ]
+
+
+def run_in_process(targets, iterations, warmup=2):
+    """Benchmark every target through the test client"""
+    clients = {}
+    results = []
+    for name, url, user in targets:
+        client = clients.get(user.pk)
+        if client is None:
+            client = clients[user.pk] = Client()
+            client.force_login(user)
+        for _ in range(warmup):
+            client.get(url)
+        timings, query_counts, statuses, sizes = [], [], [], []
+        for _ in range(iterations):
+            with QueryRecorder() as recorder:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+            query_counts.append(recorder.count)
+            statuses.append(response.status_code)
+            sizes.append(len(response.content))
+        results.append(summarize(name, url, timings, query_counts, statuses, sizes=sizes))
+    return results
+
+
+def session_cookie(user):
+    """Create a logged-in session for ``user`` and return it as a Cookie header"""
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    cookie = SimpleCookie()
+    cookie[settings.SESSION_COOKIE_NAME] = session.session_key
+    return cookie.output(header='', attrs=[]).strip()
+
+
+def fetch_timed(request):
+    """Fetch ``request`` and return (seconds taken, response, body)
+
+    Error statuses are returned like any other response, so a page that
+    fails is counted as an error instead of ending the benchmark.
+    """
+    start = time.perf_counter()
+    try:
+        response = urlopen(request)
+    except HTTPError as exc:
+        response = exc
+    with response:
+        body = response.read()
+    return time.perf_counter() - start, response, body
+
+
+def run_over_http(targets, iterations, base_url, warmup=2):
+    """Benchmark every target against a running server
+
+    Query counts come from the ``X-Query-Count`` header added by
+    QueryCountMiddleware, so they are only reported when it is enabled.
+    """
+    cookies = {}
+    results = []
+    for name, url, user in targets:
+        cookie = cookies.get(user.pk)
+        if cookie is None:
+            cookie = cookies[user.pk] = session_cookie(user)
+        request = Request(base_url.rstrip('/') + url, headers={'Cookie': cookie})
+        for _ in range(warmup):
+            fetch_timed(request)
+        timings, query_counts, statuses, sizes = [], [], [], []
+        for _ in range(iterations):
+            timing, response, body = fetch_timed(request)
+            timings.append(timing)
+            statuses.append(response.status)
+            sizes.append(len(body))
+            if response.headers.get('X-Query-Count'):
+                query_counts.append(int(response.headers['X-Query-Count']))
+        results.append(summarize(name, url, timings, query_counts, statuses, sizes=sizes))
+    return results
+
+
+def run_concurrent_http(targets, iterations, base_url, concurrency, warmup=2):
+    """Benchmark every target against a running server with ``concurrency`` requests in flight
+
+    Throughput is measured over wall-clock time, so it shows how well the
+    server overlaps requests rather than how fast a single one is.
+    """
+    cookies = {}
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, url, user in targets:
+            cookie = cookies.get(user.pk)
+            if cookie is None:
+                cookie = cookies[user.pk] = session_cookie(user)
+            full_url = base_url.rstrip('/') + url
+
+            def fetch(_):
+                start = time.perf_counter()
+                try:
+                    with urlopen(Request(full_url, headers={'Cookie': cookie}), timeout=60) as response:
+                        response.read()
+                        status = response.status
+                except HTTPError as exc:
+                    status = exc.code
+                except OSError:
+                    # Connection refused or reset: the server couldn't keep up
+                    status = 599
+                return time.perf_counter() - start, status
+
+            list(pool.map(fetch, range(warmup * concurrency)))
+            started = time.perf_counter()
+            outcomes = list(pool.map(fetch, range(iterations)))
+            elapsed = time.perf_counter() - started
+            results.append(summarize(name, url, [timing for timing, _ in outcomes], [],
+                                     [status for _, status in outcomes], elapsed=elapsed))
+    return results
+
+
+def run_concurrent_writes(customer, service_type, submitters, per_submitter):
+    """Have ``submitters`` customers post ``per_submitter`` new requests each at the same time
+
+    Each submitter drives the create_request view through its own test
+    client and database connection. Returns the summary row plus a count of
+    each distinct error, such as "database is locked".
+    """
+    url = reverse('create_request')
+    data = {'service_type': service_type.pk, 'description': 'Write benchmark request', 'priority': 'high'}
+
+    def submit(_):
+        client = Client()
+        outcomes = []
+        try:
+            # Logging in writes a session, so it can hit a locked database too
+            client.force_login(customer)
+            for _ in range(per_submitter):
+                start = time.perf_counter()
+                try:
+                    status, error = client.post(url, data).status_code, None
+                except Exception as exc:
+                    status, error = 500, str(exc)
+                outcomes.append((time.perf_counter() - start, status, error))
+        except Exception as exc:
+            outcomes.append((0.0, 500, f'login: {exc}'))
+        finally:
+            # Each submitter thread has its own connection
+            if submitters > 1:
+                connections.close_all()
+        return outcomes
+
+    started = time.perf_counter()
+    if submitters == 1:
+        outcomes = submit(0)
+    else:
+        with ThreadPoolExecutor(max_workers=submitters) as pool:
+            outcomes = [outcome for batch in pool.map(submit, range(submitters)) for outcome in batch]
+    elapsed = time.perf_counter() - started
+
+    errors = {}
+    for _, _, error in outcomes:
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+    row = summarize('create_request', url, [timing for timing, _, _ in outcomes], [],
+                    [status for _, status, _ in outcomes], elapsed=elapsed)
+    return row, errors
+
+
+@contextmanager
+def running_server(command, port, timeout=30):
+    """Start a server from ``command`` and wait until it accepts connections on ``port``
+
+    Query accounting is switched off in the server so its sync-only
+    middleware doesn't hide the difference between WSGI and ASGI.
+    """
+    env = {**os.environ, 'QUERY_ACCOUNTING': '0'}
+    process = subprocess.Popen(shlex.split(command), cwd=settings.BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {process.returncode}: {command}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Server did not start listening on port {port}: {command}')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(results, mode, iterations):
+    """Wrap results with the metadata needed to compare runs between commits"""
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'mode': mode,
+        'iterations': iterations,
+        'database': connection.vendor,
+        'service_requests': ServiceRequest.objects.count(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def compare_reports(baseline, current):
+    """Return (name, baseline p95, current p95, change %) for URLs present in both reports"""
+    previous = {row['name']: row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        before = previous.get(row['name'])
+        if not before or not before['p95_ms']:
+            continue
+        change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        rows.append((row['name'], before['p95_ms'], row['p95_ms'], round(change, 1)))
+    return rows
+
+
+def load_report(path):
+    with open(path) as fh:
+        return json.load(fh)
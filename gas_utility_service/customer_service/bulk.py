@@ -0,0 +1,65 @@
+"""
+Helpers for writing large numbers of rows efficiently.
+"""
+from contextlib import contextmanager
+
+
+@contextmanager
+def preserve_timestamps(*models):
+    """Let bulk writes keep explicit created_at/updated_at/uploaded_at values
+
+    ``auto_now`` and ``auto_now_add`` fields normally overwrite whatever the
+    caller set. Inside this block they are switched off for the given models
+    so generated or imported history keeps its original timestamps. The
+    flags are shared by the whole process, so only use this in commands that
+    write nothing else; ``bulk_create_keeping_timestamps`` is the thread-safe
+    way.
+    """
+    saved = []
+    for model in models:
+        for field in timestamp_fields(model):
+            saved.append((field, field.auto_now, field.auto_now_add))
+            field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def timestamp_fields(model):
+    return [field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+
+
+def bulk_create_keeping_timestamps(model, rows):
+    """``bulk_create`` ``rows``, then write their original auto_now/auto_now_add values back
+
+    Unlike ``preserve_timestamps`` this leaves the shared field flags alone,
+    so it is safe to use while other threads save the same models. Call it
+    inside a transaction so nobody sees the interim timestamps.
+    """
+    fields = timestamp_fields(model)
+    original = [[getattr(row, field.attname) for field in fields] for row in rows]
+    model.objects.bulk_create(rows)
+    if not fields:
+        return rows
+    for row, values in zip(rows, original):
+        for field, value in zip(fields, values):
+            setattr(row, field.attname, value)
+    # bulk_update doesn't run pre_save, so the values are written as given
+    model.objects.bulk_update(rows, [field.name for field in fields], batch_size=500)
+    return rows
+
+
+def batched(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
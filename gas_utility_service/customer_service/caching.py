@@ -0,0 +1,133 @@
+"""
+Versioned caching of rendered page fragments.
+
+Every cached fragment key includes the current version token of each thing
+it was built from: a customer's requests (``customer``), a single request
+(``request``), a customer's profile (``profile``) and the service type list
+(``service_types``). Signal handlers replace a version token whenever the
+underlying rows change, so stale fragments are never looked up again and
+simply age out of the cache; nothing has to find and delete them.
+
+Tokens are random rather than counters, so a token that was evicted and
+recreated can't collide with an old one. Any Django cache backend works:
+local memory, file based or Redis.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+STATS_KEY = 'fragment-stats:{name}:{outcome}'
+
+# Fragments cached by the customer pages, for reporting
+FRAGMENTS = ('request_list', 'request_detail', 'profile')
+
+
+def get_cache():
+    return caches[settings.FRAGMENT_CACHE_ALIAS]
+
+
+def version_key(scope, key):
+    return f'version:{scope}:{key}'
+
+
+def _new_token():
+    return uuid.uuid4().hex
+
+
+def bump(*scopes):
+    """Invalidate everything built from the given (scope, key) pairs"""
+    get_cache().set_many({version_key(scope, key): _new_token() for scope, key in scopes}, timeout=None)
+
+
+def bump_versions(*scopes):
+    """Invalidate now and again once the current transaction commits
+
+    The second bump stops a reader that cached the old rows while the write
+    was still uncommitted from serving them afterwards.
+    """
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def get_versions(*scopes):
+    """Return the current token for each (scope, key) pair, creating missing ones"""
+    cache = get_cache()
+    keys = [version_key(scope, key) for scope, key in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            token = _new_token()
+            # add() keeps a token another process created in the meantime
+            if not cache.add(key, token, timeout=None):
+                token = cache.get(key, token)
+            found[key] = token
+    return [found[key] for key in keys]
+
+
+async def aget_versions(*scopes):
+    """Async version of ``get_versions``"""
+    cache = get_cache()
+    keys = [version_key(scope, key) for scope, key in scopes]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            token = _new_token()
+            # add() keeps a token another process created in the meantime
+            if not await cache.aadd(key, token, timeout=None):
+                token = await cache.aget(key, token)
+            found[key] = token
+    return [found[key] for key in keys]
+
+
+async def _acount(name, outcome):
+    cache = get_cache()
+    key = STATS_KEY.format(name=name, outcome=outcome)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+async def acached_fragment(name, scopes, render, vary=()):
+    """Return (value, hit) for fragment ``name`` built from ``scopes``
+
+    ``vary`` holds any further values the fragment depends on, such as the
+    viewer. On a miss ``render`` (a coroutine function) is awaited and its
+    result, a rendered string or a dict of them, is stored for
+    ``FRAGMENT_CACHE_TIMEOUT`` seconds.
+    """
+    cache = get_cache()
+    versions = await aget_versions(*scopes)
+    key = ':'.join(['fragment', name, *map(str, vary), *versions])
+    value = await cache.aget(key)
+    if value is not None:
+        await _acount(name, 'hits')
+        return _safe(value), True
+    value = await render()
+    await cache.aset(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+    await _acount(name, 'misses')
+    return _safe(value), False
+
+
+def _safe(value):
+    # Rendered HTML loses its safe-string type in some cache serializers
+    if isinstance(value, dict):
+        return {key: mark_safe(html) for key, html in value.items()}
+    return mark_safe(value)
+
+
+def fragment_stats(names):
+    """Return {name: (hits, misses)} for the given fragment names"""
+    cache = get_cache()
+    keys = {(name, outcome): STATS_KEY.format(name=name, outcome=outcome)
+            for name in names for outcome in ('hits', 'misses')}
+    counts = cache.get_many(list(keys.values()))
+    return {name: (counts.get(keys[name, 'hits'], 0), counts.get(keys[name, 'misses'], 0)) for name in names}
+
+
+def reset_fragment_stats(names):
+    get_cache().delete_many([STATS_KEY.format(name=name, outcome=outcome)
+                             for name in names for outcome in ('hits', 'misses')])
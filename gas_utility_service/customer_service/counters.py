@@ -0,0 +1,77 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import RequestCounter, ServiceRequest
+
+
+def adjust_counter(key, delta):
+    """Add ``delta`` to the counter bucket identified by (status, priority, service_type_id)"""
+    status, priority, service_type_id = key
+    bucket = RequestCounter.objects.filter(status=status, priority=priority, service_type_id=service_type_id)
+    if bucket.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            RequestCounter.objects.create(
+                status=status, priority=priority, service_type_id=service_type_id, count=delta
+            )
+    except IntegrityError:
+        # Another writer created the bucket first
+        bucket.update(count=F('count') + delta)
+
+
+def move_counter(old_key, new_key):
+    """Move one request from one counter bucket to another"""
+    if old_key == new_key:
+        return
+    with transaction.atomic():
+        adjust_counter(old_key, -1)
+        adjust_counter(new_key, 1)
+
+
+def status_counts():
+    """Return the number of requests in each status, read from the counter table"""
+    totals = RequestCounter.objects.values('status').annotate(total=Sum('count'))
+    return {row['status']: row['total'] for row in totals if row['total']}
+
+
+async def astatus_counts():
+    """Async version of ``status_counts`` for async views"""
+    totals = RequestCounter.objects.values('status').annotate(total=Sum('count'))
+    return {row['status']: row['total'] async for row in totals if row['total']}
+
+
+def reconcile_counters():
+    """Recompute every counter bucket from the request table and repair drift
+
+    Returns a list of (key, stored, actual) tuples for the buckets that were wrong.
+    """
+    with transaction.atomic():
+        actual = Counter({
+            (row['status'], row['priority'], row['service_type_id']): row['total']
+            for row in ServiceRequest.objects.values('status', 'priority', 'service_type_id')
+                                             .annotate(total=Count('id')).order_by()
+        })
+        stored = {
+            (counter.status, counter.priority, counter.service_type_id): counter
+            for counter in RequestCounter.objects.select_for_update()
+        }
+        
+        drift = []
+        for key in set(actual) | set(stored):
+            counter = stored.get(key)
+            stored_count = counter.count if counter else 0
+            if stored_count == actual[key]:
+                continue
+            drift.append((key, stored_count, actual[key]))
+            if counter:
+                counter.count = actual[key]
+                counter.save(update_fields=['count'])
+            else:
+                status, priority, service_type_id = key
+                RequestCounter.objects.create(
+                    status=status, priority=priority, service_type_id=service_type_id, count=actual[key]
+                )
+        return drift
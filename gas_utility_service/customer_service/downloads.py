@@ -0,0 +1,118 @@
+"""
+Serving attachment files.
+
+Responses carry an ETag and Last-Modified so browsers can revalidate
+cheaply, honour single byte-range requests, and can hand the actual byte
+transfer to the front-end proxy (nginx X-Accel-Redirect or Apache/lighttpd
+X-Sendfile) so large downloads don't tie up a Django worker. When Django
+serves the file itself, whole-file responses go through FileResponse so
+the WSGI server can use sendfile().
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of a file starting at ``start``"""
+
+    def __init__(self, fh, start, length):
+        self.fh = fh
+        self.remaining = length
+        fh.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fh.close()
+
+
+def parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, inclusive
+
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range) and raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, min(end, size - 1)
+
+
+def serve_file(request, field_file, filename, etag, as_attachment=False):
+    """Return a response serving ``field_file`` with caching and range support"""
+    path = field_file.path
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = quote_etag(etag)
+
+    # Answer conditional requests (If-None-Match / If-Modified-Since) without touching the file
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is not None:
+        response['ETag'] = etag
+        return response
+
+    mode = getattr(settings, 'ATTACHMENT_SERVE_MODE', 'django')
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The proxy handles ranges and conditional requests for the bytes it sends
+        response = HttpResponse()
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.ATTACHMENT_ACCEL_PREFIX.rstrip('/') + '/' + field_file.name)
+        else:
+            response['X-Sendfile'] = path
+        content_type, _ = mimetypes.guess_type(filename)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    else:
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == etag:
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        fh = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(fh, filename=filename)
+        else:
+            start, end = byte_range
+            response = FileResponse(RangeFile(fh, start, end - start + 1), filename=filename, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
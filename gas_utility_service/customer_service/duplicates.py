@@ -0,0 +1,243 @@
+"""
+Near-duplicate detection for service requests.
+
+During an outage many customers report the same leak in nearly the same
+words. Each new request is reduced to a set of tokens: the words of its
+description and each pair of consecutive words, and the street and town
+words of the customer's address. A MinHash signature of that set estimates
+how alike two requests are: two signatures agree in about the same
+fraction of positions as their token sets overlap.
+
+Signatures are split into ``BANDS`` bands of ``ROWS_PER_BAND`` values and
+each band is hashed, together with the service type, to a bucket stored in
+SignatureBand. Requests sharing a bucket are candidates, found with an
+index range scan per bucket and time window, so finding them doesn't
+depend on how many requests exist. Candidates created within
+``DUPLICATE_WINDOW_HOURS`` whose estimated similarity reaches
+``DUPLICATE_SIMILARITY`` are duplicates, and a request joins the
+IncidentCluster of the one most like it.
+
+New requests are signed from a signal handler through the task queue, and
+restored ones by ``restore_request``; ``backfill_duplicate_signatures``
+signs requests written in bulk. Requests signed at the same moment by
+different processes may miss each other.
+"""
+import hashlib
+import operator
+import random
+import re
+import struct
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .bulk import batched
+from .models import IncidentCluster, RequestSignature, ServiceRequest, SignatureBand
+
+BANDS = 20
+ROWS_PER_BAND = 3
+NUM_HASHES = BANDS * ROWS_PER_BAND
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Stored signatures can only be compared if every process uses the same hash functions
+_rng = random.Random(1018)
+HASH_PARAMS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(MERSENNE_PRIME)) for _ in range(NUM_HASHES)]
+SIGNATURE_FORMAT = f'<{NUM_HASHES}Q'
+
+STOPWORDS = frozenset(
+    'a an and are as at be been by can for from has have i in is it its me my near of on or our please the '
+    'there this to was we were with'.split()
+)
+ADDRESS_ABBREVIATIONS = {
+    'st': 'street', 'rd': 'road', 'ave': 'avenue', 'av': 'avenue', 'ln': 'lane', 'dr': 'drive', 'ct': 'court',
+    'blvd': 'boulevard', 'pl': 'place', 'hwy': 'highway', 'n': 'north', 's': 'south', 'e': 'east', 'w': 'west',
+}
+# Flat and unit markers; the numbers after them are dropped along with house numbers
+ADDRESS_NOISE = frozenset(['apt', 'apartment', 'unit', 'flat', 'suite', 'no'])
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def words(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def description_shingles(description):
+    """The description's words other than stop words, and each pair of consecutive ones"""
+    tokens = [word for word in words(description) if word not in STOPWORDS]
+    return {*tokens, *(f'{first} {second}' for first, second in zip(tokens, tokens[1:]))}
+
+
+def address_tokens(address):
+    """Street, town and postcode words of an address, with abbreviations spelled out
+
+    House and flat numbers are dropped so that neighbours on the same street
+    match; longer numbers such as zip codes are kept.
+    """
+    tokens = set()
+    for word in words(address):
+        if (word.isdigit() and len(word) < 5) or word in ADDRESS_NOISE:
+            continue
+        tokens.add('addr:' + ADDRESS_ABBREVIATIONS.get(word, word))
+    return tokens
+
+
+def request_tokens(description, address):
+    return description_shingles(description) | address_tokens(address)
+
+
+def token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+
+
+def minhash(tokens):
+    """The signature of a token set: its minimum under each of the hash functions"""
+    # An empty description and address still need a signature
+    hashes = [token_hash(token) for token in tokens] or [0]
+    return tuple(min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in HASH_PARAMS)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the token sets behind two signatures"""
+    return sum(map(operator.eq, first, second)) / NUM_HASHES
+
+
+def band_buckets(signature, service_type_id):
+    """The bucket of each band
+
+    The band number and service type are hashed in, so bands never share
+    buckets and only requests of the same service type are candidates.
+    """
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        packed = struct.pack(f'<Hq{ROWS_PER_BAND}Q', band, service_type_id, *rows)
+        digest = hashlib.blake2b(packed, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def pack(signature):
+    return struct.pack(SIGNATURE_FORMAT, *signature)
+
+
+def unpack(data):
+    return struct.unpack(SIGNATURE_FORMAT, bytes(data))
+
+
+def index_requests(request_ids, batch_size=None):
+    """Sign the given requests and file each one with the requests it duplicates
+
+    Requests that already have a signature are skipped. Returns how many
+    requests were signed.
+    """
+    signed = 0
+    for batch in batched(list(request_ids), batch_size or settings.DUPLICATE_BATCH_SIZE):
+        signed += index_batch(batch)
+    return signed
+
+
+def index_batch(request_ids):
+    """Sign one batch of requests in a single transaction
+
+    Each request joins the cluster of the most similar request it
+    duplicates, or starts a new cluster with it. A cluster stops taking
+    new requests ``DUPLICATE_WINDOW_HOURS`` after its first one, so a
+    steady trickle of similar requests doesn't chain into one huge cluster.
+    """
+    window = timedelta(hours=settings.DUPLICATE_WINDOW_HOURS)
+    threshold = settings.DUPLICATE_SIMILARITY
+    with transaction.atomic():
+        rows = (ServiceRequest.objects.filter(pk__in=request_ids, signature__isnull=True)
+                .order_by('created_at', 'pk')
+                .values_list('pk', 'description', 'service_type_id', 'created_at', 'customer__profile__address'))
+        new = {}
+        for pk, description, service_type_id, created_at, address in rows:
+            signature = minhash(request_tokens(description, address))
+            new[pk] = (signature, created_at, band_buckets(signature, service_type_id))
+        if not new:
+            return 0
+
+        # Signed requests sharing a bucket with one of these, within the time window
+        members = defaultdict(set)
+        created = [created_at for _, created_at, _ in new.values()]
+        buckets = {bucket for _, _, request_buckets in new.values() for bucket in request_buckets}
+        for chunk in batched(list(buckets), 500):
+            for bucket, request_id in SignatureBand.objects.filter(
+                bucket__in=chunk,
+                created_at__gte=min(created) - window,
+                created_at__lte=max(created) + window,
+            ).values_list('bucket', 'signature_id'):
+                members[bucket].add(request_id)
+        signatures = {}
+        clusters = {}
+        cluster_of = {}
+        for chunk in batched(list(set().union(*members.values())), 500):
+            for request_id, data, created_at, cluster_id, started_at in RequestSignature.objects.filter(
+                pk__in=chunk
+            ).values_list('pk', 'minhash', 'created_at', 'cluster_id', 'cluster__started_at'):
+                signatures[request_id] = (unpack(data), created_at)
+                if cluster_id is not None:
+                    if cluster_id not in clusters:
+                        clusters[cluster_id] = IncidentCluster(pk=cluster_id, started_at=started_at)
+                    cluster_of[request_id] = clusters[cluster_id]
+
+        new_clusters = []
+        regrouped = []
+        for pk, (signature, created_at, request_buckets) in new.items():
+            candidates = set()
+            for bucket in request_buckets:
+                candidates |= members[bucket]
+                members[bucket].add(pk)
+            signatures[pk] = (signature, created_at)
+
+            best = None
+            for other in candidates:
+                other_signature, other_created_at = signatures[other]
+                if abs(created_at - other_created_at) > window:
+                    continue
+                cluster = cluster_of.get(other)
+                if cluster is not None and abs(created_at - cluster.started_at) > window:
+                    continue
+                score = similarity(signature, other_signature)
+                if score >= threshold and (best is None or (score, other_created_at) > best[:2]):
+                    best = (score, other_created_at, other)
+            if best is None:
+                continue
+
+            other = best[2]
+            cluster = cluster_of.get(other)
+            if cluster is None:
+                cluster = IncidentCluster(started_at=min(created_at, best[1]))
+                new_clusters.append(cluster)
+                cluster_of[other] = cluster
+                if other not in new:
+                    regrouped.append(other)
+            cluster_of[pk] = cluster
+
+        IncidentCluster.objects.bulk_create(new_clusters)
+        RequestSignature.objects.bulk_update(
+            [RequestSignature(pk=request_id, cluster_id=cluster_of[request_id].pk) for request_id in regrouped],
+            ['cluster'], batch_size=500,
+        )
+        RequestSignature.objects.bulk_create([
+            RequestSignature(request_id=pk, minhash=pack(signature), created_at=created_at,
+                             cluster_id=cluster_of[pk].pk if pk in cluster_of else None)
+            for pk, (signature, created_at, _) in new.items()
+        ], batch_size=500)
+        SignatureBand.objects.bulk_create([
+            SignatureBand(bucket=bucket, created_at=created_at, signature_id=pk)
+            for pk, (_, created_at, request_buckets) in new.items() for bucket in request_buckets
+        ], batch_size=1000)
+    return len(new)
+
+
+def duplicates_of(service_request):
+    """The other requests in ``service_request``'s incident cluster, oldest first"""
+    cluster_id = RequestSignature.objects.filter(pk=service_request.pk).values_list('cluster_id', flat=True).first()
+    if cluster_id is None:
+        return ServiceRequest.objects.none()
+    return (ServiceRequest.objects.filter(signature__cluster_id=cluster_id)
+            .exclude(pk=service_request.pk).order_by('created_at'))
@@ -0,0 +1,90 @@
+"""
+Streaming export of service requests with their status history.
+
+Rows are produced lazily from a server-side chunked iterator, so memory use
+stays flat however many requests are exported.
+"""
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from .models import RequestStatusUpdate
+
+EXPORT_FIELDS = [
+    'request_number', 'customer', 'customer_email', 'account_number', 'service_type', 'status',
+    'priority', 'assigned_to', 'description', 'created_at', 'updated_at', 'status_history',
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_queryset(queryset):
+    """Prepare a ServiceRequest queryset for export with all related rows fetched per chunk"""
+    history = RequestStatusUpdate.objects.select_related('updated_by').order_by('created_at', 'id')
+    return (queryset
+            .select_related('customer', 'customer__profile', 'service_type', 'assigned_to')
+            .prefetch_related(Prefetch('status_updates', queryset=history))
+            .order_by('created_at', 'id'))
+
+
+def export_records(queryset, chunk_size=2000):
+    """Yield one dict per request, including its status history"""
+    for service_request in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        customer = service_request.customer
+        profile = getattr(customer, 'profile', None)
+        yield {
+            'request_number': service_request.request_number,
+            'customer': customer.username,
+            'customer_email': customer.email,
+            'account_number': profile.account_number if profile else '',
+            'service_type': service_request.service_type.name,
+            'status': service_request.status,
+            'priority': service_request.priority,
+            'assigned_to': service_request.assigned_to.username if service_request.assigned_to else '',
+            'description': service_request.description,
+            'created_at': service_request.created_at.isoformat(),
+            'updated_at': service_request.updated_at.isoformat(),
+            'status_history': [
+                {
+                    'previous_status': update.previous_status,
+                    'new_status': update.new_status,
+                    'updated_by': update.updated_by.username if update.updated_by else '',
+                    'notes': update.notes,
+                    'created_at': update.created_at.isoformat(),
+                }
+                for update in service_request.status_updates.all()
+            ],
+        }
+
+
+class Echo:
+    """File-like object whose write() just returns the value, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def stream_csv(records):
+    """Yield CSV lines, with the status history as a JSON column"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for record in records:
+        record['status_history'] = json.dumps(record['status_history'])
+        yield writer.writerow([record[field] for field in EXPORT_FIELDS])
+
+
+def stream_ndjson(records):
+    """Yield one JSON document per line"""
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def stream_export(queryset, export_format='csv', chunk_size=2000):
+    """Return a generator of text chunks in the requested format"""
+    records = export_records(queryset, chunk_size=chunk_size)
+    if export_format == 'ndjson':
+        return stream_ndjson(records)
+    return stream_csv(records)
@@ -0,0 +1,194 @@
+"""
+Live feed of dashboard changes.
+
+New requests and status changes are appended to the RequestChange log by
+signal handlers. Clients keep the position of the last change they saw and
+ask for anything after it, either over a Server-Sent Events stream or by
+long polling, so each check is one index range query no matter how many
+requests exist or how many staff are watching.
+
+Ids are handed out when a change is written, not when it commits, so on
+databases with concurrent writers a lower id can commit after a higher one,
+however long its transaction stays open. A client that had already moved
+past it would never see it. Changes are therefore only served once
+``publish_changes`` has given them a position, which it does after they
+commit, one publisher at a time, so a change that commits late is placed
+after everything clients have already seen. Writers publish from
+``transaction.on_commit``; a change whose writer died before publishing
+goes out with the next change anyone publishes.
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.urls import reverse
+from django.utils import dateformat
+from django.utils.timezone import localtime
+
+from .models import RequestChange, RequestChangeSequence
+
+RELATED = (
+    'service_request__customer__profile',
+    'service_request__service_type',
+    'service_request__assigned_to',
+)
+
+
+def parse_cursor(value):
+    """Turn a client-supplied cursor into a feed position, or None if it's missing or invalid"""
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+def publish_changes(batch_size=1000):
+    """Give committed changes that have no position yet the next positions, in id order
+
+    Returns how many were published. Call it outside the transaction that
+    wrote the changes, normally through ``transaction.on_commit``.
+    """
+    published = 0
+    while True:
+        with transaction.atomic():
+            sequence = RequestChangeSequence.objects.filter(pk=1)
+            # Writing the row before reading anything makes publishers take
+            # turns on every database, and each one then sees what the one
+            # before it committed
+            if not sequence.update(last_position=F('last_position')):
+                try:
+                    with transaction.atomic():
+                        highest = RequestChange.objects.aggregate(highest=Max('position'))['highest']
+                        RequestChangeSequence.objects.create(pk=1, last_position=highest or 0)
+                except IntegrityError:
+                    # Another publisher created the row first
+                    sequence.update(last_position=F('last_position'))
+            last_position = sequence.values_list('last_position', flat=True).get()
+            pending = list(RequestChange.objects.filter(position__isnull=True).order_by('id')[:batch_size])
+            for offset, change in enumerate(pending, 1):
+                change.position = last_position + offset
+            RequestChange.objects.bulk_update(pending, ['position'], batch_size=500)
+            sequence.update(last_position=last_position + len(pending))
+        published += len(pending)
+        if len(pending) < batch_size:
+            return published
+
+
+def publish_on_commit():
+    """Publish the changes the current transaction wrote once it commits"""
+    transaction.on_commit(publish_changes)
+
+
+def latest_position():
+    return RequestChange.objects.aggregate(latest=Max('position'))['latest'] or 0
+
+
+async def alatest_position():
+    return (await RequestChange.objects.aaggregate(latest=Max('position')))['latest'] or 0
+
+
+def _changes_query(cursor):
+    return (RequestChange.objects.filter(position__gt=cursor).select_related(*RELATED)
+            .order_by('position')[:settings.LIVE_FEED_BATCH_SIZE])
+
+
+def changes_after(cursor):
+    """Serialized changes after ``cursor``, oldest first"""
+    return [serialize_change(change) for change in _changes_query(cursor)]
+
+
+async def achanges_after(cursor):
+    return [serialize_change(change) async for change in _changes_query(cursor)]
+
+
+def serialize_change(change):
+    """The change plus the current state of its request, as the dashboard table shows it"""
+    service_request = change.service_request
+    customer = service_request.customer
+    profile = getattr(customer, 'profile', None)
+    assigned_to = service_request.assigned_to
+    return {
+        'id': change.position,
+        'kind': change.kind,
+        'previous_status': change.previous_status,
+        'new_status': change.new_status,
+        'request': {
+            'request_number': service_request.request_number,
+            'customer': customer.get_full_name(),
+            'account_number': profile.account_number if profile else '',
+            'service_type': service_request.service_type.name,
+            'status': service_request.status,
+            'status_display': service_request.get_status_display(),
+            'priority': service_request.priority,
+            'priority_display': service_request.get_priority_display(),
+            'created_at': dateformat.format(localtime(service_request.created_at), 'M d, Y'),
+            'assigned_to': assigned_to.get_full_name() if assigned_to else '',
+            'url': reverse('support_request_detail', args=[service_request.request_number]),
+        },
+    }
+
+
+def format_event(change):
+    """Encode a serialized change as a Server-Sent Event"""
+    return f"id: {change['id']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+
+
+def _stream_chunks(cursor, batch, idle):
+    """Shared bookkeeping for both streams: yields (chunks, new cursor, new idle time)"""
+    if batch:
+        return ''.join(format_event(change) for change in batch), batch[-1]['id'], 0.0
+    if idle >= settings.LIVE_FEED_KEEPALIVE_SECONDS:
+        # A comment line keeps proxies from closing an idle connection
+        return ': keepalive\n\n', cursor, 0.0
+    return '', cursor, idle
+
+
+def event_stream(cursor):
+    """Yield SSE chunks for changes after ``cursor`` until the stream's lifetime runs out
+
+    The stream ends after ``LIVE_FEED_STREAM_SECONDS`` and the browser
+    reconnects with Last-Event-ID, which keeps a worker from being held
+    indefinitely under WSGI.
+    """
+    interval = settings.LIVE_FEED_POLL_INTERVAL
+    deadline = time.monotonic() + settings.LIVE_FEED_STREAM_SECONDS
+    idle = 0.0
+    yield f'retry: {settings.LIVE_FEED_RETRY_MS}\n\n'
+    while True:
+        chunk, cursor, idle = _stream_chunks(cursor, changes_after(cursor), idle)
+        if chunk:
+            yield chunk
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(interval)
+        idle += interval
+
+
+async def aevent_stream(cursor):
+    """Async version of ``event_stream``, which doesn't tie up a thread while waiting under ASGI"""
+    interval = settings.LIVE_FEED_POLL_INTERVAL
+    deadline = time.monotonic() + settings.LIVE_FEED_STREAM_SECONDS
+    idle = 0.0
+    yield f'retry: {settings.LIVE_FEED_RETRY_MS}\n\n'
+    while True:
+        chunk, cursor, idle = _stream_chunks(cursor, await achanges_after(cursor), idle)
+        if chunk:
+            yield chunk
+        if time.monotonic() >= deadline:
+            return
+        await asyncio.sleep(interval)
+        idle += interval
+
+
+async def await_changes(cursor, timeout):
+    """Wait up to ``timeout`` seconds for changes after ``cursor`` and return them"""
+    deadline = time.monotonic() + timeout
+    while True:
+        changes = await achanges_after(cursor)
+        if changes or time.monotonic() >= deadline:
+            return changes
+        await asyncio.sleep(settings.LIVE_FEED_POLL_INTERVAL)
@@ -0,0 +1,57 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .search import get_search_backend
+
+
+def day_bounds(value, end=False):
+    """Turn a YYYY-MM-DD string into an aware datetime at the start of that day
+
+    With ``end=True`` the start of the following day is returned instead, so
+    the pair can be used as a half-open range. Invalid dates return None.
+    """
+    try:
+        day = parse_date(value) if value else None
+    except ValueError:
+        day = None
+    if day is None:
+        return None
+    if end:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_requests(queryset, search='', status='', date_from='', date_to='', search_limit=None):
+    """Apply the support dashboard filters to a ServiceRequest queryset
+
+    ``date_from`` and ``date_to`` are inclusive YYYY-MM-DD dates matched
+    against when the request was created. The search runs last, so a
+    ``search_limit`` keeps the best matches among the requests that pass the
+    other filters.
+    """
+    queryset = filter_fields(queryset, status, date_from, date_to)
+    if search:
+        queryset = get_search_backend().filter_queryset(queryset, search, limit=search_limit)
+    return queryset
+
+
+def filter_fields(queryset, status='', date_from='', date_to=''):
+    """The status and date range filters of ``filter_requests``"""
+    if status and status != 'all':
+        queryset = queryset.filter(status=status)
+    start = day_bounds(date_from)
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    end = day_bounds(date_to, end=True)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    return queryset
+
+
+def search_truncated(queryset, search='', status='', date_from='', date_to='', search_limit=None):
+    """Whether ``filter_requests`` with the same arguments dropped matches because of ``search_limit``"""
+    if not (search and search_limit):
+        return False
+    return get_search_backend().exceeds(search, search_limit, within=filter_fields(queryset, status, date_from, date_to))
@@ -1,11 +1,73 @@
 from django import forms
+from django.conf import settings
+from django.contrib.auth.models import User
 from .models import ServiceRequest, RequestAttachment, RequestStatusUpdate
+from .registry import service_types
+
+class MultipleFileInput(forms.ClearableFileInput):
+    """File input that lets the customer pick several files at once"""
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """File field whose cleaned value is a list of uploaded files"""
+    widget = MultipleFileInput
+
+    def clean(self, data, initial=None):
+        if not isinstance(data, (list, tuple)):
+            data = [data] if data else []
+        if len(data) > settings.ATTACHMENT_MAX_FILES:
+            raise forms.ValidationError(f'You can attach at most {settings.ATTACHMENT_MAX_FILES} files.')
+        return [super(MultipleFileField, self).clean(item, initial) for item in data]
+
+
+class ServiceTypeChoiceField(forms.ChoiceField):
+    """Choice of active service type, read from the in-process registry rather than the database"""
+
+    def __init__(self, **kwargs):
+        super().__init__(choices=self.active_choices, **kwargs)
+
+    @staticmethod
+    def active_choices():
+        return [('', '-- Select Service Type --')] + [
+            (service_type.pk, service_type.name) for service_type in service_types.active()
+        ]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            service_type = service_types.get(int(value))
+        except (TypeError, ValueError):
+            service_type = None
+        if service_type is None or not service_type.is_active:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                        params={'value': value})
+        return service_type
+
+    def validate(self, value):
+        # to_python already checked the choice against the registry
+        if value is None and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+
+
+class StaffChoiceField(forms.ModelChoiceField):
+    """Choice of active staff member, labelled with how many open requests they have"""
+
+    def __init__(self, queryset=None, **kwargs):
+        # The workload comes from the same query, so labelling costs nothing extra
+        queryset = User.objects.filter(is_staff=True, is_active=True).select_related('workload')
+        super().__init__(queryset=queryset, **kwargs)
+
+    def label_from_instance(self, user):
+        workload = getattr(user, 'workload', None)
+        return f'{user.get_full_name() or user.username} ({workload.open_count if workload else 0} open)'
+
 
 class ServiceRequestForm(forms.ModelForm):
     """Form for creating new service requests"""
-    # Django's standard forms don't support multiple file uploads in widgets
-    # We'll handle multiple uploads manually in the view using request.FILES
-    attachments = forms.FileField(required=False)
+    service_type = ServiceTypeChoiceField()
+    attachments = MultipleFileField(required=False)
     
     class Meta:
         model = ServiceRequest
@@ -20,8 +82,19 @@ class ServiceRequestForm(forms.ModelForm):
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-control'})
 
+def status_choices(current, include_current=False):
+    """The status choices a request in ``current`` can move to, from the declared state machine"""
+    allowed = set(ServiceRequest.STATUS_TRANSITIONS.get(current, ()))
+    if include_current:
+        allowed.add(current)
+    return [(value, label) for value, label in ServiceRequest.STATUS_CHOICES if value in allowed]
+
+
 class RequestStatusUpdateForm(forms.ModelForm):
     """Form for updating request status (for support staff)"""
+    # The version of the request the form was rendered from
+    version = forms.IntegerField(min_value=0, widget=forms.HiddenInput)
+    
     class Meta:
         model = RequestStatusUpdate
         fields = ['new_status', 'notes']
@@ -32,21 +105,69 @@ class RequestStatusUpdateForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.service_request = kwargs.pop('service_request', None)
         super().__init__(*args, **kwargs)
+        if self.service_request is not None:
+            # Only offer the moves the state machine allows from the current status
+            self.fields['new_status'].choices = status_choices(self.service_request.status)
+            self.fields['version'].initial = self.service_request.version
         # Add Bootstrap classes to form fields
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-control'})
 
 class SupportRequestUpdateForm(forms.ModelForm):
     """Form for support staff to update service requests"""
+    # The version of the request the form was rendered from
+    version = forms.IntegerField(min_value=0, widget=forms.HiddenInput)
+    
     class Meta:
         model = ServiceRequest
         fields = ['status', 'priority', 'assigned_to', 'support_notes']
+        # Only active staff can be assigned, matching the admin
+        field_classes = {
+            'assigned_to': StaffChoiceField,
+        }
         widgets = {
             'support_notes': forms.Textarea(attrs={'rows': 3}),
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Keep the current status or make a move the state machine allows
+        self.fields['status'].choices = status_choices(self.instance.status, include_current=True)
+        self.fields['version'].initial = self.instance.version
         # Add Bootstrap classes to form fields
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-control'})
+
+class BulkStatusForm(forms.Form):
+    """Form for support staff to move many requests to one status"""
+    SCOPE_CHOICES = [
+        ('selected', 'Selected requests'),
+        ('filtered', 'All requests matching the filters'),
+    ]
+    
+    scope = forms.ChoiceField(choices=SCOPE_CHOICES)
+    new_status = forms.ChoiceField(choices=ServiceRequest.STATUS_CHOICES, label="Move to")
+    notes = forms.CharField(max_length=500, required=False)
+    request_numbers = forms.MultipleChoiceField(required=False)
+    # The dashboard filters the bulk change applies to
+    search = forms.CharField(required=False)
+    status = forms.CharField(required=False)
+    date_from = forms.CharField(required=False)
+    date_to = forms.CharField(required=False)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Any request number may be ticked; the queryset decides which exist
+        self.fields['request_numbers'].valid_value = lambda value: True
+    
+    def filters(self):
+        return {name: self.cleaned_data[name] for name in ('search', 'status', 'date_from', 'date_to')
+                if self.cleaned_data[name] not in ('', 'all')}
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('scope') == 'selected' and not cleaned_data.get('request_numbers'):
+            raise forms.ValidationError('Tick the requests to change first.')
+        if cleaned_data.get('scope') == 'filtered' and not self.filters():
+            raise forms.ValidationError('Filter the dashboard first; a bulk change cannot apply to every request.')
+        return cleaned_data
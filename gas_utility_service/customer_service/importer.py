@@ -0,0 +1,230 @@
+"""
+Bulk import of customers and tickets from the legacy CRM.
+
+Input files are read as a stream (CSV or JSON lines) and written in chunks,
+one transaction per chunk, with ``bulk_create``. Foreign keys are resolved
+through in-memory maps instead of per-row lookups, original timestamps are
+kept, and progress is checkpointed after every committed chunk so an
+interrupted import can resume where it stopped.
+
+Ticket files use the same columns as ``export_requests``; customer files
+have ``username``, ``email``, ``first_name``, ``last_name``,
+``account_number``, ``address``, ``phone_number`` and ``date_joined``.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import CustomerProfile
+
+from .analytics import replay_history
+from .bulk import batched, preserve_timestamps
+from .assignment import adjust_workload
+from .counters import adjust_counter
+from .models import ServiceRequest, ServiceType, RequestStatusUpdate
+from .search import get_search_backend
+
+
+def read_records(path):
+    """Yield one dict per record from a CSV or JSON-lines file"""
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path) as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline='') as fh:
+            for row in csv.DictReader(fh):
+                if isinstance(row.get('status_history'), str):
+                    row['status_history'] = json.loads(row['status_history'] or '[]')
+                yield row
+
+
+def parse_timestamp(value, default=None):
+    """Parse an ISO timestamp, treating naive values as being in the current timezone"""
+    parsed = parse_datetime(value) if value else None
+    if parsed is None:
+        return default
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Checkpoint:
+    """Number of input records already committed, stored next to the input file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)['records']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def save(self, records):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'records': records}, fh)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.created = 0
+        self.skipped = 0
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+
+class LegacyImporter:
+    """Import customers or tickets from a legacy CRM export"""
+
+    def __init__(self, chunk_size=5000, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress or (lambda stats: None)
+        self.usernames = None
+        self.service_types = None
+
+    def load_lookups(self):
+        """Build the username and service type maps used to resolve foreign keys"""
+        self.usernames = dict(User.objects.values_list('username', 'id'))
+        self.service_types = dict(ServiceType.objects.values_list('name', 'id'))
+
+    def run(self, path, kind, checkpoint=None, resume=True):
+        """Import ``path`` as ``kind`` ('customers' or 'tickets') and return ImportStats"""
+        import_chunk = self.import_customers if kind == 'customers' else self.import_tickets
+        checkpoint = checkpoint or Checkpoint(f'{path}.checkpoint')
+        done = checkpoint.load() if resume else 0
+
+        self.load_lookups()
+        stats = ImportStats()
+        records = read_records(path)
+        # Skip everything committed by a previous run
+        for _ in range(done):
+            next(records, None)
+
+        for chunk in batched(records, self.chunk_size):
+            with transaction.atomic():
+                created = import_chunk(chunk)
+            done += len(chunk)
+            checkpoint.save(done)
+            stats.read += len(chunk)
+            stats.created += created
+            stats.skipped += len(chunk) - created
+            self.progress(stats)
+
+        checkpoint.clear()
+        return stats
+
+    def import_customers(self, records):
+        """Create users and customer profiles for unseen usernames, returning how many were created"""
+        password = make_password(None)
+        new = [record for record in records if record['username'] not in self.usernames]
+        users = [
+            User(
+                username=record['username'],
+                email=record.get('email', ''),
+                first_name=record.get('first_name', ''),
+                last_name=record.get('last_name', ''),
+                password=password,
+                date_joined=parse_timestamp(record.get('date_joined'), timezone.now()),
+            )
+            for record in new
+        ]
+        users = User.objects.bulk_create(users)
+        with preserve_timestamps(CustomerProfile):
+            CustomerProfile.objects.bulk_create([
+                CustomerProfile(
+                    user=user,
+                    account_number=record['account_number'],
+                    address=record.get('address', ''),
+                    phone_number=record.get('phone_number', ''),
+                    created_at=user.date_joined,
+                    updated_at=user.date_joined,
+                )
+                for user, record in zip(users, new)
+            ])
+        for user in users:
+            self.usernames[user.username] = user.pk
+        return len(users)
+
+    def service_type_id(self, name):
+        """Resolve a service type by name, creating an inactive one for retired legacy types"""
+        if name not in self.service_types:
+            service_type = ServiceType.objects.create(
+                name=name, description='Imported from the legacy CRM', is_active=False
+            )
+            self.service_types[name] = service_type.pk
+        return self.service_types[name]
+
+    def import_tickets(self, records):
+        """Create service requests and their status history, returning how many requests were created"""
+        numbers = [record.get('request_number') for record in records if record.get('request_number')]
+        existing = set(ServiceRequest.objects.filter(request_number__in=numbers)
+                       .values_list('request_number', flat=True))
+
+        requests, histories = [], []
+        for record in records:
+            number = record.get('request_number') or ServiceRequest.generate_request_number()
+            customer_id = self.usernames.get(record['customer'])
+            if number in existing or customer_id is None:
+                continue
+            existing.add(number)
+            created_at = parse_timestamp(record.get('created_at'), timezone.now())
+            requests.append(ServiceRequest(
+                request_number=number,
+                customer_id=customer_id,
+                service_type_id=self.service_type_id(record['service_type']),
+                description=record.get('description', ''),
+                status=record.get('status') or 'pending',
+                priority=record.get('priority') or 'medium',
+                assigned_to_id=self.usernames.get(record.get('assigned_to') or None),
+                support_notes=record.get('support_notes', ''),
+                created_at=created_at,
+                updated_at=parse_timestamp(record.get('updated_at'), created_at),
+            ))
+            histories.append(record.get('status_history') or [])
+
+        with preserve_timestamps(ServiceRequest, RequestStatusUpdate):
+            requests = ServiceRequest.objects.bulk_create(requests)
+            RequestStatusUpdate.objects.bulk_create([
+                RequestStatusUpdate(
+                    service_request=service_request,
+                    previous_status=update.get('previous_status', ''),
+                    new_status=update['new_status'],
+                    updated_by_id=self.usernames.get(update.get('updated_by') or None),
+                    notes=update.get('notes', ''),
+                    created_at=parse_timestamp(update.get('created_at'), service_request.created_at),
+                )
+                for service_request, history in zip(requests, histories)
+                for update in history
+            ])
+
+        # bulk_create skips signals, so update the counters, workloads, search
+        # index and SLA analytics here
+        for key, count in Counter(r.counter_key for r in requests).items():
+            adjust_counter(key, count)
+        for key, count in Counter(r.workload_key for r in requests if r.workload_key).items():
+            adjust_workload(key, count)
+        get_search_backend().index_requests(r.pk for r in requests)
+        replay_history([r.pk for r in requests])
+        return len(requests)
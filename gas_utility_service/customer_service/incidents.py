@@ -0,0 +1,90 @@
+"""
+Bulk status changes for incidents.
+
+When one fault affects hundreds of customers, staff move all of their
+requests at once. ``bulk_transition`` does it with one UPDATE of the
+requests and one bulk_create of their status history, in one transaction.
+Neither fires model signals, so the work the signal handlers normally do
+per request is done here per batch instead: the counters, staff workloads,
+live feed and SLA analytics are updated in aggregate, cached pages are
+expired, and the customer emails are queued as one task. The search index
+covers none of the fields a status change touches, so it is left alone.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_status_updates
+from .assignment import adjust_workload
+from .caching import bump_versions
+from .counters import adjust_counter
+from .feed import publish_on_commit
+from .models import ServiceRequest, RequestStatusUpdate, RequestChange
+from .taskqueue import enqueue
+
+
+def eligible_requests(queryset, new_status):
+    """The requests in ``queryset`` that the state machine allows to move to ``new_status``"""
+    sources = [status for status, targets in ServiceRequest.STATUS_TRANSITIONS.items() if new_status in targets]
+    return queryset.filter(status__in=sources)
+
+
+def bulk_transition(queryset, user, new_status, notes='', dry_run=False):
+    """Move every request in ``queryset`` that can make the move to ``new_status``
+
+    Requests already in ``new_status``, or in a status it can't be reached
+    from, are left alone. Returns how many requests were moved, or with
+    ``dry_run`` how many would be.
+    """
+    eligible = eligible_requests(queryset, new_status)
+    if dry_run:
+        return eligible.count()
+
+    now = timezone.now()
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            eligible = eligible.select_for_update(of=('self',))
+        rows = list(eligible.order_by().values_list(
+            'pk', 'status', 'priority', 'service_type_id', 'assigned_to_id', 'customer_id', 'request_number'
+        ))
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+
+        ServiceRequest.objects.filter(pk__in=ids).update(
+            status=new_status, version=F('version') + 1, updated_at=now
+        )
+        updates = RequestStatusUpdate.objects.bulk_create([
+            RequestStatusUpdate(service_request_id=pk, previous_status=status, new_status=new_status,
+                                updated_by=user, notes=notes)
+            for pk, status, *_ in rows
+        ])
+
+        # The update and bulk_create skip signals, so apply their effects here
+        counters = Counter()
+        workloads = Counter()
+        for pk, status, priority, service_type_id, assigned_to_id, *_ in rows:
+            counters[(status, priority, service_type_id)] -= 1
+            counters[(new_status, priority, service_type_id)] += 1
+            workloads[ServiceRequest.make_workload_key(status, priority, assigned_to_id)] -= 1
+            workloads[ServiceRequest.make_workload_key(new_status, priority, assigned_to_id)] += 1
+        for key, delta in counters.items():
+            if delta:
+                adjust_counter(key, delta)
+        for key, delta in workloads.items():
+            if key is not None and delta:
+                adjust_workload(key, delta)
+
+        RequestChange.objects.bulk_create([
+            RequestChange(kind='status', service_request_id=pk, previous_status=status, new_status=new_status)
+            for pk, status, *_ in rows
+        ])
+        publish_on_commit()
+        bump_versions(*{('customer', row[5]) for row in rows}, *(('request', row[6]) for row in rows))
+        # Like the signal handler for single updates, the analytics commit with the change
+        record_status_updates(updates)
+
+        enqueue('notifications.statuses_changed', status_update_ids=[update.pk for update in updates])
+    return len(rows)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from customer_service.archive import archivable_requests, archive_requests
+
+
+class Command(BaseCommand):
+    help = 'Move requests that have been closed for a while, with their history, into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive requests completed or cancelled more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE,
+                            help='Requests moved per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after archiving this many requests')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many requests are due')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            due = archivable_requests(options['days']).count()
+            self.stdout.write(f'{due} request(s) would be archived')
+            return
+        moved = archive_requests(options['days'], options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} request(s)'))
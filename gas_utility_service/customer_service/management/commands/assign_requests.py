@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.assignment import assign_requests
+
+
+class Command(BaseCommand):
+    help = 'Assign unassigned pending requests to the least loaded staff members who handle their service type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Assign at most this many requests')
+        parser.add_argument('--batch-size', type=int, help='Requests assigned per transaction')
+
+    def handle(self, *args, **options):
+        assigned = assign_requests(limit=options['limit'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Assigned {assigned} request(s)'))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from customer_service.duplicates import index_batch
+from customer_service.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = ('Sign requests written in bulk (imports, generate_data) or before duplicate detection existed, '
+            'oldest first, and group likely duplicates into incident clusters')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.DUPLICATE_BATCH_SIZE,
+                            help='Requests signed per transaction')
+
+    def handle(self, *args, **options):
+        # Only unsigned requests need signing; oldest first so clusters grow in the order reports came in
+        unsigned = (ServiceRequest.objects.filter(signature__isnull=True)
+                    .order_by('created_at', 'pk').values_list('pk', 'created_at'))
+        signed = 0
+        batch = list(unsigned[:options['batch_size']])
+        while batch:
+            signed += index_batch([pk for pk, _ in batch])
+            # Carry on after the last request along the (created_at, id) index, so only one batch of ids
+            # is in memory at a time; an interrupted run simply starts over with what is still unsigned
+            last_pk, last_created_at = batch[-1]
+            batch = list(unsigned.filter(
+                Q(created_at__gt=last_created_at) | Q(created_at=last_created_at, pk__gt=last_pk)
+            )[:options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f'Signed {signed} requests'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.analytics import replay_history
+from customer_service.models import RequestTiming, ServiceRequest
+
+
+class Command(BaseCommand):
+    help = ('Build SLA timing facts and rollups for requests whose status history was written in bulk '
+            '(generate_data, imports from before import_legacy built them) or before the analytics existed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Requests replayed per batch')
+
+    def handle(self, *args, **options):
+        # Only requests without timing facts need replaying
+        timed = RequestTiming.objects.values('request_id')
+        ids = ServiceRequest.objects.exclude(pk__in=timed).order_by('pk').values_list('pk', flat=True)
+        replayed = replay_history(list(ids), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Replayed the history of {replayed} requests'))
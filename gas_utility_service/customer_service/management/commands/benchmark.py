@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_service.benchmark import (
+    benchmark_targets, build_report, compare_reports, load_report, run_in_process, run_over_http,
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, throughput and query counts for every customer and staff page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per URL')
+        parser.add_argument('--base-url', help='Benchmark a running server (e.g. http://127.0.0.1:5000) '
+                                               'instead of the in-process test client')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+        parser.add_argument('--compare', help='Compare p95 latency against a previous results file')
+
+    def handle(self, *args, **options):
+        try:
+            _, _, targets = benchmark_targets()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        iterations = options['iterations']
+        if options['base_url']:
+            results = run_over_http(targets, iterations, options['base_url'])
+            mode = 'http'
+        else:
+            results = run_in_process(targets, iterations)
+            mode = 'client'
+        report = build_report(results, mode, iterations)
+
+        self.stdout.write(f"{'URL':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'queries':>9}{'bytes':>9}")
+        for row in results:
+            queries = row['queries'] if row['queries'] is not None else '-'
+            size = row.get('bytes') or '-'
+            self.stdout.write(
+                f"{row['name']:<28}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+                f"{row['throughput_rps']:>9}{queries:>9}{size:>9}"
+            )
+            if row['errors']:
+                self.stdout.write(self.style.ERROR(f"  {row['errors']} error responses"))
+
+        if options['compare']:
+            self.stdout.write(f"\nChange in p95 vs {options['compare']}:")
+            for name, before, after, change in compare_reports(load_report(options['compare']), report):
+                style = self.style.ERROR if change > 10 else self.style.SUCCESS
+                self.stdout.write(style(f'{name:<28}{before:>9}{after:>9}{change:>+8}%'))
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings
+
+from customer_service.benchmark import run_concurrent_writes
+from customer_service.models import ServiceType
+
+
+@contextmanager
+def throwaway_database():
+    """Point the connections at freshly migrated databases, and drop them afterwards
+
+    The benchmark creates a service type, a customer and hundreds of
+    requests, none of which belong in the configured databases.
+    """
+    created = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for alias in (DEFAULT_DB_ALIAS, settings.SEQUENCE_DATABASE):
+                if alias not in settings.DATABASES:
+                    continue
+                alias_connection = connections[alias]
+                if alias_connection.vendor == 'sqlite':
+                    # A file rather than an in-memory database, so the profile's journal settings apply
+                    alias_connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, f'{alias}.sqlite3')
+                elif alias == DEFAULT_DB_ALIAS:
+                    name = alias_connection.settings_dict['NAME']
+                    alias_connection.settings_dict['TEST']['NAME'] = f'{name}_write_benchmark'
+                else:
+                    # Other databases hold the sequences themselves, over a connection of their own
+                    alias_connection.creation.set_as_test_mirror(connection.settings_dict)
+                    continue
+                old_name = alias_connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                                                    serialize=False)
+                created.append((alias_connection, old_name))
+            yield
+        finally:
+            for alias_connection, old_name in reversed(created):
+                alias_connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+class Command(BaseCommand):
+    help = ('Measure create_request throughput with many customers submitting at once, under each database '
+            'profile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submitters', type=int, default=32, help='Customers submitting at the same time')
+        parser.add_argument('--requests', type=int, default=20, help='Requests each customer submits')
+        parser.add_argument('--profiles', default='sqlite-legacy,sqlite',
+                            help='Comma-separated DB_PROFILE names to compare')
+        parser.add_argument('--current', action='store_true',
+                            help='Only benchmark the database profile this process is configured with')
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+        parser.add_argument('--output', help='Write the results for every profile to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['current']:
+            result = self.run_current(options['submitters'], options['requests'])
+            if options['json']:
+                self.stdout.write(json.dumps(result))
+            else:
+                self.print_results([result])
+            return
+
+        results = [self.run_profile(profile.strip(), options) for profile in options['profiles'].split(',')
+                   if profile.strip()]
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'submitters': options['submitters'], 'requests': options['requests'],
+                           'results': results}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_current(self, submitters, per_submitter):
+        """Benchmark the configured database profile in a throwaway database of that kind"""
+        with throwaway_database():
+            return self.measure(submitters, per_submitter)
+
+    def measure(self, submitters, per_submitter):
+        """Benchmark the database the default connection points at"""
+        customer, _ = User.objects.get_or_create(username='write-benchmark', defaults={'first_name': 'Benchmark'})
+        service_type, _ = ServiceType.objects.get_or_create(
+            name='Write Benchmark', defaults={'description': 'Requests created by benchmark_writes'}
+        )
+        # Keep the confirmation emails sent for each request off the console
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            row, errors = run_concurrent_writes(customer, service_type, submitters, per_submitter)
+        return {'profile': os.environ.get('DB_PROFILE', settings.DB_PROFILE), 'database': connection.vendor,
+                **row, 'error_messages': errors}
+
+    def run_profile(self, profile, options):
+        """Benchmark ``profile`` in a child process, since the database settings are fixed at startup"""
+        if profile not in settings.DATABASE_PROFILES:
+            raise CommandError(f'Unknown database profile {profile!r}')
+        self.stdout.write(f'Benchmarking {profile}...')
+        env = {**os.environ, 'DB_PROFILE': profile, 'QUERY_ACCOUNTING': '0'}
+        manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+        try:
+            output = subprocess.run(
+                [*manage, 'benchmark_writes', '--current', '--json',
+                 '--submitters', str(options['submitters']), '--requests', str(options['requests'])],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        except subprocess.CalledProcessError as exc:
+            raise CommandError(f'Benchmark of {profile} failed:\n{exc.stderr}')
+        return json.loads(output.strip().splitlines()[-1])
+
+    def print_results(self, results):
+        self.stdout.write(f"\n{'Profile':<16}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['profile']:<16}{row['throughput_rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                f"{row['p99_ms']:>9}{row['errors']:>9}"
+            )
+            for message, count in row['error_messages'].items():
+                self.stdout.write(self.style.ERROR(f'  {count} x {message}'))
@@ -0,0 +1,29 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from customer_service.models import UploadSession
+from customer_service.uploads import partial_path
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions that were abandoned before finishing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+                            help='Remove unfinished uploads idle for longer than this')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(status='uploading', updated_at__lt=cutoff)
+        removed = 0
+        for session in stale.iterator():
+            path = partial_path(session)
+            if os.path.exists(path):
+                os.remove(path)
+            session.delete()
+            removed += 1
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned upload(s)'))
@@ -0,0 +1,65 @@
+import json
+import shutil
+import shlex
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_service.benchmark import benchmark_targets, build_report, run_concurrent_http, running_server
+
+# Pages whose views run natively async under ASGI
+ASYNC_PAGES = ('request_list', 'request_detail', 'profile', 'support_dashboard', 'support_dashboard_search')
+
+
+class Command(BaseCommand):
+    help = 'Compare WSGI and ASGI throughput for the read-heavy pages under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500, help='Requests per page and server')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--wsgi-command',
+                            default='gunicorn gas_utility.wsgi:application --bind 127.0.0.1:{port} '
+                                    '--workers {workers} --threads 4')
+        parser.add_argument('--asgi-command',
+                            default='uvicorn gas_utility.asgi:application --port {port} --workers {workers} '
+                                    '--no-access-log')
+        parser.add_argument('--output', help='Write both result sets to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            _, _, targets = benchmark_targets()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        targets = [target for target in targets if target[0] in ASYNC_PAGES]
+
+        reports = {}
+        for label in ('wsgi', 'asgi'):
+            command = options[f'{label}_command'].format(port=options['port'], workers=options['workers'])
+            if shutil.which(shlex.split(command)[0]) is None:
+                raise CommandError(f'{shlex.split(command)[0]} is not installed; pass --{label}-command to use '
+                                   f'another server')
+            self.stdout.write(f'Benchmarking {label.upper()}: {command}')
+            try:
+                with running_server(command, options['port']) as base_url:
+                    results = run_concurrent_http(targets, options['iterations'], base_url, options['concurrency'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            reports[label] = build_report(results, label, options['iterations'])
+
+        self.stdout.write(f"\n{'URL':<28}{'WSGI req/s':>12}{'ASGI req/s':>12}{'WSGI p95':>10}{'ASGI p95':>10}")
+        asgi_rows = {row['name']: row for row in reports['asgi']['results']}
+        for wsgi in reports['wsgi']['results']:
+            asgi = asgi_rows[wsgi['name']]
+            self.stdout.write(
+                f"{wsgi['name']:<28}{wsgi['throughput_rps']:>12}{asgi['throughput_rps']:>12}"
+                f"{wsgi['p95_ms']:>10}{asgi['p95_ms']:>10}"
+            )
+            errors = wsgi['errors'] + asgi['errors']
+            if errors:
+                self.stdout.write(self.style.ERROR(f'  {errors} error responses'))
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'concurrency': options['concurrency'], **reports}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.export import stream_export
+from customer_service.filters import filter_requests
+from customer_service.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = 'Stream service requests and their status history as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv', help='Output format')
+        parser.add_argument('--output', help='File to write to (defaults to standard output)')
+        parser.add_argument('--search', default='', help='Only export requests matching this search')
+        parser.add_argument('--status', default='', help='Only export requests with this status')
+        parser.add_argument('--date-from', default='', help='Only export requests created on or after YYYY-MM-DD')
+        parser.add_argument('--date-to', default='', help='Only export requests created on or before YYYY-MM-DD')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        requests = filter_requests(
+            ServiceRequest.objects.all(),
+            search=options['search'],
+            status=options['status'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+        )
+        chunks = stream_export(requests, options['format'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as fh:
+                fh.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Export written to {options['output']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
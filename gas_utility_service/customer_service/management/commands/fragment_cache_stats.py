@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.caching import FRAGMENTS, fragment_stats, reset_fragment_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counts for the cached page fragments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after showing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Fragment':<20}{'hits':>10}{'misses':>10}{'hit rate':>10}")
+        for name, (hits, misses) in fragment_stats(FRAGMENTS).items():
+            total = hits + misses
+            rate = f'{hits / total:.0%}' if total else '-'
+            self.stdout.write(f'{name:<20}{hits:>10}{misses:>10}{rate:>10}')
+        if options['reset']:
+            reset_fragment_stats(FRAGMENTS)
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,237 @@
+import random
+import secrets
+import time
+from array import array
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomerProfile
+from customer_service.assignment import reconcile_workloads
+from customer_service.bulk import batched, preserve_timestamps
+from customer_service.counters import reconcile_counters
+from customer_service.models import ServiceRequest, ServiceType, RequestAttachment, RequestStatusUpdate
+from customer_service.search import get_search_backend
+
+# The standard service types created by run.sh
+SERVICE_TYPES = [
+    ('Gas Leak', 'Report a suspected gas leak or gas odor'),
+    ('Billing Question', 'Questions about your gas bill or payment'),
+    ('New Service', 'Request new gas service for your property'),
+    ('Service Transfer', 'Transfer your gas service to a new address'),
+    ('Service Termination', 'Request to terminate your gas service'),
+    ('Meter Reading', 'Request a meter reading or report a meter issue'),
+    ('Gas Appliance Issue', 'Problems with gas appliances or equipment'),
+    ('Other', 'Other requests not listed above'),
+]
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Priya', 'Wei', 'Fatima', 'Carlos', 'Aisha', 'Kenji', 'Olga', 'Mateo', 'Chloe', 'Omar']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Patel',
+              'Nguyen', 'Kim', 'Okafor', 'Rossi', 'Schmidt', 'Novak', 'Silva', 'Cohen', 'Murphy', 'Khan']
+STREETS = ['Oak', 'Maple', 'Cedar', 'Pine', 'Elm', 'Washington', 'Lake', 'Hill', 'Park', 'River', 'Main',
+           'Church', 'Mill', 'Spring', 'Highland', 'Sunset', 'Willow', 'Meadow']
+STREET_SUFFIXES = ['Street', 'Avenue', 'Road', 'Lane', 'Drive', 'Court', 'Way']
+CITIES = ['Springfield', 'Riverton', 'Fairview', 'Greenville', 'Kingston', 'Ashford', 'Brookside', 'Milford']
+
+DESCRIPTIONS = {
+    'Gas Leak': ['Strong smell of gas near the {place}.', 'Hissing sound from the gas line by the {place}.',
+                 'Neighbours report a gas odour outside near the {place}.'],
+    'Billing Question': ['My bill for {month} looks much higher than usual.', 'I was charged twice in {month}.',
+                         'Please explain the delivery charge on my {month} statement.'],
+    'New Service': ['Requesting a new gas connection for the {place} extension.',
+                    'New build needs a gas supply before {month}.'],
+    'Service Transfer': ['Moving house at the end of {month}, please transfer my service.',
+                         'Transfer service to my new address from {month}.'],
+    'Service Termination': ['Please stop service at this address from {month}.',
+                            'Property sold, terminate gas service in {month}.'],
+    'Meter Reading': ['Meter display by the {place} is blank.', 'Estimated reading for {month} is wrong.',
+                      'Meter in the {place} is making a clicking noise.'],
+    'Gas Appliance Issue': ['Boiler in the {place} keeps losing pressure.', 'Pilot light on the {place} heater goes out.',
+                            'Gas hob in the {place} will not ignite.'],
+    'Other': ['General question about my account.', 'Question about the work crew near the {place}.'],
+}
+PLACES = ['kitchen', 'basement', 'garage', 'utility room', 'back garden', 'front porch', 'loft', 'hallway']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+# Relative frequency of each final status and priority
+FINAL_STATUSES = [('completed', 55), ('pending', 15), ('in_progress', 15), ('on_hold', 5), ('cancelled', 10)]
+PRIORITIES = [('low', 25), ('medium', 45), ('high', 22), ('emergency', 8)]
+
+ATTACHMENT_TYPES = ['jpg', 'jpg', 'png', 'pdf', 'mp4']
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate synthetic customers, service requests, status histories and attachment metadata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Number of customers to create')
+        parser.add_argument('--requests', type=int, default=10000, help='Number of service requests to create')
+        parser.add_argument('--staff', type=int, default=10, help='Number of support staff to create')
+        parser.add_argument('--days', type=int, default=365, help='Spread request creation over this many days')
+        parser.add_argument('--attachment-rate', type=float, default=0.2,
+                            help='Fraction of requests that get an attachment')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data')
+        parser.add_argument('--skip-index', action='store_true',
+                            help='Skip rebuilding the search index and counters afterwards')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Tag every generated row with a run id so repeated runs never collide
+        self.run_id = secrets.token_hex(3).upper() if options['seed'] is None else f"{options['seed'] % 0xFFFFFF:06X}"
+        started = time.perf_counter()
+
+        service_types = self.ensure_service_types()
+        staff_ids = self.create_users(options['staff'], staff=True)
+        customer_ids = self.create_users(options['customers'])
+        total = self.create_requests(options['requests'], customer_ids, staff_ids, service_types,
+                                     options['days'], options['attachment_rate'])
+
+        if not options['skip_index']:
+            self.stdout.write('Reconciling counters and rebuilding search index...')
+            reconcile_counters()
+            reconcile_workloads()
+            with transaction.atomic():
+                get_search_backend().rebuild()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(customer_ids)} customers, {len(staff_ids)} staff and {total} rows of request data '
+            f'in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)'
+        ))
+
+    def ensure_service_types(self):
+        service_types = []
+        for name, description in SERVICE_TYPES:
+            service_type, _ = ServiceType.objects.get_or_create(
+                name=name, defaults={'description': description, 'is_active': True}
+            )
+            service_types.append(service_type)
+        return service_types
+
+    def create_users(self, count, staff=False):
+        """Create users (with customer profiles unless they are staff) and return their ids"""
+        password = make_password('password')
+        prefix = 'staff' if staff else 'customer'
+        ids = array('q')
+        for batch in batched(range(count), self.batch_size):
+            users = []
+            for i in batch:
+                first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+                username = f'{prefix}-{self.run_id}-{i}'.lower()
+                users.append(User(username=username, first_name=first, last_name=last, password=password,
+                                  email=f'{username}@example.com', is_staff=staff))
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                if not staff:
+                    CustomerProfile.objects.bulk_create([
+                        CustomerProfile(
+                            user=user,
+                            account_number=f'S{self.run_id}{i:09d}',
+                            address=self.address(),
+                            phone_number=f'555-{self.rng.randint(0, 9999):04d}',
+                        )
+                        for i, user in zip(batch, users)
+                    ])
+            ids.extend(user.pk for user in users)
+            self.stdout.write(f'  {len(ids)}/{count} {prefix} accounts')
+        return ids
+
+    def address(self):
+        rng = self.rng
+        return (f'{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(STREET_SUFFIXES)}, '
+                f'{rng.choice(CITIES)}')
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights)[0]
+
+    def create_requests(self, count, customer_ids, staff_ids, service_types, days, attachment_rate):
+        """Create requests with status histories and attachments, returning the number of rows written"""
+        now = timezone.now()
+        span = timedelta(days=days).total_seconds()
+        written = 0
+        for batch in batched(range(count), self.batch_size):
+            requests, histories = [], []
+            for i in batch:
+                service_type = self.rng.choice(service_types)
+                created_at = now - timedelta(seconds=self.rng.random() * span)
+                history = self.status_history(created_at, now)
+                final_status = history[-1][1]
+                assigned_to_id = (self.rng.choice(staff_ids)
+                                  if staff_ids and final_status != 'pending' else None)
+                requests.append(ServiceRequest(
+                    request_number=f'SR-{self.run_id}{i:07X}',
+                    customer_id=self.rng.choice(customer_ids),
+                    service_type=service_type,
+                    description=self.rng.choice(DESCRIPTIONS[service_type.name]).format(
+                        place=self.rng.choice(PLACES), month=self.rng.choice(MONTHS)),
+                    status=final_status,
+                    priority=self.weighted(PRIORITIES),
+                    assigned_to_id=assigned_to_id,
+                    created_at=created_at,
+                    updated_at=history[-1][2],
+                ))
+                histories.append(history)
+
+            with transaction.atomic(), preserve_timestamps(ServiceRequest, RequestStatusUpdate, RequestAttachment):
+                requests = ServiceRequest.objects.bulk_create(requests)
+                updates, attachments = [], []
+                for service_request, history in zip(requests, histories):
+                    for previous_status, new_status, at in history:
+                        updated_by_id = (service_request.customer_id if not previous_status
+                                         else service_request.assigned_to_id)
+                        updates.append(RequestStatusUpdate(
+                            service_request=service_request, previous_status=previous_status,
+                            new_status=new_status, updated_by_id=updated_by_id, created_at=at,
+                            notes='Service request created' if not previous_status else '',
+                        ))
+                    if self.rng.random() < attachment_rate:
+                        ext = self.rng.choice(ATTACHMENT_TYPES)
+                        attachments.append(RequestAttachment(
+                            service_request=service_request,
+                            file=f'request_attachments/{service_request.request_number}/{secrets.token_hex(16)}.{ext}',
+                            filename=f'photo.{ext}' if ext != 'pdf' else 'document.pdf',
+                            uploaded_at=service_request.created_at,
+                        ))
+                RequestStatusUpdate.objects.bulk_create(updates, batch_size=self.batch_size)
+                RequestAttachment.objects.bulk_create(attachments, batch_size=self.batch_size)
+
+            written += len(requests) + len(updates) + len(attachments)
+            self.stdout.write(f'  {batch[-1] + 1}/{count} requests')
+        return written
+
+    def status_history(self, created_at, now):
+        """Return a plausible list of (previous_status, new_status, timestamp) transitions"""
+        final = self.weighted(FINAL_STATUSES)
+        path = ['pending']
+        if final == 'cancelled' and self.rng.random() < 0.5:
+            path.append('cancelled')
+        elif final != 'pending':
+            path.append('in_progress')
+            if final == 'on_hold' or self.rng.random() < 0.1:
+                path.append('on_hold')
+                if final != 'on_hold':
+                    path.append('in_progress')
+            if final in ('completed', 'cancelled'):
+                path.append(final)
+
+        history = []
+        at = created_at
+        remaining = (now - created_at).total_seconds()
+        for previous, new in zip([''] + path, path):
+            if previous:
+                step = min(self.rng.expovariate(1 / 43200), remaining / 2)
+                at += timedelta(seconds=step)
+                remaining -= step
+            history.append((previous, new, at))
+        return history
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_service.importer import Checkpoint, LegacyImporter
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import customers or tickets from a legacy CRM export (CSV or JSON lines)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['customers', 'tickets'], help='What the input file contains')
+        parser.add_argument('path', help='CSV, .jsonl or .ndjson file to import')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Records per transaction')
+        parser.add_argument('--checkpoint', help='Checkpoint file (defaults to <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the top')
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            self.stdout.write(f'  {stats.read} records read, {stats.created} created, '
+                              f'{stats.skipped} skipped ({stats.rate:.0f} rows/s)')
+
+        importer = LegacyImporter(chunk_size=options['chunk_size'], progress=progress)
+        checkpoint = Checkpoint(options['checkpoint']) if options['checkpoint'] else None
+        try:
+            stats = importer.run(options['path'], options['kind'], checkpoint=checkpoint,
+                                 resume=not options['restart'])
+        except FileNotFoundError:
+            raise CommandError(f"No such file: {options['path']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.created} {options['kind']} ({stats.skipped} skipped) "
+            f'at {stats.rate:.0f} rows/s'
+        ))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from customer_service.processing import process_backlog
+
+
+class Command(BaseCommand):
+    help = 'Process attachments still waiting for post-processing, including ones abandoned by a crashed worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many attachments')
+        parser.add_argument('--stale-minutes', type=int, default=settings.ATTACHMENT_PROCESSING_TIMEOUT_MINUTES,
+                            help='Retry attachments stuck in processing for longer than this')
+
+    def handle(self, *args, **options):
+        processed = process_backlog(stale_after=timedelta(minutes=options['stale_minutes']), limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} attachment(s)'))
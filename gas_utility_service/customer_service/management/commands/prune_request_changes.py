@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from customer_service.models import RequestChange
+
+
+class Command(BaseCommand):
+    help = 'Delete live feed change log entries that no connected dashboard still needs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.LIVE_FEED_RETENTION_HOURS,
+                            help='Keep entries newer than this')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = RequestChange.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} change log entries'))
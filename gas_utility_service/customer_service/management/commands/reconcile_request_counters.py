@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.assignment import reconcile_workloads
+from customer_service.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Recompute the service request counters and staff workloads from the request table and repair any '
+            'drift')
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters()
+        for (status, priority, service_type_id), stored, actual in drift:
+            self.stdout.write(
+                f'{status}/{priority}/service type {service_type_id}: {stored} -> {actual}'
+            )
+        workload_drift = reconcile_workloads()
+        for staff_id, stored, actual in workload_drift:
+            self.stdout.write(f'staff {staff_id}: {stored} -> {actual} open')
+        if drift or workload_drift:
+            self.stdout.write(self.style.WARNING(
+                f'Repaired {len(drift)} counter(s) and {len(workload_drift)} workload(s)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('All counters are accurate'))
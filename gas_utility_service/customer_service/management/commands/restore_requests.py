@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_service.archive import restore_request
+
+
+class Command(BaseCommand):
+    help = 'Move archived requests back into the working tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('request_numbers', nargs='+', help='Request numbers to restore')
+
+    def handle(self, *args, **options):
+        missing = []
+        for request_number in options['request_numbers']:
+            if restore_request(request_number) is None:
+                missing.append(request_number)
+            else:
+                self.stdout.write(f'Restored {request_number}')
+        if missing:
+            raise CommandError(f"No archived request found for {', '.join(missing)}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from customer_service.taskqueue import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (notifications, search index updates) until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks each thread claims at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+        )
+        self.stdout.write(f'Worker {worker.name} started with {worker.concurrency} thread(s)')
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(f'Ran {worker.processed} task(s), {worker.failed} failed'))
@@ -0,0 +1,54 @@
+import json
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from customer_service.assignment import AssignmentEngine, simulate
+from customer_service.models import ServiceRequest, ServiceType
+
+
+class Command(BaseCommand):
+    help = ('Replay a day of requests through the assignment engine, without changing anything, and report the '
+            'cost per assignment and how evenly the load was spread')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to replay (YYYY-MM-DD); defaults to yesterday')
+        parser.add_argument('--synthetic', type=int,
+                            help='Replay this many made-up requests across the active service types instead')
+        parser.add_argument('--staff', type=int,
+                            help='Simulate this many staff members without skills instead of the real ones')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for --synthetic')
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            rng = random.Random(options['seed'])
+            type_ids = list(ServiceType.objects.filter(is_active=True).values_list('pk', flat=True)) or [1]
+            priorities = [priority for priority, _ in ServiceRequest.PRIORITY_CHOICES]
+            requests = [(rng.choice(type_ids), rng.choices(priorities, weights=(3, 5, 2, 1))[0])
+                        for _ in range(options['synthetic'])]
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+            try:
+                if options['date']:
+                    day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date {options['date']!r}")
+            requests = list(ServiceRequest.objects.filter(created_at__date=day).order_by('created_at')
+                            .values_list('service_type_id', 'priority'))
+
+        if options['staff']:
+            engine = AssignmentEngine((staff_id, 0, 0, set()) for staff_id in range(1, options['staff'] + 1))
+        else:
+            engine = AssignmentEngine.from_database()
+        if not len(engine):
+            raise CommandError('No active staff accept automatic assignment; use --staff to simulate some')
+
+        result = simulate(engine, requests)
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+        for name, value in result.items():
+            self.stdout.write(f"{name.replace('_', ' '):<24}{value}")
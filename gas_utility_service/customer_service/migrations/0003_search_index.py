@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from customer_service.search import backend_for_vendor
+    backend = backend_for_vendor(schema_editor.connection.vendor)()
+    with schema_editor.connection.cursor() as cursor:
+        backend.create_index(cursor)
+    # Populate the index from any requests that already exist
+    backend.rebuild()
+
+
+def drop_search_index(apps, schema_editor):
+    from customer_service.search import backend_for_vendor
+    backend = backend_for_vendor(schema_editor.connection.vendor)()
+    with schema_editor.connection.cursor() as cursor:
+        backend.drop_index(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0002_servicerequest_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
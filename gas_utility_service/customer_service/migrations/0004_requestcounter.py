@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    ServiceRequest = apps.get_model('customer_service', 'ServiceRequest')
+    RequestCounter = apps.get_model('customer_service', 'RequestCounter')
+    buckets = ServiceRequest.objects.values('status', 'priority', 'service_type_id').annotate(
+        total=models.Count('id')).order_by()
+    RequestCounter.objects.bulk_create(
+        RequestCounter(status=row['status'], priority=row['priority'],
+                       service_type_id=row['service_type_id'], count=row['total'])
+        for row in buckets
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('emergency', 'Emergency')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('service_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='customer_service.servicetype')),
+            ],
+            options={
+                'verbose_name': 'Request Counter',
+                'verbose_name_plural': 'Request Counters',
+                'constraints': [models.UniqueConstraint(fields=('status', 'priority', 'service_type'), name='unique_request_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+import customer_service.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0005_attachment_blobs_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestattachment',
+            name='content_type',
+            field=models.CharField(blank=True, help_text='Detected from the file contents', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', help_text='State of background post-processing', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='size',
+            field=models.BigIntegerField(blank=True, help_text='File size in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='thumbnail',
+            field=models.FileField(blank=True, max_length=255, upload_to=customer_service.models.get_thumbnail_upload_path),
+        ),
+    ]
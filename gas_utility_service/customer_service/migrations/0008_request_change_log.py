@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0007_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_position', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Request Change Sequence',
+                'verbose_name_plural': 'Request Change Sequences',
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('status', 'Status changed')], max_length=20)),
+                ('previous_status', models.CharField(blank=True, max_length=20)),
+                ('new_status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('position', models.BigIntegerField(blank=True, editable=False, null=True, unique=True)),
+                ('service_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='customer_service.servicerequest')),
+            ],
+            options={
+                'verbose_name': 'Request Change',
+                'verbose_name_plural': 'Request Changes',
+            },
+        ),
+    ]
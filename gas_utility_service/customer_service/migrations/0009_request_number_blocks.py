@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0008_request_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name': 'Request Number Block',
+                'verbose_name_plural': 'Request Number Blocks',
+            },
+        ),
+    ]
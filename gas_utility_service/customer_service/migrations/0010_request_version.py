@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0009_request_number_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of times the request has been changed'),
+        ),
+    ]
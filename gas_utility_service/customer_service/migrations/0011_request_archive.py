@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0010_request_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAttachment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('filename', models.CharField(max_length=255)),
+                ('uploaded_at', models.DateTimeField()),
+                ('processing_status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], max_length=20)),
+                ('processing_attempts', models.PositiveSmallIntegerField(default=0)),
+                ('processing_error', models.TextField(blank=True)),
+                ('processing_started_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('thumbnail', models.FileField(blank=True, max_length=255, upload_to='')),
+            ],
+            options={
+                'verbose_name': 'Archived Attachment',
+                'verbose_name_plural': 'Archived Attachments',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedServiceRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('request_number', models.CharField(max_length=20, unique=True)),
+                ('description', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('emergency', 'Emergency')], max_length=20)),
+                ('support_notes', models.TextField(blank=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archived Service Request',
+                'verbose_name_plural': 'Archived Service Requests',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedStatusUpdate',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('previous_status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('new_status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Archived Status Update',
+                'verbose_name_plural': 'Archived Status Updates',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['status', 'updated_at'], name='servicerequest_status_upd_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedattachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='customer_service.attachmentblob'),
+        ),
+        migrations.AddField(
+            model_name='archivedservicerequest',
+            name='assigned_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_assigned_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedservicerequest',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_service_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedservicerequest',
+            name='service_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_requests', to='customer_service.servicetype'),
+        ),
+        migrations.AddField(
+            model_name='archivedattachment',
+            name='service_request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='customer_service.archivedservicerequest'),
+        ),
+        migrations.AddField(
+            model_name='archivedstatusupdate',
+            name='service_request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_updates', to='customer_service.archivedservicerequest'),
+        ),
+        migrations.AddField(
+            model_name='archivedstatusupdate',
+            name='updated_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0013_work_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffWorkload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_count', models.IntegerField(default=0, help_text='Open requests assigned to this member of staff')),
+                ('open_load', models.IntegerField(default=0, help_text='Open requests weighted by priority')),
+                ('auto_assign', models.BooleanField(default=True, help_text='Whether new requests may be assigned to them automatically')),
+                ('skills', models.ManyToManyField(blank=True, help_text='Service types this member of staff handles; none means all of them', related_name='staff_workloads', to='customer_service.servicetype')),
+                ('staff', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='workload', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Staff Workload',
+                'verbose_name_plural': 'Staff Workloads',
+            },
+        ),
+    ]
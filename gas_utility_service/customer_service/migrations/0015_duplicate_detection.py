@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_service', '0014_staff_workload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(help_text='When the first request in the cluster was made')),
+            ],
+            options={
+                'verbose_name': 'Incident Cluster',
+                'verbose_name_plural': 'Incident Clusters',
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestSignature',
+            fields=[
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='customer_service.servicerequest')),
+                ('minhash', models.BinaryField()),
+                ('created_at', models.DateTimeField()),
+                ('cluster', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='signatures', to='customer_service.incidentcluster')),
+            ],
+            options={
+                'verbose_name': 'Request Signature',
+                'verbose_name_plural': 'Request Signatures',
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('bucket', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='customer_service.requestsignature')),
+            ],
+            options={
+                'verbose_name': 'Signature Band',
+                'verbose_name_plural': 'Signature Bands',
+                'indexes': [models.Index(fields=['bucket', 'created_at', 'signature'], name='signatureband_bucket_idx')],
+            },
+        ),
+    ]
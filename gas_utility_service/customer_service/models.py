@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 import os
 
@@ -29,6 +30,19 @@ class ServiceRequest(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Statuses a request may move to from each status. Completed and
+    # cancelled requests can only be reopened.
+    STATUS_TRANSITIONS = {
+        'pending': ('in_progress', 'on_hold', 'completed', 'cancelled'),
+        'in_progress': ('on_hold', 'completed', 'cancelled'),
+        'on_hold': ('pending', 'in_progress', 'cancelled'),
+        'completed': ('in_progress',),
+        'cancelled': ('pending',),
+    }
+    
+    # Requests in these statuses count towards the assigned staff member's workload
+    OPEN_STATUSES = ('pending', 'in_progress', 'on_hold')
+    
     PRIORITY_CHOICES = [
         ('low', 'Low'),
         ('medium', 'Medium'),
@@ -36,6 +50,14 @@ class ServiceRequest(models.Model):
         ('emergency', 'Emergency'),
     ]
     
+    # Order in which the work queue hands out requests, most urgent first
+    PRIORITY_RANKS = {
+        'emergency': 0,
+        'high': 1,
+        'medium': 2,
+        'low': 3,
+    }
+    
     # Basic request information
     request_number = models.CharField(max_length=20, unique=True, editable=False,
                                     help_text="Unique identifier for the service request")
@@ -50,6 +72,15 @@ class ServiceRequest(models.Model):
                             help_text="Current status of the request")
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium',
                                 help_text="Priority level of the request")
+    # Computed by the database, so it stays right however the priority is written
+    priority_rank = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(priority=priority, then=models.Value(rank)) for priority, rank in PRIORITY_RANKS.items()],
+            default=models.Value(len(PRIORITY_RANKS)),
+        ),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+    )
     
     # Support staff information
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, 
@@ -58,6 +89,10 @@ class ServiceRequest(models.Model):
     support_notes = models.TextField(blank=True, 
                                   help_text="Internal notes for support staff (not visible to customer)")
     
+    # Incremented by every write, so edits based on an older copy can be detected
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          help_text="Number of times the request has been changed")
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -65,15 +100,68 @@ class ServiceRequest(models.Model):
     def __str__(self):
         return f"{self.request_number} - {self.customer.username}"
     
+    def can_transition_to(self, status):
+        return status in self.STATUS_TRANSITIONS.get(self.status, ())
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which counter bucket the row was loaded in so that a
+        # status change can be moved between buckets without re-reading it
+        loaded = dict(zip(field_names, values))
+        if all(name in loaded for name in ('status', 'priority', 'service_type_id')):
+            instance._loaded_counter_key = (loaded['status'], loaded['priority'], loaded['service_type_id'])
+        # Likewise for the assigned staff member's workload
+        if all(name in loaded for name in ('status', 'priority', 'assigned_to_id')):
+            instance._loaded_workload_key = cls.make_workload_key(
+                loaded['status'], loaded['priority'], loaded['assigned_to_id']
+            )
+        return instance
+    
+    @property
+    def counter_key(self):
+        return (self.status, self.priority, self.service_type_id)
+    
+    @classmethod
+    def make_workload_key(cls, status, priority, assigned_to_id):
+        if assigned_to_id is None or status not in cls.OPEN_STATUSES:
+            return None
+        return (assigned_to_id, priority)
+    
+    @property
+    def workload_key(self):
+        """(staff id, priority) if the request counts towards someone's workload, else None"""
+        return self.make_workload_key(self.status, self.priority, self.assigned_to_id)
+    
+    @staticmethod
+    def generate_request_number():
+        # Time-ordered by default; see REQUEST_NUMBER_GENERATOR
+        from .numbering import next_request_number
+        return next_request_number()
+    
     def save(self, *args, **kwargs):
         # Generate unique request number on creation
         if not self.request_number:
-            self.request_number = f"SR-{uuid.uuid4().hex[:8].upper()}"
+            self.request_number = self.generate_request_number()
+        if not self._state.adding:
+            # A full save still counts as a change to anyone holding the old version
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
         super().save(*args, **kwargs)
     
     class Meta:
         verbose_name = "Service Request"
         verbose_name_plural = "Service Requests"
+        indexes = [
+            # Backs keyset pagination of the support dashboard
+            models.Index(fields=['created_at', 'id'], name='servicerequest_created_id_idx'),
+            # Finds closed requests that are due to be archived
+            models.Index(fields=['status', 'updated_at'], name='servicerequest_status_upd_idx'),
+            # Work queue order for unassigned requests; claiming reads the first entry
+            models.Index(fields=['status', 'priority_rank', 'created_at'], name='servicerequest_queue_idx',
+                         condition=models.Q(assigned_to__isnull=True)),
+        ]
 
 def get_attachment_upload_path(instance, filename):
     """Generate upload path for request attachments"""
@@ -84,13 +172,85 @@ def get_attachment_upload_path(instance, filename):
     # Return the upload path
     return os.path.join('request_attachments', instance.service_request.request_number, filename)
 
+def get_blob_upload_path(instance, filename):
+    """Store blobs under their content hash, fanned out into subdirectories"""
+    return os.path.join('blobs', instance.sha256[:2], instance.sha256[2:4], instance.sha256)
+
+class AttachmentBlob(models.Model):
+    """Content-addressed file shared by every attachment with the same contents"""
+    sha256 = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the file contents")
+    file = models.FileField(upload_to=get_blob_upload_path, max_length=255)
+    size = models.BigIntegerField(help_text="File size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.sha256
+    
+    class Meta:
+        verbose_name = "Attachment Blob"
+        verbose_name_plural = "Attachment Blobs"
+
+class UploadSession(models.Model):
+    """A chunked upload in progress, resumable from ``received`` bytes"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+    ]
+    
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255, help_text="Original filename")
+    size = models.BigIntegerField(help_text="Total size the client announced, in bytes")
+    received = models.BigIntegerField(default=0, help_text="Bytes received so far")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='upload_sessions')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+    
+    class Meta:
+        verbose_name = "Upload Session"
+        verbose_name_plural = "Upload Sessions"
+
+def get_thumbnail_upload_path(instance, filename):
+    """Thumbnails are shared by every attachment with the same contents"""
+    key = instance.blob.sha256 if instance.blob_id else uuid.uuid4().hex
+    return os.path.join('thumbnails', key[:2], f"{key}.jpg")
+
 class RequestAttachment(models.Model):
     """Model for files attached to service requests"""
+    PROCESSING_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
     service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to=get_attachment_upload_path)
+    file = models.FileField(upload_to=get_attachment_upload_path, max_length=255)
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='attachments',
+                             help_text="Deduplicated contents; file points at the blob's file when set")
     filename = models.CharField(max_length=255, help_text="Original filename")
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    # Background post-processing. The attachment rows double as the job
+    # queue: workers claim pending rows and record the outcome here
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_CHOICES, default='pending',
+                                         db_index=True, help_text="State of background post-processing")
+    processing_attempts = models.PositiveSmallIntegerField(default=0)
+    processing_error = models.TextField(blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, help_text="Detected from the file contents")
+    size = models.BigIntegerField(null=True, blank=True, help_text="File size in bytes")
+    thumbnail = models.FileField(upload_to=get_thumbnail_upload_path, max_length=255, blank=True)
+    
     def __str__(self):
         return f"{self.filename} - {self.service_request.request_number}"
     
@@ -119,3 +279,325 @@ class RequestStatusUpdate(models.Model):
         verbose_name = "Request Status Update"
         verbose_name_plural = "Request Status Updates"
         ordering = ['-created_at']
+
+class RequestCounter(models.Model):
+    """Running count of service requests per status, priority and service type
+
+    Maintained incrementally whenever a request is created, changes bucket or
+    is deleted, so dashboard totals never need to aggregate the request table.
+    """
+    status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    priority = models.CharField(max_length=20, choices=ServiceRequest.PRIORITY_CHOICES)
+    service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE, related_name='counters')
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.status}/{self.priority}/{self.service_type_id}: {self.count}"
+    
+    class Meta:
+        verbose_name = "Request Counter"
+        verbose_name_plural = "Request Counters"
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'priority', 'service_type'], name='unique_request_counter'),
+        ]
+
+
+class ArchivedServiceRequest(models.Model):
+    """A closed service request moved out of the working tables by ``archive_requests``
+
+    Rows keep the id they had as a ServiceRequest, and child rows keep the
+    same field names, so moving a request between the two sets of tables
+    is a straight copy.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    request_number = models.CharField(max_length=20, unique=True)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_service_requests')
+    service_type = models.ForeignKey(ServiceType, on_delete=models.PROTECT, related_name='archived_requests')
+    description = models.TextField()
+    status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    priority = models.CharField(max_length=20, choices=ServiceRequest.PRIORITY_CHOICES)
+    assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='archived_assigned_requests')
+    support_notes = models.TextField(blank=True)
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.request_number} (archived)"
+    
+    class Meta:
+        verbose_name = "Archived Service Request"
+        verbose_name_plural = "Archived Service Requests"
+
+
+class ArchivedStatusUpdate(models.Model):
+    """Status history of an archived request"""
+    id = models.BigIntegerField(primary_key=True)
+    service_request = models.ForeignKey(ArchivedServiceRequest, on_delete=models.CASCADE,
+                                        related_name='status_updates')
+    previous_status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    new_status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = "Archived Status Update"
+        verbose_name_plural = "Archived Status Updates"
+        ordering = ['-created_at']
+
+
+class ArchivedAttachment(models.Model):
+    """An attachment of an archived request; the file itself stays where it was"""
+    id = models.BigIntegerField(primary_key=True)
+    service_request = models.ForeignKey(ArchivedServiceRequest, on_delete=models.CASCADE,
+                                        related_name='attachments')
+    file = models.FileField(max_length=255)
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    uploaded_at = models.DateTimeField()
+    processing_status = models.CharField(max_length=20, choices=RequestAttachment.PROCESSING_CHOICES)
+    processing_attempts = models.PositiveSmallIntegerField(default=0)
+    processing_error = models.TextField(blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    thumbnail = models.FileField(max_length=255, blank=True)
+    
+    class Meta:
+        verbose_name = "Archived Attachment"
+        verbose_name_plural = "Archived Attachments"
+
+
+class RequestTiming(models.Model):
+    """Where a request is in its lifecycle, kept up to date as status updates are written
+
+    Holds just enough to time the next transition without reading the
+    request's history. Ids are stored as plain integers so the facts
+    outlive archiving or deleting the request, service type or staff member.
+    """
+    request_id = models.BigIntegerField(unique=True)
+    service_type_id = models.IntegerField()
+    priority = models.CharField(max_length=20, choices=ServiceRequest.PRIORITY_CHOICES)
+    created_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    status_since = models.DateTimeField(help_text="When the request entered its current status")
+    first_response_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Request {self.request_id}: {self.status} since {self.status_since}"
+    
+    class Meta:
+        verbose_name = "Request Timing"
+        verbose_name_plural = "Request Timings"
+
+
+class SLARollup(models.Model):
+    """Daily histogram of one SLA metric for a service type, priority and staff member
+
+    Each row counts the durations that fell into one histogram bucket on one
+    day, so reports over any date range only sum a few rows per day and
+    estimate percentiles from the combined histogram. ``staff_id`` is 0 when
+    no staff member was involved.
+    """
+    day = models.DateField()
+    metric = models.CharField(max_length=30)
+    service_type_id = models.IntegerField()
+    priority = models.CharField(max_length=20, choices=ServiceRequest.PRIORITY_CHOICES)
+    staff_id = models.IntegerField(default=0)
+    bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.day} {self.metric} bucket {self.bucket}: {self.count}"
+    
+    class Meta:
+        verbose_name = "SLA Rollup"
+        verbose_name_plural = "SLA Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'metric', 'service_type_id', 'priority', 'staff_id', 'bucket'],
+                                    name='unique_sla_rollup'),
+        ]
+
+
+class RequestNumberBlock(models.Model):
+    """High-water mark of a request number sequence
+
+    Workers using the block generator reserve numbers by advancing
+    ``next_value`` a whole block at a time, then issue them from memory.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+    
+    class Meta:
+        verbose_name = "Request Number Block"
+        verbose_name_plural = "Request Number Blocks"
+
+
+class RequestChangeSequence(models.Model):
+    """Last live feed position handed out; its single row makes publishers take turns"""
+    last_position = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return str(self.last_position)
+    
+    class Meta:
+        verbose_name = "Request Change Sequence"
+        verbose_name_plural = "Request Change Sequences"
+
+
+class RequestChange(models.Model):
+    """Append-only log of dashboard-visible changes, read by the live feed
+
+    ``position`` is the feed cursor: clients ask for changes after the last
+    position they saw, which is an index range scan however large the
+    request table grows. Positions are handed out after the change commits
+    (see ``feed.publish_changes``), so they follow commit order, which ids
+    don't.
+    """
+    KIND_CHOICES = (
+        ('created', 'Created'),
+        ('status', 'Status changed'),
+    )
+    
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name='+')
+    previous_status = models.CharField(max_length=20, blank=True)
+    new_status = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    position = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
+    
+    def __str__(self):
+        return f"{self.pk}: {self.kind} {self.service_request_id}"
+    
+    class Meta:
+        verbose_name = "Request Change"
+        verbose_name_plural = "Request Changes"
+
+class Task(models.Model):
+    """A unit of background work waiting for, or being run by, a ``runworker`` process
+
+    Tasks are deleted once they succeed, so the table only holds queued,
+    running and failed work.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+    
+    class Meta:
+        verbose_name = "Task"
+        verbose_name_plural = "Tasks"
+        indexes = [
+            # Workers look for the oldest due task in the queue
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+
+class StaffWorkload(models.Model):
+    """Open requests assigned to a member of staff, and the service types they handle
+
+    The counts are kept up to date as requests are assigned, reassigned and
+    closed, so the assignment engine never has to count requests. The load
+    weighs each open request by its priority.
+    """
+    staff = models.OneToOneField(User, on_delete=models.CASCADE, related_name='workload')
+    open_count = models.IntegerField(default=0, help_text="Open requests assigned to this member of staff")
+    open_load = models.IntegerField(default=0, help_text="Open requests weighted by priority")
+    skills = models.ManyToManyField(ServiceType, blank=True, related_name='staff_workloads',
+                                    help_text="Service types this member of staff handles; none means all of them")
+    auto_assign = models.BooleanField(default=True,
+                                      help_text="Whether new requests may be assigned to them automatically")
+    
+    def __str__(self):
+        return f"{self.staff.username}: {self.open_count} open"
+    
+    class Meta:
+        verbose_name = "Staff Workload"
+        verbose_name_plural = "Staff Workloads"
+
+
+class IncidentCluster(models.Model):
+    """Requests that look like separate reports of the same incident"""
+    started_at = models.DateTimeField(help_text="When the first request in the cluster was made")
+    
+    def __str__(self):
+        return f"Incident cluster #{self.pk}"
+    
+    class Meta:
+        verbose_name = "Incident Cluster"
+        verbose_name_plural = "Incident Clusters"
+
+
+class RequestSignature(models.Model):
+    """MinHash signature of the words in a request's description and address
+
+    Two signatures agree in about the same fraction of positions as the
+    token sets they were built from overlap, so comparing signatures
+    estimates how alike two requests are without reading their text.
+    """
+    request = models.OneToOneField(ServiceRequest, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='signature')
+    minhash = models.BinaryField()
+    # Copied from the request so candidates can be limited to a time window without a join
+    created_at = models.DateTimeField()
+    cluster = models.ForeignKey(IncidentCluster, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='signatures')
+    
+    def __str__(self):
+        return f"Signature of request {self.request_id}"
+    
+    class Meta:
+        verbose_name = "Request Signature"
+        verbose_name_plural = "Request Signatures"
+
+
+class SignatureBand(models.Model):
+    """One locality-sensitive hash bucket a signature falls into
+
+    Each signature is split into bands and every band is hashed to a bucket.
+    Requests sharing any bucket are candidate duplicates, found with an
+    index range scan per bucket and time window however many requests there
+    are.
+    """
+    id = models.BigAutoField(primary_key=True)
+    bucket = models.BigIntegerField()
+    # The request's creation time, so a lookup only reads the bucket's entries inside the window
+    created_at = models.DateTimeField()
+    signature = models.ForeignKey(RequestSignature, on_delete=models.CASCADE, related_name='bands')
+    
+    def __str__(self):
+        return f"{self.signature_id} in bucket {self.bucket}"
+    
+    class Meta:
+        verbose_name = "Signature Band"
+        verbose_name_plural = "Signature Bands"
+        indexes = [
+            # Candidate lookups read only this index
+            models.Index(fields=['bucket', 'created_at', 'signature'], name='signatureband_bucket_idx'),
+        ]
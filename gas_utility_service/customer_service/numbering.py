@@ -0,0 +1,186 @@
+"""
+Request number generators.
+
+The original numbers were ``SR-`` plus eight random hex digits: 32 bits of
+randomness on a unique column, which collides as volume grows and spreads
+inserts all over the unique index. The generators here hand out numbers
+that increase over time, so new rows land at the right-hand edge of the
+index, without a database round trip per request:
+
+``TimeOrderedRequestNumberGenerator`` (the default) builds ULID-style
+numbers from the current millisecond plus random bits, kept monotonic
+within a process. ``BlockRequestNumberGenerator`` hands out a plain
+sequence, reserving a block of numbers at a time in the
+``SEQUENCE_DATABASE``, which ``SequenceRouter`` sends its table to.
+
+Every format differs in length from the others, so old ``SR-XXXXXXXX``
+numbers stay valid and are looked up exactly as before. Pick a generator
+with the ``REQUEST_NUMBER_GENERATOR`` setting.
+"""
+import re
+import secrets
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils.module_loading import import_string
+
+# Crockford's base32: no I, L, O or U, and in ASCII order so that encoded
+# numbers sort the same way as the values
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class RequestNumberGenerator:
+    """Base class for request number generators"""
+    prefix = 'SR-'
+
+    def next_number(self):
+        raise NotImplementedError
+
+
+class RandomRequestNumberGenerator(RequestNumberGenerator):
+    """The original scheme, ``SR-`` and eight random hex digits"""
+
+    def next_number(self):
+        return f'{self.prefix}{uuid.uuid4().hex[:8].upper()}'
+
+
+class TimeOrderedRequestNumberGenerator(RequestNumberGenerator):
+    """``SR-`` plus a 48-bit millisecond timestamp and 35 random bits, 20 characters in all
+
+    Within one millisecond the random part is incremented rather than
+    redrawn, as ULIDs do, so numbers from one process never go backwards.
+    Two processes collide only if they draw the same 35 bits in the same
+    millisecond.
+    """
+    TIME_CHARS = 10
+    RANDOM_CHARS = 7
+    RANDOM_MAX = 32 ** RANDOM_CHARS - 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def next_number(self):
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms > self._last_ms:
+                self._last_ms, self._last_random = ms, secrets.randbelow(self.RANDOM_MAX // 2)
+            elif self._last_random < self.RANDOM_MAX:
+                # Same millisecond, or the clock stepped back
+                self._last_random += 1
+            else:
+                self._last_ms, self._last_random = self._last_ms + 1, secrets.randbelow(self.RANDOM_MAX // 2)
+            ms, random_part = self._last_ms, self._last_random
+        return f'{self.prefix}{encode_base32(ms, self.TIME_CHARS)}{encode_base32(random_part, self.RANDOM_CHARS)}'
+
+
+class BlockRequestNumberGenerator(RequestNumberGenerator):
+    """``SR-`` plus a twelve digit sequence, reserved ``REQUEST_NUMBER_BLOCK_SIZE`` at a time
+
+    Each thread reserves its own block with one UPDATE on the
+    RequestNumberBlock row and issues numbers from it in memory. Unused
+    numbers in a block, whether the process exits or the transaction that
+    reserved it rolls back, are simply skipped, so the sequence has gaps
+    but never repeats.
+    """
+    sequence = 'service_request'
+    DIGITS = 12
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.REQUEST_NUMBER_BLOCK_SIZE
+        self._local = threading.local()
+
+    def next_number(self):
+        block = getattr(self._local, 'block', None)
+        if block is None or block['next'] >= block['end']:
+            block = self._local.block = self.reserve()
+        value = block['next']
+        block['next'] += 1
+        return f'{self.prefix}{value:0{self.DIGITS}d}'
+
+    def reserve(self):
+        """Reserve the next block of numbers and return it
+
+        The reservation commits on the sequence database's own connection,
+        independently of any transaction open on the default one.
+        """
+        from .models import RequestNumberBlock
+
+        using = settings.SEQUENCE_DATABASE
+        blocks = RequestNumberBlock.objects.using(using).filter(name=self.sequence)
+        with transaction.atomic(using=using):
+            updated = blocks.update(next_value=F('next_value') + self.block_size)
+            if not updated:
+                try:
+                    with transaction.atomic(using=using):
+                        RequestNumberBlock.objects.using(using).create(
+                            name=self.sequence, next_value=self.highest_issued() + 1 + self.block_size
+                        )
+                except IntegrityError:
+                    # Another worker created the row first
+                    blocks.update(next_value=F('next_value') + self.block_size)
+            end = blocks.values_list('next_value', flat=True).get()
+        return {'next': end - self.block_size, 'end': end}
+
+    def highest_issued(self):
+        """The highest number of this sequence already in use, so a new sequence carries on after it"""
+        from .models import ArchivedServiceRequest, ServiceRequest
+
+        pattern = rf'^{re.escape(self.prefix)}[0-9]{{{self.DIGITS}}}$'
+        highest = 0
+        for model in (ServiceRequest, ArchivedServiceRequest):
+            # Zero padded, so the highest string is the highest number
+            number = model.objects.filter(request_number__regex=pattern).aggregate(
+                highest=Max('request_number')
+            )['highest']
+            if number:
+                highest = max(highest, int(number[len(self.prefix):]))
+        return highest
+
+
+class SequenceRouter:
+    """Database router keeping RequestNumberBlock in the ``SEQUENCE_DATABASE``
+
+    Nothing else is read from, written to or migrated into that database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label == 'customer_service.RequestNumberBlock':
+            return settings.SEQUENCE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        is_block_table = app_label == 'customer_service' and model_name == 'requestnumberblock'
+        if db == settings.SEQUENCE_DATABASE:
+            return is_block_table
+        return False if is_block_table else None
+
+
+_generator = None
+
+
+def get_request_number_generator():
+    """Return the configured request number generator"""
+    global _generator
+    if _generator is None:
+        _generator = import_string(settings.REQUEST_NUMBER_GENERATOR)()
+    return _generator
+
+
+def next_request_number():
+    return get_request_number_generator().next_number()
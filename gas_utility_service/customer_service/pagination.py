@@ -0,0 +1,102 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class KeysetPage:
+    """A single page of results from keyset (cursor) pagination"""
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(obj):
+    """Encode the (created_at, id) position of a row as an opaque token"""
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token back into a (created_at, id) tuple
+
+    Returns None if the token is missing or malformed so that a stale or
+    hand-edited URL simply falls back to the first page.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def keyset_window(queryset, after, before, page_size):
+    """Return the query for one page and a function turning its rows into a KeysetPage"""
+    after = decode_cursor(after)
+    before = decode_cursor(before) if after is None else None
+
+    if before is not None:
+        created_at, pk = before
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        ).order_by('created_at', 'id')
+
+        def build(rows):
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            rows.reverse()
+            next_cursor = encode_cursor(rows[-1]) if rows else None
+            previous_cursor = encode_cursor(rows[0]) if rows and has_more else None
+            return KeysetPage(rows, next_cursor, previous_cursor)
+        return queryset[:page_size + 1], build
+
+    if after is not None:
+        created_at, pk = after
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        )
+
+    def build(rows):
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]) if rows and has_more else None
+        previous_cursor = encode_cursor(rows[0]) if rows and after is not None else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+    return queryset.order_by('-created_at', '-id')[:page_size + 1], build
+
+
+def paginate_keyset(queryset, after=None, before=None, page_size=25):
+    """Paginate a queryset newest-first on (created_at, id)
+
+    ``after`` returns the page following the given cursor and ``before`` the
+    page preceding it. Each page is fetched with a single indexed range query
+    of ``page_size + 1`` rows, so the cost does not depend on how deep into
+    the backlog the page is.
+    """
+    window, build = keyset_window(queryset, after, before, page_size)
+    return build(list(window))
+
+
+async def apaginate_keyset(queryset, after=None, before=None, page_size=25):
+    """Async version of ``paginate_keyset`` for async views"""
+    window, build = keyset_window(queryset, after, before, page_size)
+    return build([row async for row in window])
@@ -0,0 +1,201 @@
+"""
+Background post-processing of attachments.
+
+Submitting a request only stores the files; everything else (detecting the
+real content type, stripping EXIF metadata from photos, making thumbnails)
+runs afterwards on a local worker pool. RequestAttachment rows act as the
+persistent job table: a worker claims a pending row with a conditional
+UPDATE, so each attachment is processed once even with several processes,
+and rows left behind by a crash are picked up again by
+``process_attachments``.
+
+Image steps need Pillow and are skipped when it isn't installed.
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import RequestAttachment
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the file formats customers usually attach
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (8, b'WEBP', 'image/webp'),
+    (4, b'ftypheic', 'image/heic'),
+    (4, b'ftypqt', 'video/quicktime'),
+    (4, b'ftyp', 'video/mp4'),
+]
+
+THUMBNAIL_SIZE = (320, 320)
+
+_executor = None
+
+
+def sniff_content_type(head, filename):
+    """Identify a file from its first bytes, falling back to its extension"""
+    for offset, signature, content_type in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return content_type
+    guessed, _ = mimetypes.guess_type(filename)
+    return guessed or 'application/octet-stream'
+
+
+def strip_exif(attachment, image):
+    """Replace a photo carrying EXIF data (GPS position, camera serial) with a clean copy"""
+    from .uploads import store_blob
+    if not image.info.get('exif'):
+        return
+    clean = ImageOps.exif_transpose(image)
+    fd, path = tempfile.mkstemp(dir=settings.CHUNKED_UPLOAD_TEMP_DIR, suffix='.part')
+    with os.fdopen(fd, 'wb') as fh:
+        clean.save(fh, format=image.format)
+    with open(path, 'rb') as fh:
+        sha256 = hashlib.file_digest(fh, 'sha256').hexdigest()
+    blob = store_blob(path, sha256, os.path.getsize(path))
+    attachment.blob = blob
+    attachment.file.name = blob.file.name
+    attachment.size = blob.size
+
+
+def make_thumbnail(attachment, image):
+    """Save a small JPEG preview next to the attachment"""
+    preview = ImageOps.exif_transpose(image).convert('RGB')
+    preview.thumbnail(THUMBNAIL_SIZE)
+    buffer = io.BytesIO()
+    preview.save(buffer, format='JPEG', quality=80)
+    if attachment.thumbnail:
+        attachment.thumbnail.delete(save=False)
+    attachment.thumbnail.save('thumbnail.jpg', ContentFile(buffer.getvalue()), save=False)
+
+
+def run_steps(attachment):
+    """Run every post-processing step on an attachment, updating it in memory"""
+    with attachment.file.open('rb') as fh:
+        head = fh.read(32)
+    attachment.content_type = sniff_content_type(head, attachment.filename)
+    attachment.size = attachment.file.size
+
+    if Image is not None and attachment.content_type in ('image/jpeg', 'image/png', 'image/webp'):
+        os.makedirs(settings.CHUNKED_UPLOAD_TEMP_DIR, exist_ok=True)
+        with attachment.file.open('rb') as fh, Image.open(fh) as image:
+            image.load()
+            strip_exif(attachment, image)
+            make_thumbnail(attachment, image)
+
+
+def claim(attachment_id):
+    """Atomically mark a pending attachment as being processed by this worker"""
+    return RequestAttachment.objects.filter(pk=attachment_id, processing_status='pending').update(
+        processing_status='processing',
+        processing_started_at=timezone.now(),
+        processing_attempts=F('processing_attempts') + 1,
+    ) == 1
+
+
+def process_attachment(attachment_id):
+    """Claim and process one attachment, recording success or failure on the row"""
+    if not claim(attachment_id):
+        return False
+    attachment = RequestAttachment.objects.select_related('blob').get(pk=attachment_id)
+    try:
+        run_steps(attachment)
+    except Exception as exc:
+        logger.exception('Processing attachment %s failed', attachment_id)
+        # Put it back in the queue unless it has used up its attempts
+        retry = attachment.processing_attempts < settings.ATTACHMENT_PROCESSING_MAX_ATTEMPTS
+        attachment.processing_status = 'pending' if retry else 'failed'
+        attachment.processing_error = str(exc)
+        attachment.save(update_fields=['processing_status', 'processing_error'])
+        return False
+
+    attachment.processing_status = 'done'
+    attachment.processing_error = ''
+    attachment.processed_at = timezone.now()
+    attachment.save(update_fields=[
+        'processing_status', 'processing_error', 'processed_at', 'content_type', 'size',
+        'thumbnail', 'blob', 'file',
+    ])
+    return True
+
+
+def _run_in_worker(attachment_id):
+    close_old_connections()
+    try:
+        process_attachment(attachment_id)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ATTACHMENT_WORKERS,
+                                       thread_name_prefix='attachment-worker')
+    return _executor
+
+
+def schedule_processing(attachment_ids):
+    """Process attachments in the background once the current transaction commits
+
+    With ``ATTACHMENT_WORKERS = 0`` they are processed inline instead.
+    """
+    attachment_ids = list(attachment_ids)
+    if not attachment_ids:
+        return
+
+    def submit():
+        if settings.ATTACHMENT_WORKERS:
+            executor = get_executor()
+            for attachment_id in attachment_ids:
+                executor.submit(_run_in_worker, attachment_id)
+        else:
+            for attachment_id in attachment_ids:
+                process_attachment(attachment_id)
+
+    transaction.on_commit(submit)
+
+
+def process_backlog(stale_after=None, limit=None):
+    """Process pending attachments and those abandoned mid-way, returning how many succeeded
+
+    Rows stuck in 'processing' for longer than ``stale_after`` (a worker
+    died) are returned to the queue first.
+    """
+    stale_after = stale_after or timedelta(minutes=settings.ATTACHMENT_PROCESSING_TIMEOUT_MINUTES)
+    RequestAttachment.objects.filter(
+        processing_status='processing',
+        processing_started_at__lt=timezone.now() - stale_after,
+    ).update(processing_status=Case(
+        # Give up on attachments that keep killing their worker
+        When(processing_attempts__gte=settings.ATTACHMENT_PROCESSING_MAX_ATTEMPTS, then=Value('failed')),
+        default=Value('pending'),
+    ))
+
+    pending = RequestAttachment.objects.filter(processing_status='pending').order_by('id')
+    ids = pending.values_list('pk', flat=True)
+    if limit:
+        ids = ids[:limit]
+    return sum(1 for attachment_id in list(ids) if process_attachment(attachment_id))
+
@@ -0,0 +1,91 @@
+"""
+Process-local registry of service types.
+
+Service types change a few times a year but are shown on nearly every
+page, so each process keeps all of them in memory instead of querying or
+joining the table per request. The registry remembers the version token of
+the ``service_types`` scope it loaded under (see ``caching``); saving or
+deleting a service type replaces that token, and every process reloads the
+table the next time it notices the token has changed. Checking costs one
+cache lookup and no database queries.
+"""
+import threading
+
+from .caching import aget_versions, get_versions
+from .models import ServiceType
+
+SCOPE = ('service_types', 'all')
+
+
+class ServiceTypeRegistry:
+    """All service types by id, reloaded whenever the shared version token moves
+
+    The instances are shared between requests and threads, so callers must
+    treat them as read only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None
+        self._types = {}
+
+    def _store(self, token, types):
+        with self._lock:
+            self._token = token
+            self._types = {service_type.pk: service_type for service_type in types}
+        return self._types
+
+    def _load(self):
+        # Read the token before the rows, so a change made in between is
+        # seen as a new token on the next check and loaded then
+        token, = get_versions(SCOPE)
+        if token == self._token:
+            return self._types
+        return self._store(token, list(ServiceType.objects.order_by('pk')))
+
+    async def _aload(self):
+        token, = await aget_versions(SCOPE)
+        if token == self._token:
+            return self._types
+        return self._store(token, [service_type async for service_type in ServiceType.objects.order_by('pk')])
+
+    def clear(self):
+        """Forget the loaded types so the next lookup reloads them"""
+        with self._lock:
+            self._token = None
+            self._types = {}
+
+    def all(self):
+        return list(self._load().values())
+
+    def active(self):
+        """Service types customers can currently choose, in creation order"""
+        return [service_type for service_type in self._load().values() if service_type.is_active]
+
+    async def aactive(self):
+        return [service_type for service_type in (await self._aload()).values() if service_type.is_active]
+
+    def get(self, pk):
+        """The service type with id ``pk``, or None"""
+        return self._load().get(pk)
+
+    def attach(self, service_requests):
+        """Fill in ``service_type`` on each request from the registry instead of the database
+
+        Returns the requests, so it can wrap a queryset or page directly.
+        """
+        return self._attach(self._load(), service_requests)
+
+    async def aattach(self, service_requests):
+        return self._attach(await self._aload(), service_requests)
+
+    def _attach(self, types, service_requests):
+        for service_request in service_requests:
+            service_type = types.get(service_request.service_type_id)
+            # A type created after the last reload is left for Django to fetch
+            if service_type is not None:
+                service_request.service_type = service_type
+        return service_requests
+
+
+service_types = ServiceTypeRegistry()
@@ -0,0 +1,303 @@
+"""
+Full-text search index for service requests.
+
+Each backend keeps one index row per ServiceRequest covering the request
+number, the customer's username and email, and the description. Lookups hit
+the index instead of scanning the request table with LIKE clauses.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+INDEX_TABLE = 'customer_service_search_index'
+
+# Columns fed into the index, selected from the request and customer tables
+INDEX_SOURCE_SQL = """
+    SELECT sr.id, sr.request_number, u.username, u.email, sr.description
+    FROM customer_service_servicerequest sr
+    JOIN auth_user u ON u.id = sr.customer_id
+"""
+
+
+def within_sql(column, within):
+    """SQL and params restricting ``column`` to the ids of the ``within`` queryset, or None if it is empty"""
+    if within is None:
+        return '', []
+    try:
+        sql, params = within.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return f" AND {column} IN ({sql})", list(params)
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements
+
+    ``within`` is an optional ServiceRequest queryset the matches must also
+    belong to, so a capped search ranks only requests that pass the other
+    filters.
+    """
+
+    def create_index(self, cursor):
+        """Create the index storage"""
+
+    def drop_index(self, cursor):
+        """Drop the index storage"""
+
+    def index_requests(self, request_ids):
+        """Add or refresh the index rows for the given request ids"""
+
+    def remove_requests(self, request_ids):
+        """Remove the index rows for the given request ids"""
+
+    def rebuild(self):
+        """Repopulate the whole index from the request table"""
+
+    def match_sql(self, query, within=None):
+        """Return the SQL and params selecting the matching request ids, or None if nothing can match"""
+        raise NotImplementedError
+
+    def search(self, query, limit=None, within=None):
+        """Return matching request ids, best match first"""
+        raise NotImplementedError
+
+    def exceeds(self, query, limit, within=None):
+        """Whether ``query`` matches more requests than a search capped at ``limit`` returns"""
+        match = self.match_sql(query, within)
+        if match is None:
+            return False
+        sql, params = match
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM ({sql}) matches LIMIT 1 OFFSET %s", [*params, limit])
+            return cursor.fetchone() is not None
+
+    def filter_queryset(self, queryset, query, limit=None):
+        """Restrict a ServiceRequest queryset to the matches for ``query``
+
+        With a limit the best ``limit`` matches among ``queryset`` are kept.
+        Without one the matches are joined in as a subquery, so exports and
+        bulk updates covering every match never load the ids into memory.
+        """
+        if limit:
+            return queryset.filter(pk__in=self.search(query, limit=limit, within=queryset))
+        match = self.match_sql(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(*match))
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Fallback for databases without a native full-text index"""
+
+    def search(self, query, limit=None, within=None):
+        ids = self._matches(query, within).order_by('-created_at').values_list('pk', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    def filter_queryset(self, queryset, query, limit=None):
+        return queryset.filter(self._q(query))
+
+    def exceeds(self, query, limit, within=None):
+        return self._matches(query, within)[limit:limit + 1].exists()
+
+    def _matches(self, query, within):
+        from .models import ServiceRequest
+        return (ServiceRequest.objects.all() if within is None else within).filter(self._q(query))
+
+    def _q(self, query):
+        return (
+            Q(request_number__icontains=query) |
+            Q(customer__username__icontains=query) |
+            Q(customer__email__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 virtual table keyed by the request id"""
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            "request_number, username, email, description, tokenize='unicode61')"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+    def index_requests(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(request_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})", request_ids)
+            cursor.execute(
+                f"INSERT INTO {INDEX_TABLE} (rowid, request_number, username, email, description) "
+                f"{INDEX_SOURCE_SQL} WHERE sr.id IN ({placeholders})",
+                request_ids
+            )
+
+    def remove_requests(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(request_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})", request_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {INDEX_TABLE} (rowid, request_number, username, email, description) "
+                f"{INDEX_SOURCE_SQL}"
+            )
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+
+    def match_sql(self, query, within=None):
+        match = self._match_expression(query)
+        restriction = within_sql('rowid', within)
+        if not match or restriction is None:
+            return None
+        sql, params = restriction
+        return f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s{sql}", [match, *params]
+
+    def search(self, query, limit=None, within=None):
+        match = self.match_sql(query, within)
+        if match is None:
+            return []
+        sql, params = match
+        sql += " ORDER BY rank"
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _match_expression(self, query):
+        # Quote every term so user input can't inject FTS syntax, and make
+        # each one a prefix match so partial words typed into the box match
+        terms = [term.replace('"', '') for term in query.split()]
+        return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Postgres tsvector column with a GIN index, keyed by the request id
+
+    Documents and queries both use the 'simple' configuration: queries are
+    prefix matches on partly typed words, which stemmed lexemes in the
+    document would not reliably match.
+    """
+
+    CONFIG = 'simple'
+    DOCUMENT_SQL = (
+        f"setweight(to_tsvector('{CONFIG}', coalesce(sr.request_number, '')), 'A') || "
+        f"setweight(to_tsvector('{CONFIG}', coalesce(u.username, '') || ' ' || coalesce(u.email, '')), 'B') || "
+        f"setweight(to_tsvector('{CONFIG}', coalesce(sr.description, '')), 'C')"
+    )
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+            "request_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_idx "
+            f"ON {INDEX_TABLE} USING GIN (document)"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+    def _upsert_sql(self, where=''):
+        return (
+            f"INSERT INTO {INDEX_TABLE} (request_id, document) "
+            f"SELECT sr.id, {self.DOCUMENT_SQL} "
+            "FROM customer_service_servicerequest sr "
+            f"JOIN auth_user u ON u.id = sr.customer_id {where} "
+            "ON CONFLICT (request_id) DO UPDATE SET document = EXCLUDED.document"
+        )
+
+    def index_requests(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(self._upsert_sql('WHERE sr.id = ANY(%s)'), [request_ids])
+
+    def remove_requests(self, request_ids):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE request_id = ANY(%s)", [request_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {INDEX_TABLE}")
+            cursor.execute(self._upsert_sql())
+
+    def match_sql(self, query, within=None):
+        tsquery = self._tsquery(query)
+        restriction = within_sql('request_id', within)
+        if not tsquery or restriction is None:
+            return None
+        sql, params = restriction
+        return (
+            f"SELECT request_id FROM {INDEX_TABLE} WHERE document @@ to_tsquery('{self.CONFIG}', %s){sql}",
+            [tsquery, *params],
+        )
+
+    def search(self, query, limit=None, within=None):
+        tsquery = self._tsquery(query)
+        restriction = within_sql('request_id', within)
+        if not tsquery or restriction is None:
+            return []
+        restriction_sql, params = restriction
+        sql = (
+            f"SELECT request_id FROM {INDEX_TABLE}, to_tsquery('{self.CONFIG}', %s) q "
+            f"WHERE document @@ q{restriction_sql} ORDER BY ts_rank(document, q) DESC"
+        )
+        params = [tsquery, *params]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _tsquery(self, query):
+        # Strip tsquery operators and prefix-match every remaining word
+        terms = [re.sub(r'\W+', ' ', term).split() for term in query.split()]
+        return ' & '.join(f"{word}:*" for words in terms for word in words)
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend, picked by database engine by default"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        else:
+            backend_class = backend_for_vendor(connection.vendor)
+        _backend = backend_class()
+    return _backend
+
+
+def backend_for_vendor(vendor):
+    return BACKENDS.get(vendor, LikeSearchBackend)
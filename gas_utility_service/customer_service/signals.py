@@ -0,0 +1,169 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import CustomerProfile
+
+from .analytics import record_status_update
+from .assignment import adjust_workload, move_workload
+from .caching import bump_versions
+from .counters import adjust_counter, move_counter
+from .feed import publish_on_commit
+from .models import ServiceRequest, ServiceType, RequestAttachment, RequestStatusUpdate, RequestChange
+from .taskqueue import enqueue
+
+# User fields that are copied into the search index
+USER_INDEXED_FIELDS = {'username', 'email'}
+
+# ServiceRequest fields that decide which counter bucket a request is in
+COUNTER_FIELDS = {'status', 'priority', 'service_type', 'service_type_id'}
+
+# ServiceRequest fields that decide whose workload a request counts towards, and how much
+WORKLOAD_FIELDS = {'status', 'priority', 'assigned_to', 'assigned_to_id'}
+
+
+@receiver(post_save, sender=ServiceRequest)
+def update_request_counters(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Keep the per-bucket request counters in step with a saved request"""
+    if raw:
+        return
+    if created:
+        adjust_counter(instance.counter_key, 1)
+    elif update_fields is None or COUNTER_FIELDS.intersection(update_fields):
+        loaded_key = getattr(instance, '_loaded_counter_key', None)
+        if loaded_key is not None:
+            move_counter(loaded_key, instance.counter_key)
+    instance._loaded_counter_key = instance.counter_key
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def decrement_request_counters(sender, instance, **kwargs):
+    """Remove a deleted request from its counter bucket"""
+    adjust_counter(getattr(instance, '_loaded_counter_key', instance.counter_key), -1)
+
+
+@receiver(post_save, sender=ServiceRequest)
+def update_staff_workload(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Keep the assigned staff member's open count and load in step with a saved request"""
+    if raw:
+        return
+    if created:
+        if instance.workload_key is not None:
+            adjust_workload(instance.workload_key, 1)
+    elif update_fields is None or WORKLOAD_FIELDS.intersection(update_fields):
+        if hasattr(instance, '_loaded_workload_key'):
+            move_workload(instance._loaded_workload_key, instance.workload_key)
+    instance._loaded_workload_key = instance.workload_key
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def release_staff_workload(sender, instance, **kwargs):
+    """Take a deleted request off its staff member's workload"""
+    key = getattr(instance, '_loaded_workload_key', instance.workload_key)
+    if key is not None:
+        adjust_workload(key, -1)
+
+
+@receiver(post_save, sender=ServiceRequest)
+def index_service_request(sender, instance, **kwargs):
+    """Refresh the search index row for a saved request"""
+    enqueue('search.index_requests', request_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def unindex_service_request(sender, instance, **kwargs):
+    """Drop the search index row for a deleted request"""
+    enqueue('search.remove_requests', request_ids=[instance.pk])
+
+
+@receiver(post_save, sender=ServiceRequest)
+def detect_duplicate_requests(sender, instance, created, raw=False, **kwargs):
+    """Sign new requests and file them with any likely duplicates"""
+    if created and not raw:
+        enqueue('duplicates.index_requests', request_ids=[instance.pk])
+
+
+@receiver(post_save, sender=User)
+def reindex_customer_requests(sender, instance, created, update_fields=None, **kwargs):
+    """Refresh the index rows of a customer's requests when their name or email changes"""
+    if created:
+        return
+    # Logins save only last_login, which isn't indexed
+    if update_fields is not None and not USER_INDEXED_FIELDS.intersection(update_fields):
+        return
+    enqueue('search.index_customer', user_id=instance.pk)
+
+
+@receiver(post_save, sender=ServiceRequest)
+def log_request_created(sender, instance, created, raw=False, **kwargs):
+    """Record new requests for the live dashboard feed"""
+    if created and not raw:
+        RequestChange.objects.create(kind='created', service_request=instance, new_status=instance.status)
+        publish_on_commit()
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+def log_status_change(sender, instance, created, raw=False, **kwargs):
+    """Record status changes for the live dashboard feed"""
+    # The first update of a new request is already covered by its 'created' entry
+    if created and not raw and instance.previous_status:
+        RequestChange.objects.create(
+            kind='status', service_request_id=instance.service_request_id,
+            previous_status=instance.previous_status, new_status=instance.new_status,
+        )
+        publish_on_commit()
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+def update_sla_analytics(sender, instance, created, raw=False, **kwargs):
+    """Time each status change and add it to the daily SLA rollups"""
+    if created and not raw:
+        record_status_update(instance)
+
+
+@receiver(post_save, sender=ServiceRequest)
+@receiver(post_delete, sender=ServiceRequest)
+def invalidate_request_fragments(sender, instance, **kwargs):
+    """Expire cached pages showing a request that changed"""
+    bump_versions(('customer', instance.customer_id), ('request', instance.request_number))
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+@receiver(post_delete, sender=RequestStatusUpdate)
+@receiver(post_save, sender=RequestAttachment)
+@receiver(post_delete, sender=RequestAttachment)
+def invalidate_request_child_fragments(sender, instance, **kwargs):
+    """Expire cached pages showing the request a status update or attachment belongs to"""
+    if sender.service_request.field.is_cached(instance):
+        service_request = instance.service_request
+        keys = (service_request.customer_id, service_request.request_number)
+    else:
+        keys = (ServiceRequest.objects.filter(pk=instance.service_request_id)
+                .values_list('customer_id', 'request_number').first())
+    # Nothing to do when the request itself is being deleted; its own handler covers it
+    if keys:
+        customer_id, request_number = keys
+        bump_versions(('customer', customer_id), ('request', request_number))
+
+
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_delete, sender=CustomerProfile)
+def invalidate_profile_fragments(sender, instance, **kwargs):
+    """Expire cached pages showing a customer's profile"""
+    bump_versions(('customer', instance.user_id), ('profile', instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_fragments(sender, instance, update_fields=None, **kwargs):
+    """Expire cached pages showing a customer's name or email"""
+    # Logins save only last_login, which no page shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_versions(('customer', instance.pk), ('profile', instance.pk))
+
+
+@receiver(post_save, sender=ServiceType)
+@receiver(post_delete, sender=ServiceType)
+def invalidate_service_type_fragments(sender, instance, **kwargs):
+    """Expire every cached page showing service type names"""
+    bump_versions(('service_types', 'all'))
@@ -0,0 +1,192 @@
+"""
+A small database-backed task queue for side effects of write requests.
+
+Views call ``enqueue()`` inside their transaction, so a task exists exactly
+when the change that caused it was committed, and return without waiting
+for notifications or index updates. ``runworker`` processes claim due tasks
+(with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it),
+run them on a pool of threads, and retry failures with exponential backoff.
+
+With ``TASK_QUEUE_EAGER`` enabled, tasks run in the process that enqueues
+them instead, as soon as its transaction commits, so nothing is lost when no
+worker is running. A task that fails there is logged and dropped; it never
+rolls back the change that queued it.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Registered task functions, keyed by task name
+registry = {}
+
+
+def task(name, max_attempts=None):
+    """Register a function as a task that can be enqueued by ``name``
+
+    Task functions take JSON-serializable keyword arguments.
+    """
+    def decorator(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, run_at=None, **payload):
+    """Queue task ``name`` with ``payload`` as its keyword arguments"""
+    func = registry[name]
+    if settings.TASK_QUEUE_EAGER:
+        transaction.on_commit(lambda: run_eagerly(name, func, payload))
+        return None
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=func.max_attempts or settings.TASK_MAX_ATTEMPTS,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def run_eagerly(name, func, payload):
+    """Run a task in-process after commit, logging rather than raising failures"""
+    try:
+        func(**payload)
+    except Exception:
+        logger.exception('Task %s failed while running eagerly', name)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt: exponential backoff with jitter"""
+    delay = min(settings.TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.TASK_RETRY_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_tasks(worker_id, limit=1):
+    """Mark up to ``limit`` due tasks as running for ``worker_id`` and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Task.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Rows another worker is claiming are skipped instead of waited on
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # Without row locks (SQLite) the status condition keeps claims exclusive
+        Task.objects.filter(pk__in=ids, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(pk__in=ids, status='running', locked_by=worker_id, locked_at=now))
+
+
+def run_task(task):
+    """Run a claimed task, deleting it on success and rescheduling or failing it on error"""
+    func = registry.get(task.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {task.name!r}')
+        func(**task.payload)
+    except Exception as exc:
+        logger.exception('Task %s (%s) failed on attempt %s', task.pk, task.name, task.attempts)
+        task.last_error = f'{type(exc).__name__}: {exc}'
+        task.locked_by = ''
+        task.locked_at = None
+        if task.attempts < task.max_attempts:
+            task.status = 'queued'
+            task.run_at = timezone.now() + timedelta(seconds=retry_delay(task.attempts))
+        else:
+            task.status = 'failed'
+        task.save(update_fields=['status', 'run_at', 'last_error', 'locked_by', 'locked_at', 'updated_at'])
+        return False
+    task.delete()
+    return True
+
+
+def requeue_stale_tasks(timeout=None):
+    """Put back tasks whose worker stopped while running them, returning how many"""
+    timeout = timeout or timedelta(seconds=settings.TASK_LOCK_TIMEOUT_SECONDS)
+    return Task.objects.filter(status='running', locked_at__lt=timezone.now() - timeout).update(
+        status='queued', locked_by='', locked_at=None,
+    )
+
+
+class Worker:
+    """Run queued tasks on ``concurrency`` threads until stopped
+
+    Each thread claims ``batch_size`` tasks at a time and sleeps for
+    ``poll_interval`` seconds when the queue is empty. With ``once`` the
+    worker exits as soon as the queue is drained.
+    """
+
+    def __init__(self, concurrency=1, batch_size=1, poll_interval=1.0, once=False):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.once = once
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        requeue_stale_tasks()
+        if self.concurrency == 1:
+            # A single worker needs no extra threads
+            try:
+                self.work(0)
+            except KeyboardInterrupt:
+                pass
+            return
+        threads = [
+            threading.Thread(target=self._work_in_thread, args=(index,), name=f'task-worker-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # Let running tasks finish; anything claimed but not started is requeued later
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def _work_in_thread(self, index):
+        try:
+            self.work(index)
+        finally:
+            connection.close()
+
+    def work(self, index):
+        worker_id = f'{self.name}:{index}'
+        while not self.stopping.is_set():
+            close_old_connections()
+            tasks = claim_tasks(worker_id, self.batch_size)
+            if not tasks:
+                if self.once:
+                    return
+                self.stopping.wait(self.poll_interval)
+                continue
+            for claimed in tasks:
+                succeeded = run_task(claimed)
+                with self._lock:
+                    self.processed += 1
+                    self.failed += not succeeded
@@ -0,0 +1,102 @@
+"""
+Background tasks queued by views and signal handlers.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mail, send_mass_mail
+from django.urls import reverse
+
+from . import duplicates
+from .models import ServiceRequest, RequestStatusUpdate
+from .search import get_search_backend
+from .taskqueue import task
+
+
+@task('search.index_requests')
+def index_requests(request_ids):
+    """Refresh the search index rows of the given requests"""
+    get_search_backend().index_requests(request_ids)
+
+
+@task('search.remove_requests')
+def remove_requests(request_ids):
+    """Drop the search index rows of deleted requests"""
+    get_search_backend().remove_requests(request_ids)
+
+
+@task('search.index_customer')
+def index_customer(user_id):
+    """Refresh the index rows of every request belonging to a customer"""
+    get_search_backend().index_requests(
+        ServiceRequest.objects.filter(customer_id=user_id).values_list('pk', flat=True)
+    )
+
+
+@task('duplicates.index_requests')
+def index_duplicates(request_ids):
+    """Sign new requests and group them with the requests they duplicate"""
+    duplicates.index_requests(request_ids)
+
+
+@task('notifications.request_created')
+def notify_request_created(request_id):
+    """Confirm a new service request to the customer"""
+    service_request = ServiceRequest.objects.select_related('customer', 'service_type').filter(pk=request_id).first()
+    if service_request is None or not service_request.customer.email:
+        return
+    send_mail(
+        f'We received your request {service_request.request_number}',
+        f'Thank you for contacting us about {service_request.service_type.name}. '
+        f'Your reference number is {service_request.request_number}.\n\n'
+        f'You can follow its progress at {reverse("request_detail", args=[service_request.request_number])}',
+        settings.DEFAULT_FROM_EMAIL,
+        [service_request.customer.email],
+    )
+
+
+def status_changed_message(update):
+    """(subject, body, from, recipients) telling the customer about a status update"""
+    service_request = update.service_request
+    body = f'Your request {service_request.request_number} is now {update.get_new_status_display().lower()}.'
+    if update.notes:
+        body += f'\n\n{update.notes}'
+    return (
+        f'Update on request {service_request.request_number}',
+        body,
+        settings.DEFAULT_FROM_EMAIL,
+        [service_request.customer.email],
+    )
+
+
+@task('notifications.status_changed')
+def notify_status_changed(status_update_id):
+    """Tell the customer their request moved to a new status"""
+    update = RequestStatusUpdate.objects.select_related('service_request__customer').filter(pk=status_update_id).first()
+    if update is None or not update.service_request.customer.email:
+        return
+    send_mail(*status_changed_message(update))
+
+
+@task('notifications.statuses_changed')
+def notify_statuses_changed(status_update_ids):
+    """Tell the customers of many requests moved together, over one mail connection"""
+    updates = RequestStatusUpdate.objects.select_related('service_request__customer').filter(pk__in=status_update_ids)
+    send_mass_mail([status_changed_message(update) for update in updates if update.service_request.customer.email])
+
+
+@task('notifications.request_assigned')
+def notify_request_assigned(request_id, assigned_by_id=None):
+    """Let a staff member know a request was assigned to them"""
+    service_request = ServiceRequest.objects.select_related('assigned_to', 'service_type').filter(pk=request_id).first()
+    if service_request is None or service_request.assigned_to is None or not service_request.assigned_to.email:
+        return
+    assigned_by = User.objects.filter(pk=assigned_by_id).first()
+    send_mail(
+        f'Request {service_request.request_number} assigned to you',
+        f'{assigned_by.username if assigned_by else "Someone"} assigned you '
+        f'{service_request.service_type.name} request {service_request.request_number} '
+        f'({service_request.get_priority_display()} priority).\n\n'
+        f'{reverse("support_request_detail", args=[service_request.request_number])}',
+        settings.DEFAULT_FROM_EMAIL,
+        [service_request.assigned_to.email],
+    )
@@ -1,8 +1,56 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.db.models import F, Sum
 from django.urls import reverse
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
 from django.contrib.auth.models import User
-from .models import ServiceType, ServiceRequest
+from .models import (
+    ServiceType, ServiceRequest, RequestStatusUpdate, RequestAttachment, AttachmentBlob, Task,
+    RequestChange, RequestNumberBlock, ArchivedServiceRequest, RequestTiming, SLARollup, StaffWorkload,
+    IncidentCluster, RequestSignature, SignatureBand, UploadSession,
+)
+from .analytics import bucket_bounds, bucket_for, estimate_percentile, replay_history, sla_report
+from .archive import archivable_requests, archive_batch, archive_requests, restore_request
+from .assignment import (
+    AssignmentEngine, assign_requests, get_engine, reconcile_workloads, reset_engine, simulate,
+)
+from .benchmark import benchmark_targets, run_in_process, run_over_http
+from .caching import fragment_stats, get_cache as get_fragment_cache
+from .counters import reconcile_counters, status_counts
+from .duplicates import address_tokens, duplicates_of, index_requests
+from .feed import publish_changes
+from .filters import filter_requests, search_truncated
+from .importer import Checkpoint
+from .incidents import bulk_transition
+from .management.commands.benchmark_writes import Command as BenchmarkWritesCommand
+from .uploads import (
+    OffsetMismatch, append_chunk, attach_blob, blob_from_uploaded_file, partial_path, start_upload,
+)
+from .workqueue import claim_next_request, queue
+from .processing import Image, process_attachment
+from .numbering import BlockRequestNumberGenerator, TimeOrderedRequestNumberGenerator
+from .registry import service_types
+from .search import INDEX_TABLE, get_search_backend
+from .taskqueue import claim_tasks, enqueue, run_task
+from .transitions import InvalidTransition, TransitionConflict, apply_changes
 from accounts.models import CustomerProfile
+from gas_utility.testing import QueryBudgetMixin
 
 class CustomerServiceTestCase(TestCase):
     def setUp(self):
@@ -52,3 +100,1672 @@ class CustomerServiceTestCase(TestCase):
         response = self.client.get(reverse('request_detail', args=[self.service_request.request_number]))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'I smell gas in my kitchen')
+
+
+class SupportDashboardPaginationTestCase(TestCase):
+    def setUp(self):
+        # Create a staff user to view the dashboard
+        self.staff = User.objects.create_user(
+            username='staffuser',
+            password='staffpassword123',
+            is_staff=True
+        )
+        self.service_type = ServiceType.objects.create(
+            name='Gas Leak',
+            description='Report a gas leak',
+            is_active=True
+        )
+        
+        # Create a handful of customers each with a request
+        for i in range(7):
+            customer = User.objects.create_user(username=f'customer{i}', password='testpassword123')
+            CustomerProfile.objects.create(
+                user=customer,
+                account_number=f'ACC{i:05d}',
+                address=f'{i} Test Street',
+                phone_number='555-0000'
+            )
+            ServiceRequest.objects.create(
+                customer=customer,
+                service_type=self.service_type,
+                description=f'Request {i}',
+                assigned_to=self.staff
+            )
+        self.client.login(username='staffuser', password='staffpassword123')
+    
+    def test_pages_cover_all_requests_once(self):
+        """Following next cursors visits every request exactly once, newest first"""
+        url = reverse('support_dashboard')
+        seen = []
+        response = self.client.get(url, {'page_size': 3})
+        while True:
+            page = response.context['page']
+            seen.extend(r.pk for r in page)
+            if not page.has_next:
+                break
+            response = self.client.get(url, {'page_size': 3, 'after': page.next_cursor})
+        
+        expected = list(ServiceRequest.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        
+        # Stepping back from the last page returns the page before it
+        response = self.client.get(url, {'page_size': 3, 'before': page.previous_cursor})
+        self.assertEqual([r.pk for r in response.context['page']], expected[3:6])
+    
+    def test_query_count_independent_of_rows(self):
+        """Rendering a page does not issue per-row queries"""
+        url = reverse('support_dashboard')
+        # Session, user, live feed cursor, page of requests and stats; service
+        # types come from the already loaded registry
+        service_types.all()
+        with self.assertNumQueries(5):
+            self.client.get(url, {'page_size': 7})
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class SearchIndexTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='meterfan', email='meter@example.com')
+        self.service_type = ServiceType.objects.create(name='Meter Reading', description='Meter issues')
+        # Index updates are queued until the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leak = ServiceRequest.objects.create(
+                customer=self.user,
+                service_type=self.service_type,
+                description='Strong odour of gas near the basement boiler'
+            )
+            self.meter = ServiceRequest.objects.create(
+                customer=self.user,
+                service_type=self.service_type,
+                description='Meter display is blank'
+            )
+        self.backend = get_search_backend()
+    
+    def test_search_matches_prefixes_across_fields(self):
+        """Partial words match descriptions, request numbers and customer details"""
+        self.assertEqual(self.backend.search('basem boil'), [self.leak.pk])
+        self.assertIn(self.meter.pk, self.backend.search(self.meter.request_number))
+        self.assertCountEqual(self.backend.search('meterfan'), [self.leak.pk, self.meter.pk])
+    
+    def test_index_follows_saves_and_deletes(self):
+        """Saving and deleting requests or customers keeps the index in sync"""
+        self.user.email = 'renamed@example.org'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertCountEqual(self.backend.search('renamed'), [self.leak.pk, self.meter.pk])
+        self.assertEqual(self.backend.search('meter@example'), [])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meter.delete()
+        self.assertEqual(self.backend.search('renamed'), [self.leak.pk])
+    
+    def test_unlimited_filter_uses_a_subquery(self):
+        """Filtering without a limit matches inside the query instead of loading the ids first"""
+        queryset = ServiceRequest.objects.all()
+        with self.assertNumQueries(0):
+            matches = self.backend.filter_queryset(queryset, 'meterfan')
+        self.assertIn(INDEX_TABLE, str(matches.query))
+        with self.assertNumQueries(1):
+            self.assertCountEqual(matches.values_list('pk', flat=True), [self.leak.pk, self.meter.pk])
+        self.assertFalse(self.backend.filter_queryset(queryset, '"').exists())
+    
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_capped_search_reports_truncation(self):
+        """The dashboard and API say when a search matched more requests than they list"""
+        self.assertTrue(self.backend.exceeds('meterfan', 1))
+        self.assertFalse(self.backend.exceeds('meterfan', 2))
+        self.assertFalse(self.backend.exceeds('blank', 1))
+        
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('support_dashboard'), {'search': 'meterfan'})
+        self.assertContains(response, 'Only the 1 best matches')
+        response = self.client.get(reverse('support_dashboard'), {'search': 'blank'})
+        self.assertNotContains(response, 'best matches')
+        
+        response = self.client.get(reverse('api_support_request_list'), {'search': 'meterfan'})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response['X-Search-Truncated'], '1')
+        response = self.client.get(reverse('api_support_request_list'), {'search': 'blank'})
+        self.assertNotIn('X-Search-Truncated', response)
+    
+    def test_capped_search_ranks_within_the_other_filters(self):
+        """A capped search keeps the best matches among requests passing the status and date filters"""
+        ServiceRequest.objects.filter(pk=self.meter.pk).update(status='completed')
+        queryset = ServiceRequest.objects.all()
+        for status, expected in (('pending', self.leak.pk), ('completed', self.meter.pk)):
+            matches = filter_requests(queryset, search='meterfan', status=status, search_limit=1)
+            self.assertEqual(list(matches.values_list('pk', flat=True)), [expected])
+            self.assertFalse(search_truncated(queryset, search='meterfan', status=status, search_limit=1))
+        self.assertTrue(search_truncated(queryset, search='meterfan', search_limit=1))
+        self.assertFalse(filter_requests(queryset, search='meterfan', date_to='2000-01-01', search_limit=1).exists())
+        self.assertFalse(filter_requests(queryset.none(), search='meterfan', search_limit=1).exists())
+    
+    def test_rebuild_command(self):
+        """The rebuild command repopulates an emptied index"""
+        self.backend.remove_requests([self.leak.pk, self.meter.pk])
+        self.assertEqual(self.backend.search('blank'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.backend.search('blank'), [self.meter.pk])
+
+
+class RequestCounterTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', password='testpassword123')
+        self.staff = User.objects.create_user(username='staffuser', password='staffpassword123', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Report a gas leak')
+    
+    def test_counters_follow_request_lifecycle(self):
+        """Creating, updating and deleting requests keeps the status counts exact"""
+        first = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type, description='One')
+        ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type, description='Two')
+        self.assertEqual(status_counts(), {'pending': 2})
+        
+        # Status changes through the staff view move the request between buckets
+        self.client.login(username='staffuser', password='staffpassword123')
+        self.client.post(reverse('support_request_detail', args=[first.request_number]), {
+            'new_status': 'in_progress',
+            'notes': 'On our way',
+            'version': first.version,
+        })
+        self.assertEqual(status_counts(), {'pending': 1, 'in_progress': 1})
+        
+        ServiceRequest.objects.get(pk=first.pk).delete()
+        self.assertEqual(status_counts(), {'pending': 1})
+    
+    def test_reconcile_repairs_drift(self):
+        """The reconcile command rewrites counters that disagree with the request table"""
+        ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type, description='One')
+        # Bypass signals so the counters drift
+        ServiceRequest.objects.update(status='completed')
+        
+        call_command('reconcile_request_counters', stdout=StringIO())
+        self.assertEqual(status_counts(), {'completed': 1})
+        self.assertEqual(reconcile_counters(), [])
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Every customer service view runs a fixed number of queries however much data exists"""
+    
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', first_name='Casey', last_name='Customer')
+        CustomerProfile.objects.create(user=self.customer, account_number='ACC00000',
+                                       address='1 Test Street', phone_number='555-0000')
+        self.staff = User.objects.create_user(username='staffuser', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Report a gas leak')
+        self.service_request = ServiceRequest.objects.create(
+            customer=self.customer, service_type=self.service_type, description='Fixed request'
+        )
+        self.seeded = 0
+    
+    def seed(self, n):
+        """Add n more of every kind of row the views display"""
+        for _ in range(n):
+            self.seeded += 1
+            i = self.seeded
+            staff = User.objects.create_user(username=f'staff{i}', first_name='Staff', is_staff=True)
+            other = User.objects.create_user(username=f'other{i}', first_name='Other')
+            CustomerProfile.objects.create(user=other, account_number=f'ACC{i:05d}',
+                                           address=f'{i} Test Street', phone_number='555-0000')
+            service_type = ServiceType.objects.create(name=f'Type {i}', description='Seeded type')
+            for customer in (self.customer, other):
+                ServiceRequest.objects.create(customer=customer, service_type=service_type,
+                                              description=f'Seeded request {i}', assigned_to=staff)
+            RequestStatusUpdate.objects.create(service_request=self.service_request, previous_status='pending',
+                                               new_status='in_progress', updated_by=staff, notes=f'Update {i}')
+            RequestAttachment.objects.create(service_request=self.service_request,
+                                             file=f'request_attachments/seed{i}.txt', filename=f'seed{i}.txt')
+    
+    def test_customer_views(self):
+        self.client.force_login(self.customer)
+        number = self.service_request.request_number
+        self.assertConstantQueries(reverse('request_list'), self.seed)
+        self.assertConstantQueries(reverse('create_request'), self.seed)
+        self.assertConstantQueries(reverse('request_detail', args=[number]), self.seed)
+    
+    def test_staff_views(self):
+        self.client.force_login(self.staff)
+        number = self.service_request.request_number
+        self.assertConstantQueries(reverse('support_dashboard'), self.seed)
+        self.assertConstantQueries(reverse('support_request_detail', args=[number]), self.seed)
+        self.assertConstantQueries(reverse('update_request', args=[number]), self.seed)
+    
+    def test_query_budgets(self):
+        self.seed(5)
+        self.client.force_login(self.staff)
+        self.assertQueryBudget(reverse('support_dashboard'), 5)
+        self.client.force_login(self.customer)
+        self.assertQueryBudget(reverse('request_list'), 3)
+
+
+class SyntheticDataTestCase(TestCase):
+    def test_generate_data_and_benchmark(self):
+        """Generated data is consistent and every benchmarked page renders"""
+        call_command('generate_data', customers=5, requests=40, staff=2, batch_size=16, seed=1, stdout=StringIO())
+        self.assertEqual(ServiceRequest.objects.count(), 40)
+        self.assertEqual(ServiceRequest.objects.filter(status_updates__previous_status='').count(), 40)
+        self.assertEqual(reconcile_counters(), [])
+        
+        _, _, targets = benchmark_targets()
+        results = run_in_process(targets, iterations=2, warmup=0)
+        self.assertEqual(len(results), len(targets))
+        for row in results:
+            self.assertEqual(row['errors'], 0, row['name'])
+            self.assertGreater(row['queries'], 0)
+
+    
+    def test_http_benchmark_records_error_responses(self):
+        """Pages answering with an error status are timed and counted instead of ending the run"""
+        class FailingHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(500)
+                self.send_header('X-Query-Count', '3')
+                self.end_headers()
+                self.wfile.write(b'Server Error')
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FailingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        
+        user = User.objects.create_user(username='customer')
+        row, = run_over_http([('broken', '/broken/', user)], iterations=3,
+                             base_url=f'http://127.0.0.1:{server.server_port}', warmup=1)
+        self.assertEqual((row['requests'], row['errors'], row['queries'], row['bytes']), (3, 3, 3, 12))
+        self.assertGreater(row['p50_ms'], 0)
+    
+    def test_write_benchmark(self):
+        """The write benchmark submits requests through the create view and reports throughput"""
+        result = BenchmarkWritesCommand().measure(1, 3)
+        self.assertEqual((result['requests'], result['errors']), (3, 0))
+        self.assertEqual(ServiceRequest.objects.filter(description='Write benchmark request').count(), 3)
+    
+    def test_write_benchmark_uses_a_throwaway_database(self):
+        """Each profile is benchmarked in a database of its own that is dropped afterwards"""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            call_command('benchmark_writes', profiles='sqlite', submitters=1, requests=2, output=output,
+                         stdout=StringIO())
+            with open(output) as fh:
+                result, = json.load(fh)['results']
+        self.assertEqual((result['requests'], result['errors']), (2, 0))
+        self.assertFalse(ServiceType.objects.filter(name='Write Benchmark').exists())
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staffuser', is_staff=True)
+        self.customer = User.objects.create_user(username='customer', email='customer@example.com')
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Report a gas leak')
+        self.pending = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                     description='Smell of gas, "urgent"')
+        self.completed = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                       description='Meter fixed', status='completed')
+        RequestStatusUpdate.objects.create(service_request=self.completed, previous_status='pending',
+                                           new_status='completed', updated_by=self.staff, notes='Done')
+    
+    def test_streams_csv_with_filters(self):
+        """The export endpoint streams CSV honouring the dashboard filters"""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_requests'), {'status': 'completed'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['request_number'] for row in rows], [self.completed.request_number])
+        self.assertEqual(json.loads(rows[0]['status_history'])[0]['notes'], 'Done')
+    
+    def test_export_requires_staff(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('export_requests'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_command_writes_ndjson(self):
+        out = StringIO()
+        call_command('export_requests', format='ndjson', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['request_number'] for r in records],
+                         [self.pending.request_number, self.completed.request_number])
+        self.assertEqual(records[0]['description'], 'Smell of gas, "urgent"')
+
+
+class LegacyImportTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+    
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+        return path
+    
+    def test_import_customers_and_tickets(self):
+        """Customers and tickets import with original timestamps, history, counters and search"""
+        customers = self.write('customers.csv',
+            'username,email,first_name,last_name,account_number,address,phone_number,date_joined\n'
+            'alice,alice@example.com,Alice,Able,L0001,1 Old Road,555-0001,2019-03-01T09:00:00+00:00\n'
+            'bob,bob@example.com,Bob,Baker,L0002,2 Old Road,555-0002,2019-04-01T09:00:00+00:00\n')
+        tickets = self.write('tickets.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'request_number': 'LEGACY-1', 'customer': 'alice', 'service_type': 'Gas Leak',
+             'status': 'completed', 'priority': 'high', 'description': 'Legacy leak report',
+             'created_at': '2020-01-02T10:00:00+00:00', 'updated_at': '2020-01-03T10:00:00+00:00',
+             'status_history': [
+                 {'previous_status': '', 'new_status': 'pending', 'created_at': '2020-01-02T10:00:00+00:00'},
+                 {'previous_status': 'pending', 'new_status': 'completed', 'updated_by': 'bob',
+                  'created_at': '2020-01-03T10:00:00+00:00'},
+             ]},
+            {'request_number': 'LEGACY-2', 'customer': 'bob', 'service_type': 'Old Type',
+             'description': 'Retired service type'},
+        ]))
+        
+        call_command('import_legacy', 'customers', customers, stdout=StringIO())
+        call_command('import_legacy', 'tickets', tickets, chunk_size=1, stdout=StringIO())
+        # Importing again skips everything already present
+        call_command('import_legacy', 'tickets', tickets, stdout=StringIO())
+        
+        self.assertEqual(CustomerProfile.objects.get(user__username='bob').account_number, 'L0002')
+        leak = ServiceRequest.objects.get(request_number='LEGACY-1')
+        self.assertEqual(leak.created_at.year, 2020)
+        self.assertEqual(leak.status_updates.count(), 2)
+        self.assertFalse(ServiceType.objects.get(name='Old Type').is_active)
+        self.assertEqual(ServiceRequest.objects.count(), 2)
+        self.assertEqual(status_counts(), {'completed': 1, 'pending': 1})
+        self.assertEqual(get_search_backend().search('legacy leak'), [leak.pk])
+        # Imported history counts in the SLA reports without a separate backfill
+        self.assertEqual(SLARollup.objects.get(metric='resolution').count, 1)
+        self.assertFalse(os.path.exists(tickets + '.checkpoint'))
+    
+    def test_resumes_from_checkpoint(self):
+        """Records committed by an earlier run are skipped when resuming"""
+        User.objects.create_user(username='alice')
+        tickets = self.write('tickets.csv',
+            'request_number,customer,service_type,description\n'
+            'LEGACY-1,alice,Gas Leak,First\n'
+            'LEGACY-2,alice,Gas Leak,Second\n')
+        Checkpoint(tickets + '.checkpoint').save(1)
+        call_command('import_legacy', 'tickets', tickets, stdout=StringIO())
+        self.assertEqual(list(ServiceRequest.objects.values_list('request_number', flat=True)), ['LEGACY-2'])
+
+
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(self.tmpdir.name, 'tmp'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='customer')
+        self.service_type = ServiceType.objects.create(name='Meter Reading', description='Meter issues')
+        self.client.force_login(self.user)
+    
+    def upload(self, content, chunk=4):
+        """Upload ``content`` in chunks and return the finalize response data"""
+        start = self.client.post(reverse('upload_start'), {'filename': 'meter.jpg', 'size': len(content)}).json()
+        url = reverse('upload_chunk', args=[start['upload_id']])
+        offset = 0
+        while offset < len(content):
+            response = self.client.patch(url, content[offset:offset + chunk], content_type='application/octet-stream',
+                                         headers={'Upload-Offset': str(offset)})
+            offset = response.json()['offset']
+        return self.client.post(reverse('upload_finalize', args=[start['upload_id']])).json()
+    
+    def test_resume_after_offset_mismatch(self):
+        """A chunk sent at the wrong offset is rejected with the offset to resume from"""
+        start = self.client.post(reverse('upload_start'), {'filename': 'meter.jpg', 'size': 10}).json()
+        url = reverse('upload_chunk', args=[start['upload_id']])
+        self.client.patch(url, b'01234', content_type='application/octet-stream', headers={'Upload-Offset': '0'})
+        
+        response = self.client.patch(url, b'89', content_type='application/octet-stream', headers={'Upload-Offset': '8'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+        
+        # Incomplete uploads can't be finalized
+        response = self.client.post(reverse('upload_finalize', args=[start['upload_id']]))
+        self.assertEqual(response.status_code, 400)
+        
+        self.client.patch(url, b'56789', content_type='application/octet-stream', headers={'Upload-Offset': '5'})
+        data = self.client.post(reverse('upload_finalize', args=[start['upload_id']])).json()
+        self.assertEqual(data['sha256'], hashlib.sha256(b'0123456789').hexdigest())
+    
+    def test_identical_uploads_share_a_blob(self):
+        """Uploading the same contents twice stores one blob used by both attachments"""
+        content = b'photo of the gas meter' * 3
+        first = self.upload(content)
+        second = self.upload(content)
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+        
+        response = self.client.post(reverse('create_request'), {
+            'service_type': self.service_type.pk,
+            'description': 'Meter photos attached',
+            'priority': 'low',
+            'upload_ids': [first['upload_id'], second['upload_id']],
+        })
+        self.assertEqual(response.status_code, 302)
+        attachments = RequestAttachment.objects.all()
+        self.assertEqual(len(attachments), 2)
+        self.assertEqual({a.blob_id for a in attachments}, {AttachmentBlob.objects.get().pk})
+        with attachments[0].file.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+    
+    def test_upload_is_attached_once(self):
+        """Submitting the same upload again doesn't attach it to a second request"""
+        upload_id = self.upload(b'photo of the gas meter')['upload_id']
+        for _ in range(2):
+            response = self.client.post(reverse('create_request'), {
+                'service_type': self.service_type.pk,
+                'description': 'Meter photo attached',
+                'priority': 'low',
+                'upload_ids': [upload_id],
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(ServiceRequest.objects.count(), 2)
+        self.assertEqual(RequestAttachment.objects.count(), 1)
+        self.assertEqual(UploadSession.objects.get().status, 'attached')
+    
+    def test_stale_writer_leaves_the_file_alone(self):
+        """A chunk for an offset someone else already wrote is rejected without touching the file"""
+        session = start_upload(self.user, 'meter.jpg', 10)
+        stale = UploadSession.objects.get(pk=session.pk)
+        append_chunk(session, 0, BytesIO(b'01234'))
+        
+        with self.assertRaises(OffsetMismatch) as raised:
+            append_chunk(stale, 0, BytesIO(b'xxxxx'))
+        self.assertEqual(raised.exception.expected, 5)
+        with open(partial_path(session), 'rb') as fh:
+            self.assertEqual(fh.read(), b'01234')
+    
+    def test_uploads_are_private(self):
+        """Other users can't see or finalize someone else's upload"""
+        start = self.client.post(reverse('upload_start'), {'filename': 'meter.jpg', 'size': 3}).json()
+        self.client.force_login(User.objects.create_user(username='intruder'))
+        response = self.client.get(reverse('upload_chunk', args=[start['upload_id']]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_form_upload_is_deduplicated(self):
+        """Files posted with the form are stored by content hash as well"""
+        for _ in range(2):
+            self.client.post(reverse('create_request'), {
+                'service_type': self.service_type.pk,
+                'description': 'Bill attached',
+                'priority': 'low',
+                'attachments': SimpleUploadedFile('bill.pdf', b'%PDF same bill'),
+            })
+        self.assertEqual(RequestAttachment.objects.count(), 2)
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+        self.assertEqual(RequestAttachment.objects.first().filename, 'bill.pdf')
+
+
+class AttachmentDownloadTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(self.tmpdir.name, 'tmp'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.customer = User.objects.create_user(username='customer')
+        self.service_type = ServiceType.objects.create(name='Meter Reading', description='Meter issues')
+        service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                        description='Photo attached')
+        self.content = bytes(range(256)) * 4
+        blob = blob_from_uploaded_file(SimpleUploadedFile('meter.png', self.content))
+        self.attachment = attach_blob(service_request, blob, 'meter.png')
+        self.url = reverse('download_attachment', args=[self.attachment.pk])
+    
+    def test_owner_and_staff_only(self):
+        self.client.force_login(User.objects.create_user(username='other'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(User.objects.create_user(username='staffuser', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+    
+    def test_full_download_and_revalidation(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], f'"{self.attachment.blob.sha256}"')
+        
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+    
+    def test_range_requests(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        
+        response = self.client.get(self.url, headers={'Range': 'bytes=-5'})
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+    
+    @override_settings(ATTACHMENT_SERVE_MODE='x-accel-redirect', ATTACHMENT_ACCEL_PREFIX='/protected-media/')
+    def test_proxy_offload(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.attachment.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+# A valid 1x1 greyscale PNG, small enough to inline
+ONE_PIXEL_PNG = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x00\x00\x00\x00:~\x9bU'
+                 b'\x00\x00\x00\nIDATx\x9cc`\x00\x00\x00\x02\x00\x01H\xaf\xa4q\x00\x00\x00\x00IEND\xaeB`\x82')
+
+
+@override_settings(ATTACHMENT_WORKERS=0)
+class AttachmentProcessingTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(self.tmpdir.name, 'tmp'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='customer')
+        self.service_type = ServiceType.objects.create(name='Meter Reading', description='Meter issues')
+        self.client.force_login(self.user)
+    
+    def test_multiple_files_are_processed_after_commit(self):
+        """Every posted file is attached and processed once the request is saved"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_request'), {
+                'service_type': self.service_type.pk,
+                'description': 'Bill and meter photo attached',
+                'priority': 'low',
+                'attachments': [
+                    SimpleUploadedFile('bill.pdf', b'%PDF-1.4 bill'),
+                    SimpleUploadedFile('meter.jpg', b'GIF89a not really a jpeg'),
+                ],
+            })
+        self.assertEqual(response.status_code, 302)
+        attachments = {a.filename: a for a in RequestAttachment.objects.all()}
+        self.assertEqual(set(attachments), {'bill.pdf', 'meter.jpg'})
+        self.assertTrue(all(a.processing_status == 'done' for a in attachments.values()))
+        self.assertEqual(attachments['bill.pdf'].content_type, 'application/pdf')
+        # The contents decide the type, not the extension
+        self.assertEqual(attachments['meter.jpg'].content_type, 'image/gif')
+        self.assertEqual(attachments['bill.pdf'].size, len(b'%PDF-1.4 bill'))
+    
+    @override_settings(ATTACHMENT_MAX_FILES=1)
+    def test_too_many_files_rejected(self):
+        response = self.client.post(reverse('create_request'), {
+            'service_type': self.service_type.pk,
+            'description': 'Too many files',
+            'priority': 'low',
+            'attachments': [SimpleUploadedFile('a.txt', b'a'), SimpleUploadedFile('b.txt', b'b')],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ServiceRequest.objects.exists())
+    
+    def test_backlog_recovers_abandoned_and_failed_work(self):
+        """Attachments stuck in processing are retried, and missing files end up failed"""
+        service_request = ServiceRequest.objects.create(customer=self.user, service_type=self.service_type,
+                                                        description='Photo attached')
+        blob = blob_from_uploaded_file(SimpleUploadedFile('meter.png', ONE_PIXEL_PNG))
+        stuck = attach_blob(service_request, blob, 'meter.png')
+        RequestAttachment.objects.filter(pk=stuck.pk).update(
+            processing_status='processing', processing_attempts=1,
+            processing_started_at=timezone.now() - timedelta(hours=1),
+        )
+        missing = RequestAttachment.objects.create(service_request=service_request, file='gone.txt',
+                                                   filename='gone.txt', processing_attempts=1)
+        
+        with override_settings(ATTACHMENT_PROCESSING_MAX_ATTEMPTS=2), \
+                self.assertLogs('customer_service.processing', 'ERROR'):
+            call_command('process_attachments', stdout=StringIO())
+        
+        stuck.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual(stuck.processing_status, 'done')
+        self.assertEqual(stuck.content_type, 'image/png')
+        self.assertEqual(missing.processing_status, 'failed')
+        self.assertTrue(missing.processing_error)
+
+
+    def image_attachment(self, filename, image, **save_kwargs):
+        buffer = BytesIO()
+        image.save(buffer, **save_kwargs)
+        service_request = ServiceRequest.objects.create(customer=self.user, service_type=self.service_type,
+                                                        description='Photo attached')
+        blob = blob_from_uploaded_file(SimpleUploadedFile(filename, buffer.getvalue()))
+        return attach_blob(service_request, blob, filename)
+    
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_exif_is_stripped_from_photos(self):
+        """Photos lose their EXIF data and are turned upright, and get a thumbnail"""
+        exif = Image.Exif()
+        exif[0x010F] = 'MeterCam'  # Make
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        attachment = self.image_attachment('meter.jpg', Image.new('RGB', (800, 600), 'red'),
+                                           format='JPEG', exif=exif.tobytes())
+        original = attachment.blob_id
+        
+        self.assertTrue(process_attachment(attachment.pk))
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.content_type, 'image/jpeg')
+        self.assertNotEqual(attachment.blob_id, original)
+        self.assertEqual(attachment.size, attachment.file.size)
+        with attachment.file.open('rb') as fh, Image.open(fh) as image:
+            self.assertFalse(image.info.get('exif'))
+            self.assertEqual(image.size, (600, 800))
+        with attachment.thumbnail.open('rb') as fh, Image.open(fh) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (240, 320)))
+    
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_images_without_exif_are_kept(self):
+        """Images without EXIF data keep their file and still get a thumbnail"""
+        attachment = self.image_attachment('meter.png', Image.new('RGBA', (100, 50)), format='PNG')
+        original = attachment.blob_id
+        
+        self.assertTrue(process_attachment(attachment.pk))
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.blob_id, original)
+        with attachment.thumbnail.open('rb') as fh, Image.open(fh) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (100, 50)))
+
+
+@override_settings(TASK_QUEUE_EAGER=False, TASK_RETRY_BACKOFF_SECONDS=0)
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', email='customer@example.com')
+        self.staff = User.objects.create_user(username='staffuser', email='staff@example.com', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                             description='Smell of gas')
+        Task.objects.all().delete()
+    
+    def test_views_queue_side_effects(self):
+        """Updating a request queues notifications instead of sending them in the request"""
+        self.client.force_login(self.staff)
+        self.client.post(reverse('update_request', args=[self.service_request.request_number]), {
+            'status': 'in_progress', 'priority': 'high', 'assigned_to': self.staff.pk, 'support_notes': '',
+            'version': self.service_request.version,
+        })
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            set(Task.objects.values_list('name', flat=True)),
+            {'search.index_requests', 'notifications.status_changed'},
+        )
+        
+        call_command('runworker', once=True, concurrency=1, stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual([message.to for message in mail.outbox], [['customer@example.com']])
+        self.assertEqual(get_search_backend().search('Smell', limit=10), [self.service_request.pk])
+    
+    def test_new_requests_are_indexed_signed_and_confirmed_by_the_worker(self):
+        """Nothing a new request needs happens until a worker drains the queue"""
+        self.client.force_login(self.customer)
+        self.client.post(reverse('create_request'), {
+            'service_type': self.service_type.pk, 'description': 'Gas meter hissing', 'priority': 'high',
+        })
+        new = ServiceRequest.objects.get(description='Gas meter hissing')
+        self.assertEqual(
+            set(Task.objects.values_list('name', flat=True)),
+            {'search.index_requests', 'duplicates.index_requests', 'notifications.request_created'},
+        )
+        self.assertEqual(get_search_backend().search('hissing'), [])
+        self.assertFalse(RequestSignature.objects.filter(pk=new.pk).exists())
+        self.assertEqual(len(mail.outbox), 0)
+        
+        call_command('runworker', once=True, concurrency=1, stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(get_search_backend().search('hissing'), [new.pk])
+        self.assertTrue(RequestSignature.objects.filter(pk=new.pk).exists())
+        self.assertEqual([message.to for message in mail.outbox], [['customer@example.com']])
+    
+    def test_restored_requests_are_reindexed_by_the_worker(self):
+        ServiceRequest.objects.filter(pk=self.service_request.pk).update(
+            status='completed', updated_at=timezone.now() - timedelta(days=400),
+        )
+        self.assertEqual(archive_requests(), 1)
+        restore_request(self.service_request.request_number)
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', flat=True)),
+            ['duplicates.index_requests', 'search.index_requests', 'search.remove_requests'],
+        )
+        
+        call_command('runworker', once=True, concurrency=1, stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(get_search_backend().search('Smell'), [self.service_request.pk])
+        self.assertTrue(RequestSignature.objects.filter(pk=self.service_request.pk).exists())
+    
+    def test_bulk_status_changes_queue_only_the_emails(self):
+        """Status isn't in the search index, so a bulk change doesn't queue a re-index"""
+        self.assertEqual(bulk_transition(ServiceRequest.objects.all(), self.staff, 'in_progress'), 1)
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['notifications.statuses_changed'])
+    
+    def test_claims_are_exclusive(self):
+        enqueue('search.index_requests', request_ids=[self.service_request.pk])
+        claimed = claim_tasks('worker-a', limit=5)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claim_tasks('worker-b', limit=5), [])
+    
+    def test_failed_tasks_retry_then_fail(self):
+        """A failing task is rescheduled with backoff until it runs out of attempts"""
+        queued = Task.objects.create(name='notifications.status_changed', payload={'unexpected': 1}, max_attempts=2)
+        with self.assertLogs('customer_service.taskqueue', 'ERROR'):
+            run_task(claim_tasks('worker-a')[0])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('TypeError', queued.last_error)
+        
+        with self.assertLogs('customer_service.taskqueue', 'ERROR'):
+            run_task(claim_tasks('worker-a')[0])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+    
+    @override_settings(TASK_QUEUE_EAGER=True, EMAIL_BACKEND='gas_utility.no_such_backend.EmailBackend')
+    def test_eager_tasks_run_after_commit_and_cannot_undo_it(self):
+        """In eager mode a failing notification is logged and the new request stays saved"""
+        self.client.force_login(self.customer)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('create_request'), {
+                'service_type': self.service_type.pk, 'description': 'Gas meter hissing', 'priority': 'high',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(callbacks)
+        self.assertEqual(len(mail.outbox), 0)
+        with self.assertLogs('customer_service.taskqueue', 'ERROR'):
+            for callback in callbacks:
+                callback()
+        self.assertTrue(ServiceRequest.objects.filter(description='Gas meter hissing').exists())
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class AsyncViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        CustomerProfile.objects.create(user=cls.customer, account_number='ACC-1', address='1 Main St',
+                                       phone_number='555-0100')
+        cls.staff = User.objects.create_user(username='staffuser', is_staff=True)
+        service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.service_request = ServiceRequest.objects.create(customer=cls.customer, service_type=service_type,
+                                                                description='Smell of gas')
+    
+    async def test_read_views_under_async_client(self):
+        """The read-heavy views render on the event loop without sync database access"""
+        await self.async_client.aforce_login(self.customer)
+        for url in (reverse('request_list'), reverse('profile'),
+                    reverse('request_detail', args=[self.service_request.request_number])):
+            response = await self.async_client.get(url)
+            self.assertContains(response, self.service_request.request_number)
+        
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('support_dashboard'), {'search': 'gas'})
+        self.assertContains(response, self.service_request.request_number)
+    
+    async def test_login_still_required(self):
+        response = await self.async_client.get(reverse('request_list'))
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(reverse('support_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(LIVE_FEED_STREAM_SECONDS=0, LIVE_FEED_POLL_INTERVAL=0)
+class LiveFeedTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', first_name='Ada', last_name='Lovelace')
+        self.staff = User.objects.create_user(username='staffuser', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.client.force_login(self.staff)
+    
+    def create_request(self):
+        # Changes are published to the feed once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                 description='Smell of gas')
+    
+    def test_stream_sends_changes_after_cursor(self):
+        """The SSE stream resumes after Last-Event-ID and includes status changes"""
+        self.create_request()
+        cursor = RequestChange.objects.latest('position').position
+        service_request = self.create_request()
+        with self.captureOnCommitCallbacks(execute=True):
+            RequestStatusUpdate.objects.create(service_request=service_request, previous_status='pending',
+                                               new_status='in_progress')
+        
+        response = self.client.get(reverse('dashboard_feed'), headers={'Last-Event-ID': str(cursor)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        events = [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual([(event['kind'], event['request']['request_number']) for event in events],
+                         [('created', service_request.request_number), ('status', service_request.request_number)])
+        self.assertEqual(events[1]['previous_status'], 'pending')
+        self.assertIn(f"id: {events[1]['id']}", body)
+    
+    def test_long_poll(self):
+        url = reverse('dashboard_feed_poll')
+        data = self.client.get(url).json()
+        self.assertEqual(data['events'], [])
+        
+        service_request = self.create_request()
+        data = self.client.get(url, {'after': data['cursor'], 'timeout': 0}).json()
+        self.assertEqual([event['request']['request_number'] for event in data['events']],
+                         [service_request.request_number])
+        self.assertEqual(data['events'][0]['request']['customer'], 'Ada Lovelace')
+        self.assertEqual(data['cursor'], data['events'][0]['id'])
+    
+    def test_changes_committed_out_of_id_order_are_not_skipped(self):
+        """A change from a long transaction that commits after a later id still reaches clients"""
+        url = reverse('dashboard_feed_poll')
+        slow = self.create_request()
+        fast = self.create_request()
+        # The first change's transaction is still open: it has an id but no position yet
+        RequestChange.objects.filter(service_request=slow).update(position=None)
+        data = self.client.get(url, {'after': 0, 'timeout': 0}).json()
+        self.assertEqual([event['request']['request_number'] for event in data['events']], [fast.request_number])
+        
+        # It commits after the client has moved past its id, and is published after what the client saw
+        self.assertEqual(publish_changes(), 1)
+        data = self.client.get(url, {'after': data['cursor'], 'timeout': 0}).json()
+        self.assertEqual([event['request']['request_number'] for event in data['events']], [slow.request_number])
+        self.assertEqual(publish_changes(), 0)
+    
+    def test_dashboard_only_live_on_first_unfiltered_page(self):
+        self.assertContains(self.client.get(reverse('support_dashboard')), 'data-feed-url')
+        self.assertNotContains(self.client.get(reverse('support_dashboard'), {'status': 'pending'}), 'data-feed-url')
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        get_fragment_cache().clear()
+        self.customer = User.objects.create_user(username='customer')
+        self.profile = CustomerProfile.objects.create(user=self.customer, account_number='ACC-1',
+                                                      address='1 Main St', phone_number='555-0100')
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                             description='Smell of gas')
+        self.client.force_login(self.customer)
+    
+    def test_repeat_views_are_served_from_cache(self):
+        """A second view skips the queries and rendering, and saves invalidate it"""
+        url = reverse('request_detail', args=[self.service_request.request_number])
+        self.assertEqual(self.client.get(url)['X-Fragment-Cache'], 'miss')
+        # Only the session and user are loaded on a hit
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Fragment-Cache'], 'hit')
+        
+        RequestStatusUpdate.objects.create(service_request=self.service_request, previous_status='pending',
+                                           new_status='in_progress', notes='Engineer on the way')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Fragment-Cache'], 'miss')
+        self.assertContains(response, 'Engineer on the way')
+        
+        self.assertEqual(fragment_stats(['request_detail']), {'request_detail': (1, 2)})
+    
+    def test_profile_and_list_follow_customer_changes(self):
+        self.client.get(reverse('profile'))
+        self.client.get(reverse('request_list'))
+        self.assertEqual(self.client.get(reverse('profile'))['X-Fragment-Cache'], 'hit')
+        
+        self.profile.phone_number = '555-0199'
+        self.profile.save()
+        self.assertContains(self.client.get(reverse('profile')), '555-0199')
+        
+        # Profile changes expire the customer's other pages as well
+        self.assertEqual(self.client.get(reverse('request_list'))['X-Fragment-Cache'], 'miss')
+        self.assertEqual(self.client.get(reverse('request_list'))['X-Fragment-Cache'], 'hit')
+        new_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                    description='Meter broken')
+        response = self.client.get(reverse('request_list'))
+        self.assertEqual(response['X-Fragment-Cache'], 'miss')
+        self.assertContains(response, new_request.request_number)
+    
+    def test_other_customers_never_see_cached_pages(self):
+        url = reverse('request_detail', args=[self.service_request.request_number])
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username='other'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ServiceTypeRegistryTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        ServiceType.objects.create(name='Old Type', description='Retired', is_active=False)
+        self.service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                             description='Smell of gas')
+    
+    def assertNoServiceTypeQueries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'customer_service_servicetype' in q['sql']])
+        return response
+    
+    def test_views_render_without_service_type_queries(self):
+        service_types.all()
+        number = self.service_request.request_number
+        self.client.force_login(self.customer)
+        response = self.assertNoServiceTypeQueries(reverse('create_request'))
+        self.assertContains(response, 'Gas Leak')
+        self.assertNotContains(response, 'Old Type')
+        self.assertContains(self.assertNoServiceTypeQueries(reverse('request_list')), 'Gas Leak')
+        self.assertContains(self.assertNoServiceTypeQueries(reverse('request_detail', args=[number])), 'Gas Leak')
+        self.client.force_login(self.staff)
+        self.assertContains(self.assertNoServiceTypeQueries(reverse('support_dashboard')), 'Gas Leak')
+        self.assertContains(self.assertNoServiceTypeQueries(reverse('support_request_detail', args=[number])),
+                            'Gas Leak')
+    
+    def test_saving_a_service_type_reloads_the_registry(self):
+        self.assertEqual([t.name for t in service_types.active()], ['Gas Leak'])
+        self.service_type.name = 'Suspected Gas Leak'
+        self.service_type.save()
+        self.assertEqual([t.name for t in service_types.active()], ['Suspected Gas Leak'])
+        self.service_type.is_active = False
+        self.service_type.save()
+        self.assertEqual(service_types.active(), [])
+    
+    def test_form_only_accepts_active_types(self):
+        self.client.force_login(self.customer)
+        inactive = ServiceType.objects.get(name='Old Type')
+        response = self.client.post(reverse('create_request'), {
+            'service_type': inactive.pk, 'description': 'Old work', 'priority': 'low',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['service_type'])
+        response = self.client.post(reverse('create_request'), {
+            'service_type': self.service_type.pk, 'description': 'New work', 'priority': 'low',
+        })
+        self.assertEqual(ServiceRequest.objects.get(description='New work').service_type, self.service_type)
+
+
+# The sequences database only exists when the block generator is configured;
+# otherwise the blocks are kept in the default database for these tests
+SEQUENCES_CONFIGURED = settings.SEQUENCE_DATABASE in settings.DATABASES
+
+
+@override_settings(SEQUENCE_DATABASE=settings.SEQUENCE_DATABASE if SEQUENCES_CONFIGURED else 'default')
+class RequestNumberTestCase(TestCase):
+    databases = {'default', settings.SEQUENCE_DATABASE} if SEQUENCES_CONFIGURED else {'default'}
+    
+    def test_time_ordered_numbers_increase(self):
+        generator = TimeOrderedRequestNumberGenerator()
+        numbers = [generator.next_number() for _ in range(1000)]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), 1000)
+        self.assertTrue(all(len(number) == 20 and number.startswith('SR-') for number in numbers))
+    
+    def test_block_generator_reserves_once_per_block(self):
+        generator = BlockRequestNumberGenerator(block_size=10)
+        numbers = [generator.next_number()]
+        # The rest of the block is issued from memory
+        with self.assertNumQueries(0):
+            numbers += [generator.next_number() for _ in range(9)]
+        self.assertEqual(numbers[0], 'SR-000000000001')
+        self.assertEqual(numbers[-1], 'SR-000000000010')
+        self.assertEqual(generator.next_number(), 'SR-000000000011')
+        self.assertEqual(RequestNumberBlock.objects.get().next_value, 21)
+    
+    @skipUnless(SEQUENCES_CONFIGURED, 'needs REQUEST_NUMBER_GENERATOR set to the block generator')
+    def test_block_outlives_a_rolled_back_transaction(self):
+        """Blocks commit on their own connection, so a rollback never hands their numbers out twice"""
+        generator = BlockRequestNumberGenerator(block_size=10)
+        try:
+            with transaction.atomic():
+                self.assertEqual(generator.next_number(), 'SR-000000000001')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(RequestNumberBlock.objects.get().next_value, 11)
+        self.assertEqual(generator.next_number(), 'SR-000000000002')
+        self.assertEqual(BlockRequestNumberGenerator(block_size=10).next_number(), 'SR-000000000011')
+    
+    def test_new_sequence_continues_after_existing_numbers(self):
+        customer = User.objects.create_user(username='customer')
+        service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        ServiceRequest.objects.create(customer=customer, service_type=service_type,
+                                      request_number='SR-000000000042', description='Issued earlier')
+        self.assertEqual(BlockRequestNumberGenerator(block_size=10).next_number(), 'SR-000000000043')
+    
+    def test_new_and_legacy_numbers_resolve(self):
+        customer = User.objects.create_user(username='customer')
+        service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        legacy = ServiceRequest.objects.create(customer=customer, service_type=service_type,
+                                               request_number='SR-1A2B3C4D', description='Old')
+        current = ServiceRequest.objects.create(customer=customer, service_type=service_type, description='New')
+        self.assertEqual(len(current.request_number), 20)
+        self.client.force_login(customer)
+        for service_request in (legacy, current):
+            response = self.client.get(reverse('request_detail', args=[service_request.request_number]))
+            self.assertContains(response, service_request.description)
+
+
+class RequestTransitionTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.other_staff = User.objects.create_user(username='other', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                             description='Smell of gas')
+        self.client.force_login(self.staff)
+    
+    def test_transition_writes_only_changed_fields_and_history(self):
+        status_update = apply_changes(self.service_request, self.staff, 'pending', 0, notes='On our way',
+                                      status='in_progress')
+        service_request = ServiceRequest.objects.get(pk=self.service_request.pk)
+        self.assertEqual((service_request.status, service_request.version), ('in_progress', 1))
+        self.assertEqual((status_update.previous_status, status_update.new_status), ('pending', 'in_progress'))
+        self.assertEqual(status_counts(), {'in_progress': 1})
+    
+    def test_stale_edit_is_rejected(self):
+        stale = ServiceRequest.objects.get(pk=self.service_request.pk)
+        apply_changes(self.service_request, self.other_staff, 'pending', 0, status='on_hold')
+        with self.assertRaises(TransitionConflict):
+            apply_changes(stale, self.staff, 'pending', 0, status='completed')
+        self.assertEqual(ServiceRequest.objects.get(pk=stale.pk).status, 'on_hold')
+        self.assertEqual(RequestStatusUpdate.objects.filter(previous_status='pending').count(), 1)
+    
+    def test_invalid_transition_is_rejected_without_queries(self):
+        self.service_request.status = 'completed'
+        with self.assertNumQueries(0), self.assertRaises(InvalidTransition):
+            apply_changes(self.service_request, self.staff, 'completed', 0, status='on_hold')
+    
+    def test_conflicts_are_reported_in_the_views(self):
+        url = reverse('support_request_detail', args=[self.service_request.request_number])
+        # Another member of staff saves first
+        ServiceRequest.objects.get(pk=self.service_request.pk).save()
+        response = self.client.post(url, {'new_status': 'in_progress', 'notes': '', 'version': 0}, follow=True)
+        self.assertContains(response, 'Someone else changed this request')
+        self.assertEqual(ServiceRequest.objects.get(pk=self.service_request.pk).status, 'pending')
+        
+        response = self.client.post(reverse('update_request', args=[self.service_request.request_number]), {
+            'status': 'completed', 'priority': 'high', 'support_notes': '', 'version': 0,
+        }, follow=True)
+        self.assertContains(response, 'Someone else changed this request')
+        self.assertEqual(ServiceRequest.objects.get(pk=self.service_request.pk).priority, 'medium')
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.closed = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                    description='Fixed long ago', status='completed')
+        self.open = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                  description='Still open')
+        RequestStatusUpdate.objects.create(service_request=self.closed, previous_status='pending',
+                                           new_status='completed', updated_by=self.staff, notes='All done')
+        self.attachment = RequestAttachment.objects.create(service_request=self.closed, filename='photo.jpg',
+                                                           file='request_attachments/photo.jpg')
+        # Closed more than the retention period ago
+        ServiceRequest.objects.filter(pk=self.closed.pk).update(updated_at=timezone.now() - timedelta(days=400))
+    
+    def test_archiving_moves_old_closed_requests(self):
+        self.assertEqual(archive_requests(batch_size=1), 1)
+        self.assertEqual(list(ServiceRequest.objects.values_list('pk', flat=True)), [self.open.pk])
+        self.assertEqual(status_counts(), {'pending': 1})
+        archived = ArchivedServiceRequest.objects.get(request_number=self.closed.request_number)
+        self.assertEqual(archived.pk, self.closed.pk)
+        self.assertEqual([u.notes for u in archived.status_updates.all()], ['All done'])
+        self.assertEqual(archived.attachments.get().pk, self.attachment.pk)
+        self.assertEqual(archive_requests(), 0)
+    
+    def test_batch_skips_requests_changed_since_they_were_picked(self):
+        ids = list(archivable_requests().values_list('pk', flat=True))
+        self.assertEqual(ids, [self.closed.pk])
+        # A note added after the request was picked makes it recent again
+        self.closed.support_notes = 'Customer called back'
+        self.closed.save()
+        self.assertEqual(archive_batch(ids), 0)
+        self.assertTrue(ServiceRequest.objects.filter(pk=self.closed.pk).exists())
+    
+    def test_detail_views_fall_back_to_the_archive(self):
+        archive_requests()
+        number = self.closed.request_number
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('request_detail', args=[number]))
+        self.assertContains(response, 'Fixed long ago')
+        self.assertContains(response, 'All done')
+        self.assertContains(response, reverse('download_attachment', args=[self.attachment.pk]))
+        
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('support_request_detail', args=[number]))
+        self.assertContains(response, 'Restore Request')
+        self.assertNotContains(response, reverse('update_request', args=[number]))
+    
+    def test_restore_moves_the_request_back(self):
+        archive_requests()
+        self.client.force_login(self.staff)
+        number = self.closed.request_number
+        response = self.client.post(reverse('restore_archived_request', args=[number]))
+        self.assertRedirects(response, reverse('support_request_detail', args=[number]))
+        restored = ServiceRequest.objects.get(request_number=number)
+        self.assertEqual((restored.pk, restored.status), (self.closed.pk, 'completed'))
+        self.assertLess(restored.updated_at, timezone.now() - timedelta(days=300))
+        self.assertEqual(restored.status_updates.get().notes, 'All done')
+        self.assertEqual(restored.attachments.get().pk, self.attachment.pk)
+        self.assertFalse(ArchivedServiceRequest.objects.exists())
+        self.assertEqual(status_counts(), {'pending': 1, 'completed': 1})
+        self.assertIsNone(restore_request(number))
+    
+    def test_restore_leaves_auto_timestamps_on_for_other_writers(self):
+        long_ago = timezone.now() - timedelta(days=500)
+        ServiceRequest.objects.filter(pk=self.closed.pk).update(created_at=long_ago)
+        RequestStatusUpdate.objects.update(created_at=long_ago)
+        archive_requests()
+        created_at = ServiceRequest._meta.get_field('created_at')
+        flags = []
+        original_bulk_create = RequestStatusUpdate.objects.bulk_create
+        
+        def bulk_create(*args, **kwargs):
+            # Another thread saving a request now must still get timestamps
+            flags.append((created_at.auto_now_add, ServiceRequest._meta.get_field('updated_at').auto_now))
+            return original_bulk_create(*args, **kwargs)
+        
+        with patch.object(RequestStatusUpdate.objects, 'bulk_create', bulk_create):
+            restored = restore_request(self.closed.request_number)
+        self.assertEqual(flags, [(True, True)])
+        restored.refresh_from_db()
+        self.assertEqual((restored.created_at, restored.status_updates.get().created_at), (long_ago, long_ago))
+        self.assertLess(restored.updated_at, timezone.now() - timedelta(days=300))
+
+
+class SLAAnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                             description='Smell of gas')
+        # Submitted two hours ago
+        created = timezone.now() - timedelta(hours=2)
+        ServiceRequest.objects.filter(pk=self.service_request.pk).update(created_at=created)
+        self.service_request.created_at = created
+    
+    def test_transitions_are_rolled_up(self):
+        apply_changes(self.service_request, self.staff, 'pending', 0, status='in_progress')
+        apply_changes(self.service_request, self.staff, 'in_progress', 1, status='completed')
+        timing = RequestTiming.objects.get(request_id=self.service_request.pk)
+        self.assertEqual(timing.status, 'completed')
+        self.assertIsNotNone(timing.resolved_at)
+        self.assertEqual(set(SLARollup.objects.values_list('metric', flat=True)),
+                         {'first_response', 'resolution', 'in_pending', 'in_in_progress'})
+        
+        today = timezone.localdate()
+        with CaptureQueriesContext(connection) as queries:
+            report = sla_report(today, today)
+        self.assertFalse(any('status_update' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(report[0]['label'], 'Gas Leak')
+        first_response = report[0]['metrics']['first_response']
+        self.assertEqual(first_response['count'], 1)
+        lower, upper = bucket_bounds(bucket_for(2 * 3600))
+        self.assertTrue(lower <= first_response['p50_seconds'] <= upper)
+    
+    def test_percentiles_are_estimated_from_buckets(self):
+        durations = [60 * minutes for minutes in range(1, 101)]
+        histogram = {}
+        for seconds in durations:
+            histogram[bucket_for(seconds)] = histogram.get(bucket_for(seconds), 0) + 1
+        self.assertIsNone(estimate_percentile({}, 50))
+        for pct in (50, 90, 95):
+            exact = durations[pct - 1]
+            self.assertLess(abs(estimate_percentile(histogram, pct) - exact) / exact, 0.25)
+    
+    def test_replay_queries_do_not_grow_with_history(self):
+        def replay(count):
+            requests = ServiceRequest.objects.bulk_create([
+                ServiceRequest(customer=self.customer, service_type=self.service_type, description='Imported',
+                               request_number=ServiceRequest.generate_request_number())
+                for _ in range(count)
+            ])
+            RequestStatusUpdate.objects.bulk_create([
+                RequestStatusUpdate(service_request=service_request, previous_status=previous, new_status=new,
+                                    updated_by=self.staff)
+                for service_request in requests
+                for previous, new in (('', 'pending'), ('pending', 'in_progress'), ('in_progress', 'completed'))
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(replay_history([r.pk for r in requests]), count)
+            return len(queries)
+        
+        self.assertEqual(replay(2), replay(20))
+        self.assertEqual(SLARollup.objects.filter(metric='resolution').aggregate(total=Sum('count'))['total'], 22)
+    
+    def test_backfill_and_json_report(self):
+        # Bulk-written history has no timing facts until it is replayed
+        RequestStatusUpdate.objects.bulk_create([
+            RequestStatusUpdate(service_request=self.service_request, previous_status='pending',
+                                new_status='completed', updated_by=self.staff),
+        ])
+        self.assertFalse(SLARollup.objects.exists())
+        call_command('backfill_sla_analytics', stdout=StringIO())
+        call_command('backfill_sla_analytics', stdout=StringIO())
+        self.assertEqual(SLARollup.objects.get(metric='resolution').count, 1)
+        
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('support_analytics_data'), {'group_by': 'staff'})
+        group = response.json()['groups'][0]
+        self.assertEqual(group['label'], 'staff')
+        self.assertEqual(group['metrics']['resolution']['count'], 1)
+        response = self.client.get(reverse('support_analytics'))
+        self.assertContains(response, 'Resolution time')
+
+
+class WorkQueueTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.other_staff = User.objects.create_user(username='other', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        now = timezone.now()
+        self.requests = {}
+        for name, priority, age in [('old_low', 'low', 5), ('new_emergency', 'emergency', 1),
+                                    ('old_emergency', 'emergency', 3), ('high', 'high', 4)]:
+            service_request = ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                                            description=name, priority=priority)
+            ServiceRequest.objects.filter(pk=service_request.pk).update(created_at=now - timedelta(hours=age))
+            self.requests[name] = service_request
+    
+    def test_claims_most_urgent_oldest_first(self):
+        claimed = [claim_next_request(self.staff if i % 2 else self.other_staff).description for i in range(4)]
+        self.assertEqual(claimed, ['old_emergency', 'new_emergency', 'high', 'old_low'])
+        self.assertIsNone(claim_next_request(self.staff))
+        service_request = ServiceRequest.objects.get(pk=self.requests['old_emergency'].pk)
+        self.assertEqual((service_request.status, service_request.assigned_to), ('in_progress', self.other_staff))
+        self.assertEqual(service_request.status_updates.get().new_status, 'in_progress')
+        self.assertEqual(status_counts(), {'in_progress': 4})
+    
+    def test_priority_changes_reorder_the_queue(self):
+        ServiceRequest.objects.filter(pk=self.requests['old_low'].pk).update(priority='emergency')
+        self.assertEqual(queue().first().description, 'old_low')
+    
+    def test_lost_race_moves_to_next_candidate(self):
+        # Another claimer takes the first candidate between the read and the write
+        stale = queue().first()
+        apply_changes(stale, self.other_staff, 'pending', stale.version, status='in_progress',
+                      assigned_to=self.other_staff)
+        self.assertEqual(claim_next_request(self.staff).description, 'new_emergency')
+    
+    def test_queue_reads_from_index(self):
+        sql, params = queue().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('servicerequest_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_claim_view(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('claim_next'))
+        number = self.requests['old_emergency'].request_number
+        self.assertRedirects(response, reverse('support_request_detail', args=[number]))
+        for _ in range(3):
+            self.client.post(reverse('claim_next'))
+        response = self.client.post(reverse('claim_next'), follow=True)
+        self.assertContains(response, 'no unassigned pending requests')
+
+
+class AssignmentTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.alice = User.objects.create_user(username='alice', is_staff=True)
+        self.bob = User.objects.create_user(username='bob', is_staff=True)
+        User.objects.create_user(username='former', is_staff=True, is_active=False)
+        self.leak = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.meter = ServiceType.objects.create(name='Meter Reading', description='Readings')
+        reset_engine()
+    
+    def create_request(self, **kwargs):
+        kwargs.setdefault('service_type', self.leak)
+        return ServiceRequest.objects.create(customer=self.customer, description='Help', **kwargs)
+    
+    def workload(self, user):
+        return StaffWorkload.objects.filter(staff=user).values_list('open_count', 'open_load').first()
+    
+    def test_workloads_follow_assignment_and_closing(self):
+        service_request = self.create_request(priority='high', assigned_to=self.alice)
+        self.assertEqual(self.workload(self.alice), (1, 4))
+        apply_changes(service_request, self.alice, 'pending', service_request.version,
+                      assigned_to=self.bob, priority='emergency')
+        self.assertEqual((self.workload(self.alice), self.workload(self.bob)), ((0, 0), (1, 8)))
+        apply_changes(service_request, self.bob, 'pending', service_request.version, status='completed')
+        self.assertEqual(self.workload(self.bob), (0, 0))
+        self.create_request(assigned_to=self.bob).delete()
+        self.assertEqual(self.workload(self.bob), (0, 0))
+        self.assertEqual(reconcile_workloads(), [])
+    
+    def test_engine_balances_load_and_respects_skills(self):
+        engine = AssignmentEngine([(1, 0, 0, set()), (2, 0, 0, {self.meter.pk}), (3, 10, 5, set())])
+        picks = [engine.pick(self.leak.pk, 'medium') for _ in range(3)]
+        self.assertEqual(picks, [1, 1, 1])
+        self.assertEqual(engine.pick(self.meter.pk, 'emergency'), 2)
+        self.assertEqual(engine.pick(self.meter.pk, 'low'), 1)
+        self.assertIsNone(AssignmentEngine([(2, 0, 0, {self.meter.pk})]).pick(self.leak.pk, 'low'))
+    
+    def test_batch_assignment_without_counting(self):
+        StaffWorkload.objects.create(staff=self.bob).skills.add(self.meter)
+        for priority in ('low', 'emergency', 'medium'):
+            self.create_request(priority=priority)
+        self.create_request(service_type=self.meter)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(assign_requests(), 4)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.workload(self.alice), (3, 11))
+        self.assertEqual(self.workload(self.bob), (1, 2))
+        self.assertFalse(ServiceRequest.objects.filter(assigned_to__username='former').exists())
+        self.assertEqual(assign_requests(), 0)
+    
+    def test_conflicting_assignment_is_not_counted(self):
+        """A request someone else changed first doesn't add to the picked staff member's load"""
+        class ConcurrentEditEngine(AssignmentEngine):
+            def pick(self, service_type_id, priority):
+                # Another process edits every request between the read and the write
+                ServiceRequest.objects.update(version=F('version') + 1)
+                return super().pick(service_type_id, priority)
+        
+        self.create_request(priority='high')
+        engine = ConcurrentEditEngine([(self.alice.pk, 0, 0, set()), (self.bob.pk, 1, 1, set())])
+        self.assertEqual(assign_requests(engine=engine), 0)
+        self.assertEqual(engine.loads(), {self.alice.pk: 0, self.bob.pk: 1})
+        self.assertEqual(engine.pick(self.leak.pk, 'low'), self.alice.pk)
+    
+    @override_settings(AUTO_ASSIGN_NEW_REQUESTS=True)
+    def test_new_requests_are_assigned_on_creation(self):
+        self.create_request(priority='emergency', assigned_to=self.alice)
+        self.client.force_login(self.customer)
+        self.client.post(reverse('create_request'), {
+            'service_type': self.leak.pk, 'description': 'Smell of gas', 'priority': 'medium',
+        })
+        service_request = ServiceRequest.objects.get(description='Smell of gas')
+        self.assertEqual(service_request.assigned_to, self.bob)
+        self.assertEqual(self.workload(self.bob), (1, 2))
+    
+    @override_settings(AUTO_ASSIGN_NEW_REQUESTS=True)
+    def test_assignment_is_given_back_when_creation_rolls_back(self):
+        self.client.force_login(self.customer)
+        loads = get_engine().loads()
+        with patch('customer_service.views.schedule_processing', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.client.post(reverse('create_request'), {
+                'service_type': self.leak.pk, 'description': 'Smell of gas', 'priority': 'high',
+            })
+        self.assertFalse(ServiceRequest.objects.exists())
+        self.assertEqual(get_engine().loads(), loads)
+    
+    def test_simulation(self):
+        engine = AssignmentEngine((staff_id, 0, 0, set()) for staff_id in range(1, 11))
+        result = simulate(engine, [(self.leak.pk, 'medium')] * 100)
+        self.assertEqual((result['requests'], result['unassigned']), (100, 0))
+        self.assertEqual((result['min_load'], result['max_load']), (20, 20))
+        self.assertEqual(result['heap_pops_per_request'], 1)
+        
+        out = StringIO()
+        call_command('simulate_assignment', synthetic=50, json=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['requests'], 50)
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class JSONAPITestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer')
+        self.other = User.objects.create_user(username='other')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.service_type = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requests = [
+                ServiceRequest.objects.create(customer=self.customer, service_type=self.service_type,
+                                              description=f'Request {i}')
+                for i in range(3)
+            ]
+            ServiceRequest.objects.create(customer=self.other, service_type=self.service_type, description='Not mine')
+        self.client.force_login(self.customer)
+    
+    def test_list_paginates_with_sparse_fields(self):
+        url = reverse('api_request_list')
+        response = self.client.get(url, {'page_size': 2, 'fields': 'request_number,status'})
+        data = response.json()
+        self.assertEqual([item['request_number'] for item in data['results']],
+                         [r.request_number for r in reversed(self.requests[1:])])
+        self.assertEqual(set(data['results'][0]), {'request_number', 'status'})
+        data = self.client.get(url, {'page_size': 2, 'after': data['next']}).json()
+        self.assertEqual([item['description'] for item in data['results']], ['Request 0'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.client.get(url, {'fields': 'support_notes'}).status_code, 400)
+    
+    def test_unchanged_poll_returns_304(self):
+        url = reverse('api_request_detail', args=[self.requests[0].request_number])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['status'], 'pending')
+        etag = response['ETag']
+        with self.assertNumQueries(3):
+            # Session, user and the validator query; nothing is serialized
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        apply_changes(self.requests[0], self.staff, 'pending', 0, status='in_progress', notes='On our way')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status_history'][0]['notes'], 'On our way')
+        self.assertNotIn('updated_by', response.json()['status_history'][0])
+        
+        list_url = reverse('api_request_list')
+        etag = self.client.get(list_url)['ETag']
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+    
+    def test_customers_only_see_their_own_requests(self):
+        other = ServiceRequest.objects.get(customer=self.other)
+        self.assertEqual(self.client.get(reverse('api_request_detail', args=[other.request_number])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_support_request_list')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_request_list')).status_code, 401)
+    
+    def test_large_responses_are_gzipped(self):
+        response = self.client.get(reverse('api_request_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+    
+    def test_staff_claim_and_transition(self):
+        self.client.force_login(self.staff)
+        data = self.client.get(reverse('api_support_request_list'), {'search': 'Not mine'}).json()
+        self.assertEqual([item['customer'] for item in data['results']], ['other'])
+        
+        claimed = self.client.post(reverse('api_claim')).json()
+        self.assertEqual((claimed['status'], claimed['assigned_to']), ('in_progress', 'staff'))
+        url = reverse('api_transition', args=[claimed['request_number']])
+        body = {'status': 'completed', 'version': claimed['version'], 'notes': 'Fixed'}
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.json()['status'], 'completed')
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], claimed['version'] + 1)
+        response = self.client.post(url, {'status': 'on_hold', 'version': claimed['version'] + 1},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class BulkTransitionTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', email='customer@example.com')
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.leak = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.create_requests(3)
+        self.closed = ServiceRequest.objects.create(customer=self.customer, service_type=self.leak,
+                                                    description='Main failure', status='cancelled')
+    
+    def create_requests(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                ServiceRequest.objects.create(customer=self.customer, service_type=self.leak,
+                                              description='Main failure', assigned_to=self.staff)
+    
+    def move_all(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return bulk_transition(ServiceRequest.objects.filter(description='Main failure'), self.staff,
+                                   'in_progress', notes='Crew on site', **kwargs)
+    
+    def test_moves_eligible_requests_with_side_effects(self):
+        self.assertEqual(self.move_all(dry_run=True), 3)
+        self.assertEqual(ServiceRequest.objects.filter(status='in_progress').count(), 0)
+        
+        self.assertEqual(self.move_all(), 3)
+        self.assertEqual(status_counts(), {'in_progress': 3, 'cancelled': 1})
+        self.assertEqual(reconcile_counters(), [])
+        self.assertEqual(reconcile_workloads(), [])
+        self.assertEqual(set(ServiceRequest.objects.values_list('status', 'version')),
+                         {('in_progress', 1), ('cancelled', 0)})
+        self.assertEqual(RequestStatusUpdate.objects.filter(notes='Crew on site').count(), 3)
+        self.assertEqual(RequestChange.objects.filter(kind='status').count(), 3)
+        self.assertEqual(SLARollup.objects.get(metric='first_response').count, 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(self.move_all(), 0)
+    
+    def test_analytics_are_recorded_with_the_change(self):
+        """The SLA analytics don't wait for a background task, which could be lost or run late"""
+        bulk_transition(ServiceRequest.objects.filter(description='Main failure'), self.staff, 'in_progress')
+        self.assertEqual(SLARollup.objects.get(metric='first_response').count, 3)
+        self.assertEqual(RequestTiming.objects.exclude(first_response_at=None).count(), 3)
+    
+    def reset(self):
+        # Put the requests back without timings or rollups so each run does the same work
+        ServiceRequest.objects.filter(status='in_progress').update(status='pending')
+        RequestTiming.objects.all().delete()
+        SLARollup.objects.all().delete()
+    
+    def test_query_count_does_not_grow_with_the_incident(self):
+        self.move_all()
+        self.reset()
+        with CaptureQueriesContext(connection) as small:
+            self.move_all()
+        self.reset()
+        self.create_requests(30)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.move_all(), 33)
+        self.assertEqual(len(large), len(small))
+    
+    def test_dashboard_bulk_form(self):
+        self.client.force_login(self.staff)
+        url = reverse('bulk_update_requests')
+        response = self.client.post(url, {'scope': 'filtered', 'new_status': 'in_progress', 'search': 'failure',
+                                          'dry_run': '1'}, follow=True)
+        self.assertContains(response, '3 request(s) would move to In Progress')
+        
+        number = ServiceRequest.objects.filter(status='pending').first().request_number
+        response = self.client.post(url, {'scope': 'selected', 'new_status': 'completed', 'request_numbers': [number]})
+        self.assertRedirects(response, reverse('support_dashboard') + '?', fetch_redirect_response=False)
+        self.assertEqual(ServiceRequest.objects.get(request_number=number).status, 'completed')
+        
+        # Every request would be affected without a filter
+        response = self.client.post(url, {'scope': 'filtered', 'new_status': 'cancelled'}, follow=True)
+        self.assertContains(response, 'Filter the dashboard first')
+        self.assertEqual(ServiceRequest.objects.filter(status='cancelled').count(), 1)
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class DuplicateDetectionTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.leak = ServiceType.objects.create(name='Gas Leak', description='Suspected leaks')
+        self.billing = ServiceType.objects.create(name='Billing Question', description='Bills')
+        self.customers = []
+        for i, address in enumerate(['12 Elm St, Springfield', '40 Elm Street, Springfield',
+                                     '7 Harbour Road, Kingston']):
+            user = User.objects.create_user(username=f'customer{i}')
+            CustomerProfile.objects.create(user=user, account_number=f'ACC{i:05d}', address=address,
+                                           phone_number='555-0100')
+            self.customers.append(user)
+    
+    def create(self, customer, description, service_type=None):
+        # Requests are signed once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return ServiceRequest.objects.create(customer=self.customers[customer],
+                                                 service_type=service_type or self.leak, description=description)
+    
+    def test_address_tokens(self):
+        self.assertEqual(address_tokens('Apt 4, 12 Elm St., Springfield 62704'),
+                         {'addr:elm', 'addr:street', 'addr:springfield', 'addr:62704'})
+    
+    def test_new_requests_join_the_cluster_of_their_duplicate(self):
+        first = self.create(0, 'Strong smell of gas outside the school on Elm Street')
+        second = self.create(1, 'Strong gas smell outside the school on Elm Street!')
+        third = self.create(1, 'Strong smell of gas outside the school on Elm Street')
+        elsewhere = self.create(2, 'Hissing noise from the meter in my basement')
+        billing = self.create(0, 'Strong smell of gas outside the school on Elm Street', service_type=self.billing)
+        
+        self.assertEqual(list(duplicates_of(first)), [second, third])
+        self.assertEqual(IncidentCluster.objects.count(), 1)
+        self.assertFalse(duplicates_of(elsewhere).exists())
+        self.assertNotIn(billing, duplicates_of(first))
+    
+    def test_requests_outside_the_window_are_not_duplicates(self):
+        old = self.create(0, 'Strong smell of gas outside the school on Elm Street')
+        ServiceRequest.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=5))
+        RequestSignature.objects.filter(pk=old.pk).delete()
+        self.assertEqual(index_requests([old.pk]), 1)
+        
+        new = self.create(1, 'Strong smell of gas outside the school on Elm Street')
+        self.assertFalse(duplicates_of(new).exists())
+    
+    def test_restored_requests_are_signed_again(self):
+        """Archiving drops a request's signature, and restoring it files it with its duplicates again"""
+        first = self.create(0, 'Strong smell of gas outside the school on Elm Street')
+        second = self.create(1, 'Strong gas smell outside the school on Elm Street!')
+        ServiceRequest.objects.filter(pk=second.pk).update(status='completed')
+        archive_requests(older_than_days=0)
+        self.assertFalse(RequestSignature.objects.filter(pk=second.pk).exists())
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            restore_request(second.request_number)
+        self.assertEqual(list(duplicates_of(first)), [second])
+    
+    def test_backfill_signs_bulk_written_requests(self):
+        requests = ServiceRequest.objects.bulk_create([
+            ServiceRequest(customer=self.customers[i % 2], service_type=self.leak, request_number=f'SR-DUP-{i}',
+                           description='Strong smell of gas outside the school on Elm Street')
+            for i in range(4)
+        ])
+        self.assertFalse(RequestSignature.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            call_command('backfill_duplicate_signatures', '--batch-size', '3', stdout=StringIO())
+        # Each batch of ids is read after the last one instead of all at once
+        reads = [query['sql'] for query in queries
+                 if '"customer_service_requestsignature"."request_id" IS NULL' in query['sql'] and 'LIMIT' in query['sql']]
+        self.assertEqual(len(reads), 3)
+        self.assertTrue(all(sql.endswith('LIMIT 3') for sql in reads))
+        self.assertEqual(RequestSignature.objects.count(), 4)
+        self.assertEqual(set(RequestSignature.objects.values_list('cluster_id', flat=True)),
+                         {IncidentCluster.objects.get().pk})
+        self.assertEqual(duplicates_of(requests[0]).count(), 3)
+        # Already signed requests are skipped
+        self.assertEqual(index_requests([request.pk for request in requests]), 0)
+    
+    def test_candidate_lookup_reads_the_bucket_index(self):
+        now = timezone.now()
+        candidates = SignatureBand.objects.filter(bucket__in=[1, 2], created_at__gte=now, created_at__lte=now)
+        sql, params = candidates.values_list('bucket', 'signature_id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('COVERING INDEX signatureband_bucket_idx', plan)
+    
+    def test_support_page_lists_duplicates(self):
+        first = self.create(0, 'Strong smell of gas outside the school on Elm Street')
+        second = self.create(1, 'Strong gas smell outside the school on Elm Street')
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('support_request_detail', args=[first.request_number]))
+        self.assertContains(response, 'Likely Duplicates (1)')
+        self.assertContains(response, reverse('support_request_detail', args=[second.request_number]))
@@ -0,0 +1,86 @@
+"""
+Conflict-safe changes to service requests.
+
+Staff edit a request from a copy they loaded earlier. Instead of writing
+that copy back over the row with a full save, ``apply_changes`` issues one
+conditional UPDATE that only matches if the row still has the status and
+version the editor saw, and records the status change in the same
+transaction. If someone else got there first nothing is written and
+``TransitionConflict`` is raised for the view to report. Status moves are
+checked against ``ServiceRequest.STATUS_TRANSITIONS`` before touching the
+database.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import ServiceRequest, RequestStatusUpdate
+from .taskqueue import enqueue
+
+
+class TransitionError(Exception):
+    """Raised when a change to a request can't be applied"""
+
+
+class InvalidTransition(TransitionError):
+    """Raised when the state machine doesn't allow the status change"""
+    def __init__(self, old_status, new_status):
+        super().__init__(f'A request cannot move from {old_status} to {new_status}')
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+class TransitionConflict(TransitionError):
+    """Raised when the request changed after the editor loaded it"""
+
+
+def allowed_statuses(status):
+    """The statuses a request in ``status`` can be moved to"""
+    return ServiceRequest.STATUS_TRANSITIONS.get(status, ())
+
+
+def check_transition(old_status, new_status):
+    if new_status != old_status and new_status not in allowed_statuses(old_status):
+        raise InvalidTransition(old_status, new_status)
+
+
+def apply_changes(service_request, user, expected_status, expected_version, notes='', **changes):
+    """Write ``changes`` to ``service_request`` if it still has the expected status and version
+
+    ``changes`` maps field names to new values and may include ``status``.
+    Returns the RequestStatusUpdate written for a status change, or None.
+    The instance is updated in memory to match the row.
+    """
+    new_status = changes.get('status', expected_status)
+    check_transition(expected_status, new_status)
+
+    now = timezone.now()
+    with transaction.atomic():
+        updated = ServiceRequest.objects.filter(
+            pk=service_request.pk, status=expected_status, version=expected_version
+        ).update(version=F('version') + 1, updated_at=now, **changes)
+        if not updated:
+            raise TransitionConflict(f'Request {service_request.request_number} was changed by someone else')
+
+        for name, value in changes.items():
+            setattr(service_request, name, value)
+        service_request.version = expected_version + 1
+        service_request.updated_at = now
+        # The counters, search index and page cache follow saves through post_save
+        post_save.send(sender=ServiceRequest, instance=service_request, created=False,
+                       update_fields=frozenset([*changes, 'version', 'updated_at']), raw=False,
+                       using=ServiceRequest.objects.db)
+
+        status_update = None
+        if new_status != expected_status:
+            status_update = RequestStatusUpdate.objects.create(
+                service_request=service_request,
+                previous_status=expected_status,
+                new_status=new_status,
+                updated_by=user,
+                notes=notes,
+            )
+            # Notify the customer in the background
+            enqueue('notifications.status_changed', status_update_id=status_update.pk)
+    return status_update
@@ -0,0 +1,209 @@
+"""
+Chunked, resumable uploads and content-addressed attachment storage.
+
+A client opens an UploadSession, appends the file in chunks at the offset
+the server reports, and finalizes it. Chunks are streamed straight to a
+partial file while being hashed, and on finalize the file becomes an
+AttachmentBlob keyed by its SHA-256, so identical files are stored once.
+Attaching the finished upload to a request marks the session attached, so
+it can be used only once.
+"""
+import fcntl
+import hashlib
+import os
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+
+from .models import AttachmentBlob, RequestAttachment, UploadSession
+
+READ_SIZE = 64 * 1024
+
+# Running hashes of in-progress uploads in this process, keyed by upload id.
+# Each entry is (offset, hasher); an entry for the wrong offset (a chunk was
+# handled by another worker) is rebuilt from the partial file.
+_hashers = OrderedDict()
+MAX_CACHED_HASHERS = 256
+
+
+class UploadError(Exception):
+    """Raised when a chunk can't be accepted"""
+
+
+class OffsetMismatch(UploadError):
+    """Raised when a chunk doesn't start where the previous one ended"""
+    def __init__(self, expected):
+        super().__init__(f'Expected offset {expected}')
+        self.expected = expected
+
+
+class _MovableFile(File):
+    """A local file that FileSystemStorage can move into place instead of copying"""
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def partial_path(session):
+    """Location of the partially uploaded file for a session"""
+    return os.path.join(settings.CHUNKED_UPLOAD_TEMP_DIR, f'{session.upload_id}.part')
+
+
+def _hash_file(path, limit=None):
+    hasher = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as fh:
+        while remaining is None or remaining > 0:
+            data = fh.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+    return hasher
+
+
+def _cached_hasher(session):
+    """Return a hasher covering the first ``session.received`` bytes of the upload"""
+    key = str(session.upload_id)
+    cached = _hashers.pop(key, None)
+    if cached and cached[0] == session.received:
+        return cached[1]
+    if session.received == 0:
+        return hashlib.sha256()
+    return _hash_file(partial_path(session), limit=session.received)
+
+
+def _remember_hasher(session, offset, hasher):
+    key = str(session.upload_id)
+    _hashers[key] = (offset, hasher)
+    _hashers.move_to_end(key)
+    while len(_hashers) > MAX_CACHED_HASHERS:
+        _hashers.popitem(last=False)
+
+
+def start_upload(user, filename, size):
+    """Open a new upload session"""
+    if size < 0 or size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(f'Uploads are limited to {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes')
+    os.makedirs(settings.CHUNKED_UPLOAD_TEMP_DIR, exist_ok=True)
+    session = UploadSession.objects.create(user=user, filename=os.path.basename(filename)[:255], size=size)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session, offset, stream):
+    """Append bytes read from ``stream`` at ``offset`` and return the new offset
+
+    The partial file is truncated to ``offset`` first, so a chunk that was
+    cut off half way can simply be sent again. Writers hold an exclusive
+    lock on the partial file, so two chunks sent at the same offset are
+    written one after the other and the second is rejected.
+    """
+    if session.status != 'uploading':
+        raise UploadError('Upload is already complete')
+    if offset != session.received:
+        raise OffsetMismatch(session.received)
+
+    written = 0
+    try:
+        fh = open(partial_path(session), 'r+b')
+    except FileNotFoundError:
+        # Finalized since the session was read
+        raise UploadError('Upload is already complete')
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        # Another writer may have appended while this one waited for the lock
+        session.refresh_from_db(fields=['received', 'status'])
+        if session.status != 'uploading':
+            raise UploadError('Upload is already complete')
+        if offset != session.received:
+            raise OffsetMismatch(session.received)
+
+        hasher = _cached_hasher(session)
+        fh.truncate(offset)
+        fh.seek(offset)
+        while True:
+            data = stream.read(READ_SIZE)
+            if not data:
+                break
+            written += len(data)
+            if offset + written > session.size:
+                raise UploadError('More data sent than announced')
+            fh.write(data)
+            hasher.update(data)
+        fh.flush()
+
+        # Advance while still holding the lock, so the next writer sees the new offset
+        new_offset = offset + written
+        updated = UploadSession.objects.filter(pk=session.pk, received=offset, status='uploading').update(
+            received=new_offset
+        )
+        if not updated:
+            session.refresh_from_db()
+            raise OffsetMismatch(session.received)
+    session.received = new_offset
+    _remember_hasher(session, new_offset, hasher)
+    return new_offset
+
+
+def store_blob(path, sha256, size):
+    """Return the blob for ``sha256``, moving ``path`` into storage if it's new
+
+    ``path`` is consumed either way: moved into place, or deleted when the
+    contents are already stored.
+    """
+    blob = AttachmentBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        blob = AttachmentBlob(sha256=sha256, size=size)
+        with open(path, 'rb') as fh:
+            blob.file.save(sha256, _MovableFile(fh), save=False)
+        try:
+            with transaction.atomic():
+                blob.save()
+        except IntegrityError:
+            # Someone stored the same contents concurrently; use theirs
+            blob.file.delete(save=False)
+            blob = AttachmentBlob.objects.get(sha256=sha256)
+    if os.path.exists(path):
+        os.remove(path)
+    return blob
+
+
+def finalize_upload(session):
+    """Verify a fully received upload and turn it into a deduplicated blob"""
+    if session.status != 'uploading':
+        return session.blob
+    if session.received != session.size:
+        raise UploadError(f'Upload incomplete: {session.received} of {session.size} bytes received')
+
+    hasher = _cached_hasher(session)
+    sha256 = hasher.hexdigest()
+    blob = store_blob(partial_path(session), sha256, session.size)
+    session.blob = blob
+    session.status = 'complete'
+    session.save(update_fields=['blob', 'status', 'updated_at'])
+    return blob
+
+
+def blob_from_uploaded_file(uploaded_file):
+    """Hash a regular form upload and store it as a blob"""
+    os.makedirs(settings.CHUNKED_UPLOAD_TEMP_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    path = os.path.join(settings.CHUNKED_UPLOAD_TEMP_DIR, f'form-{os.getpid()}-{id(uploaded_file)}.part')
+    with open(path, 'wb') as fh:
+        for chunk in uploaded_file.chunks():
+            hasher.update(chunk)
+            fh.write(chunk)
+    return store_blob(path, hasher.hexdigest(), uploaded_file.size)
+
+
+def attach_blob(service_request, blob, filename):
+    """Attach stored contents to a service request under the customer's filename"""
+    return RequestAttachment.objects.create(
+        service_request=service_request,
+        blob=blob,
+        file=blob.file.name,
+        filename=filename,
+    )
@@ -6,9 +6,24 @@ urlpatterns = [
     path('requests/', views.request_list, name='request_list'),
     path('requests/create/', views.create_request, name='create_request'),
     path('requests/<str:request_number>/', views.request_detail, name='request_detail'),
+    path('attachments/<int:attachment_id>/', views.download_attachment, name='download_attachment'),
+    
+    # Chunked upload URLs
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
     
     # Support staff URLs
     path('support/dashboard/', views.support_dashboard, name='support_dashboard'),
+    path('support/feed/', views.dashboard_feed, name='dashboard_feed'),
+    path('support/feed/poll/', views.dashboard_feed_poll, name='dashboard_feed_poll'),
+    path('support/claim/', views.claim_next, name='claim_next'),
+    path('support/bulk/', views.bulk_update_requests, name='bulk_update_requests'),
+    path('support/export/', views.export_requests, name='export_requests'),
+    path('support/analytics/', views.support_analytics, name='support_analytics'),
+    path('support/analytics/data/', views.support_analytics_data, name='support_analytics_data'),
     path('support/requests/<str:request_number>/', views.support_request_detail, name='support_request_detail'),
     path('support/requests/<str:request_number>/update/', views.update_request, name='update_request'),
+    path('support/requests/<str:request_number>/restore/', views.restore_archived_request,
+         name='restore_archived_request'),
 ]
@@ -1,127 +1,512 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import uuid
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.template.loader import render_to_string
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST, require_http_methods
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from .models import ServiceRequest, ServiceType, RequestAttachment, RequestStatusUpdate
-from .forms import ServiceRequestForm, RequestStatusUpdateForm, SupportRequestUpdateForm
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from gas_utility.asyncviews import aresolve_user
+from .models import (
+    ServiceRequest, RequestAttachment, RequestStatusUpdate, UploadSession, ArchivedServiceRequest, ArchivedAttachment,
+)
+from .forms import ServiceRequestForm, RequestStatusUpdateForm, SupportRequestUpdateForm, BulkStatusForm
+from .analytics import GROUPINGS, METRIC_LABELS, PERCENTILES, format_duration, sla_report
+from .archive import restore_request
+from .assignment import auto_assignment
+from .caching import acached_fragment
+from .counters import astatus_counts
+from .downloads import serve_file
+from .duplicates import duplicates_of
+from .pagination import apaginate_keyset
+from .export import CONTENT_TYPES, stream_export
+from .feed import aevent_stream, alatest_position, await_changes, event_stream, parse_cursor
+from .filters import filter_requests, search_truncated
+from .incidents import bulk_transition
+from .processing import schedule_processing
+from .registry import service_types
+from .taskqueue import enqueue
+from .transitions import TransitionConflict, apply_changes
+from .uploads import (
+    OffsetMismatch, UploadError, append_chunk, attach_blob, blob_from_uploaded_file, finalize_upload, start_upload,
+)
+from .workqueue import claim_next_request
+
+CONFLICT_MESSAGE = ('Someone else changed this request while you were editing it. '
+                    'Nothing was saved; please review the current details and try again.')
+
+# Likely duplicates listed on the support request page
+DUPLICATES_SHOWN = 20
 
 @login_required
-def request_list(request):
+async def request_list(request):
     """View to display a list of customer's service requests"""
-    # Get all service requests for the current user
-    requests = ServiceRequest.objects.filter(customer=request.user).order_by('-created_at')
+    user = await aresolve_user(request)
     
-    return render(request, 'customer_service/request_list.html', {
-        'requests': requests
-    })
+    async def render_list():
+        # Get all service requests for the current user, with type names from the registry
+        requests = await service_types.aattach([
+            service_request async for service_request in
+            ServiceRequest.objects.filter(customer=user).order_by('-created_at')
+        ])
+        return render_to_string('customer_service/_request_list_body.html', {'requests': requests})
+    
+    # Re-rendered only when one of the customer's requests changes
+    body, hit = await acached_fragment(
+        'request_list', [('customer', user.pk), ('service_types', 'all')], render_list
+    )
+    response = render(request, 'customer_service/request_list.html', {'body': body})
+    response['X-Fragment-Cache'] = 'hit' if hit else 'miss'
+    return response
 
 @login_required
 def create_request(request):
     """View to create a new service request"""
     if request.method == 'POST':
-        form = ServiceRequestForm(request.POST)
+        form = ServiceRequestForm(request.POST, request.FILES)
         if form.is_valid():
-            # Create service request but don't save to DB yet
-            service_request = form.save(commit=False)
-            # Set the customer to the current user
-            service_request.customer = request.user
-            # Now save to DB
-            service_request.save()
-            
-            # Handle file attachment
-            if 'attachments' in request.FILES:
-                file = request.FILES['attachments']
-                RequestAttachment.objects.create(
+            # An automatic assignment is given back if saving the request fails
+            with auto_assignment() as assign, transaction.atomic():
+                # Create service request but don't save to DB yet
+                service_request = form.save(commit=False)
+                # Set the customer to the current user
+                service_request.customer = request.user
+                # Hand it to the least loaded staff member who handles this service type
+                if settings.AUTO_ASSIGN_NEW_REQUESTS:
+                    assign(service_request)
+                # Now save to DB
+                service_request.save()
+                
+                # Handle file attachments, each stored once per distinct content
+                attachments = [
+                    attach_blob(service_request, blob_from_uploaded_file(file), file.name)
+                    for file in form.cleaned_data['attachments']
+                ]
+                
+                # Attach any files sent ahead through the chunked upload endpoints
+                uploads = UploadSession.objects.filter(
+                    user=request.user, status='complete',
+                    upload_id__in=[value for value in request.POST.getlist('upload_ids') if is_uuid(value)]
+                ).select_related('blob')
+                for upload in uploads:
+                    # Only the request that marks the upload attached gets it, so
+                    # a replayed or concurrent submit can't attach it twice
+                    if UploadSession.objects.filter(pk=upload.pk, status='complete').update(status='attached'):
+                        attachments.append(attach_blob(service_request, upload.blob, upload.filename))
+                
+                # Inspect the files and build thumbnails after the request is saved
+                schedule_processing(attachment.pk for attachment in attachments)
+                
+                # Create initial status update
+                RequestStatusUpdate.objects.create(
                     service_request=service_request,
-                    file=file,
-                    filename=file.name
+                    previous_status='',
+                    new_status='pending',
+                    updated_by=request.user,
+                    notes='Service request created'
                 )
-            
-            # Create initial status update
-            RequestStatusUpdate.objects.create(
-                service_request=service_request,
-                previous_status='',
-                new_status='pending',
-                updated_by=request.user,
-                notes='Service request created'
-            )
+                
+                # Send the confirmation email in the background
+                enqueue('notifications.request_created', request_id=service_request.pk)
+                if service_request.assigned_to_id:
+                    enqueue('notifications.request_assigned', request_id=service_request.pk)
             
             messages.success(request, f'Your service request has been created with reference number {service_request.request_number}')
             return redirect('request_detail', request_number=service_request.request_number)
     else:
         form = ServiceRequestForm()
     
-    # Get all active service types
-    service_types = ServiceType.objects.filter(is_active=True)
-    
     return render(request, 'customer_service/create_request.html', {
         'form': form,
-        'service_types': service_types
+        # Active service types come from the in-process registry
+        'service_types': service_types.active()
     })
 
 @login_required
-def request_detail(request, request_number):
+async def request_detail(request, request_number):
     """View to display details of a specific service request"""
-    # Get the service request, ensuring it belongs to the current user
-    service_request = get_object_or_404(ServiceRequest, 
-                                       request_number=request_number, 
-                                       customer=request.user)
-    
-    # Get status updates for this request
-    status_updates = service_request.status_updates.all().order_by('-created_at')
+    user = await aresolve_user(request)
     
-    # Get attachments for this request
-    attachments = service_request.attachments.all()
+    async def render_detail():
+        # Get the service request, ensuring it belongs to the current user
+        try:
+            service_request = await ServiceRequest.objects.select_related('customer__profile').aget(
+                request_number=request_number,
+                customer=user
+            )
+        except ServiceRequest.DoesNotExist:
+            # Old closed requests live in the archive
+            service_request = await aget_object_or_404(
+                ArchivedServiceRequest.objects.select_related('customer__profile'),
+                request_number=request_number,
+                customer=user
+            )
+        await service_types.aattach([service_request])
+        
+        # Get status updates for this request
+        status_updates = [update async for update in service_request.status_updates.all().order_by('-created_at')]
+        
+        # Get attachments for this request
+        attachments = [attachment async for attachment in service_request.attachments.all()]
+        
+        return render_to_string('customer_service/_request_detail_body.html', {
+            'service_request': service_request,
+            'status_updates': status_updates,
+            'attachments': attachments
+        })
     
-    return render(request, 'customer_service/request_detail.html', {
-        'service_request': service_request,
-        'status_updates': status_updates,
-        'attachments': attachments
+    # Cached per viewer, so a hit means the ownership check already passed
+    body, hit = await acached_fragment(
+        'request_detail',
+        [('request', request_number), ('profile', user.pk), ('service_types', 'all')],
+        render_detail,
+        vary=[user.pk],
+    )
+    response = render(request, 'customer_service/request_detail.html', {
+        'request_number': request_number,
+        'body': body
     })
+    response['X-Fragment-Cache'] = 'hit' if hit else 'miss'
+    return response
+
+def is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+def upload_status(session):
+    return {
+        'upload_id': str(session.upload_id),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'status': session.status,
+        'chunk_size': settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    }
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Open a chunked upload session for a file of the announced size"""
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'size is required'}, status=400)
+    filename = request.POST.get('filename', '').strip()
+    if not filename:
+        return JsonResponse({'error': 'filename is required'}, status=400)
+    
+    try:
+        session = start_upload(request.user, filename, size)
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=413)
+    return JsonResponse(upload_status(session), status=201)
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_chunk(request, upload_id):
+    """Report how much of an upload has arrived (GET) or append the next chunk (PATCH)
+
+    A PATCH must carry an ``Upload-Offset`` header equal to the current
+    offset; on a mismatch the response is 409 with the offset to resume from.
+    """
+    session = get_object_or_404(UploadSession, upload_id=upload_id, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset header is required'}, status=400)
+        try:
+            append_chunk(session, offset, request)
+        except OffsetMismatch:
+            return JsonResponse(upload_status(session), status=409)
+        except UploadError as exc:
+            return JsonResponse({'error': str(exc), **upload_status(session)}, status=400)
+    
+    response = JsonResponse(upload_status(session))
+    response['Upload-Offset'] = str(session.received)
+    return response
+
+@login_required
+@require_POST
+def upload_finalize(request, upload_id):
+    """Verify a completed upload and store it by content hash"""
+    session = get_object_or_404(UploadSession, upload_id=upload_id, user=request.user)
+    try:
+        blob = finalize_upload(session)
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc), **upload_status(session)}, status=400)
+    return JsonResponse({**upload_status(session), 'sha256': blob.sha256})
+
+@login_required
+def download_attachment(request, attachment_id):
+    """Serve an attachment to the customer who owns the request or to staff"""
+    try:
+        attachment = RequestAttachment.objects.select_related('service_request', 'blob').get(pk=attachment_id)
+    except RequestAttachment.DoesNotExist:
+        # Attachments of archived requests keep their ids
+        attachment = get_object_or_404(ArchivedAttachment.objects.select_related('service_request', 'blob'),
+                                       pk=attachment_id)
+    if not request.user.is_staff and attachment.service_request.customer_id != request.user.pk:
+        raise Http404('No attachment found')
+    
+    # Thumbnails are built in the background and may not exist yet
+    if request.GET.get('thumbnail') == '1':
+        if not attachment.thumbnail:
+            raise Http404('No thumbnail available')
+        try:
+            return serve_file(request, attachment.thumbnail, f'{attachment.filename}.jpg',
+                              f'{attachment.pk}-{attachment.thumbnail.name}')
+        except FileNotFoundError:
+            raise Http404('Thumbnail file is missing')
+    
+    # Content-addressed files are identified by their hash; older ones by name
+    etag = attachment.blob.sha256 if attachment.blob else f'{attachment.pk}-{attachment.file.name}'
+    try:
+        return serve_file(request, attachment.file, attachment.filename, etag,
+                          as_attachment=request.GET.get('download') == '1')
+    except FileNotFoundError:
+        raise Http404('Attachment file is missing')
 
 @staff_member_required
-def support_dashboard(request):
+async def support_dashboard(request):
     """Dashboard view for support staff"""
-    # Get all service requests ordered by priority and creation time
-    # We'll filter for status and priority in-code instead of using __in lookup
-    # which isn't supported in the way it was initially written
-    requests = ServiceRequest.objects.all().order_by('-created_at')
+    await aresolve_user(request)
     
-    # Filter requests if search query is provided
-    search_query = request.GET.get('search', '')
-    if search_query:
-        requests = requests.filter(
-            Q(request_number__icontains=search_query) |
-            Q(customer__username__icontains=search_query) |
-            Q(customer__email__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+    # Fetch everything the table displays in the same query as the requests
+    # so rendering a page never triggers per-row lookups; service types come
+    # from the registry instead
+    requests = ServiceRequest.objects.select_related(
+        'customer', 'customer__profile', 'assigned_to'
+    )
     
-    # Filter by status if provided
+    # Filter by search query (through the full-text index), status and date range
+    search_query = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
-    if status_filter and status_filter != 'all':
-        requests = requests.filter(status=status_filter)
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    # The search backends run raw SQL, so the lookup runs in a worker thread
+    filters = {'search': search_query, 'status': status_filter, 'date_from': date_from, 'date_to': date_to,
+               'search_limit': settings.SEARCH_MAX_RESULTS}
+    # Only the best-ranked matches are listed, so say when some were left out
+    truncated = await sync_to_async(search_truncated)(requests, **filters)
+    requests = await sync_to_async(filter_requests)(requests, **filters)
+    
+    # The live feed patches the first unfiltered page with changes made after
+    # it was rendered, so note the latest change before reading the page
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    live = not (search_query or status_filter or date_from or date_to or after or before)
+    feed_cursor = await alatest_position() if live else None
+    
+    # Page through the results newest first using keyset cursors
+    page_size = settings.SUPPORT_DASHBOARD_PAGE_SIZE
+    try:
+        page_size = min(int(request.GET.get('page_size', page_size)), settings.SUPPORT_DASHBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        pass
+    page_size = max(page_size, 1)
+    page = await apaginate_keyset(
+        requests,
+        after=after,
+        before=before,
+        page_size=page_size,
+    )
+    await service_types.aattach(page)
     
-    # Get request counts by status for dashboard stats
-    status_counts = ServiceRequest.objects.values('status').annotate(count=Count('status'))
-    stats = {item['status']: item['count'] for item in status_counts}
+    # Get request counts by status for dashboard stats from the running counters
+    stats = await astatus_counts()
     
     return render(request, 'customer_service/support_dashboard.html', {
-        'requests': requests,
+        'requests': page,
+        'page': page,
         'search_query': search_query,
+        'search_truncated': truncated,
+        'search_max_results': settings.SEARCH_MAX_RESULTS,
         'status_filter': status_filter,
-        'stats': stats
+        'date_from': date_from,
+        'date_to': date_to,
+        'stats': stats,
+        'feed_cursor': feed_cursor,
+        'page_size': page_size,
+        'bulk_form': BulkStatusForm(),
+    })
+
+@staff_member_required
+async def dashboard_feed(request):
+    """Stream new requests and status changes to the dashboard as Server-Sent Events"""
+    await aresolve_user(request)
+    
+    # Browsers resume with Last-Event-ID after a reconnect
+    cursor = parse_cursor(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    if cursor is None:
+        cursor = await alatest_position()
+    
+    # Under WSGI a sync iterator streams as it goes; async ones would be buffered
+    stream = aevent_stream(cursor) if isinstance(request, ASGIRequest) else event_stream(cursor)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@staff_member_required
+async def dashboard_feed_poll(request):
+    """Long-poll fallback for the dashboard feed: wait for changes after ``after`` and return them"""
+    await aresolve_user(request)
+    cursor = parse_cursor(request.GET.get('after'))
+    if cursor is None:
+        return JsonResponse({'cursor': await alatest_position(), 'events': []})
+    
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.LIVE_FEED_LONG_POLL_SECONDS)),
+                      settings.LIVE_FEED_LONG_POLL_SECONDS)
+    except ValueError:
+        timeout = settings.LIVE_FEED_LONG_POLL_SECONDS
+    events = await await_changes(cursor, max(timeout, 0))
+    return JsonResponse({'cursor': events[-1]['id'] if events else cursor, 'events': events})
+
+@staff_member_required
+@require_POST
+def claim_next(request):
+    """View for support staff to take the most urgent unassigned request"""
+    service_request = claim_next_request(request.user)
+    if service_request is None:
+        messages.info(request, 'There are no unassigned pending requests')
+        return redirect('support_dashboard')
+    messages.success(request, f'Service request {service_request.request_number} is now assigned to you')
+    return redirect('support_request_detail', request_number=service_request.request_number)
+
+@staff_member_required
+@require_POST
+def bulk_update_requests(request):
+    """View for support staff to move many requests to one status, or count how many would move"""
+    form = BulkStatusForm(request.POST)
+    # Go back to the dashboard with the same filters
+    filters = {name: request.POST[name] for name in ('search', 'status', 'date_from', 'date_to')
+               if request.POST.get(name)}
+    dashboard_url = f"{reverse('support_dashboard')}?{urlencode(filters)}"
+    if not form.is_valid():
+        for error in form.non_field_errors() or ['Choose a status to move the requests to.']:
+            messages.warning(request, error)
+        return redirect(dashboard_url)
+    
+    filters = form.filters()
+    if form.cleaned_data['scope'] == 'selected':
+        requests = ServiceRequest.objects.filter(request_number__in=form.cleaned_data['request_numbers'])
+    else:
+        # Unlike the dashboard, an incident covers every match, not just the first page of search results
+        requests = filter_requests(ServiceRequest.objects.all(), **filters)
+    
+    new_status = form.cleaned_data['new_status']
+    label = dict(ServiceRequest.STATUS_CHOICES)[new_status]
+    if 'dry_run' in request.POST:
+        count = bulk_transition(requests, request.user, new_status, dry_run=True)
+        messages.info(request, f'{count} request(s) would move to {label}. Nothing has been changed yet.')
+    else:
+        count = bulk_transition(requests, request.user, new_status, notes=form.cleaned_data['notes'])
+        messages.success(request, f'{count} request(s) moved to {label}')
+    return redirect(dashboard_url)
+
+def analytics_params(request):
+    """Date range and grouping for the SLA reports, defaulting to the last 30 days by service type"""
+    today = timezone.localdate()
+    try:
+        date_to = date.fromisoformat(request.GET.get('date_to', ''))
+    except ValueError:
+        date_to = today
+    try:
+        date_from = date.fromisoformat(request.GET.get('date_from', ''))
+    except ValueError:
+        date_from = date_to - timedelta(days=29)
+    group_by = request.GET.get('group_by', 'service_type')
+    if group_by not in GROUPINGS:
+        group_by = 'service_type'
+    return date_from, date_to, group_by
+
+@staff_member_required
+def support_analytics(request):
+    """SLA analytics page for support staff, built from the daily rollups"""
+    date_from, date_to, group_by = analytics_params(request)
+    report = sla_report(date_from, date_to, group_by)
+    
+    # One table row per group and metric, with durations ready to display
+    rows = []
+    for group in report:
+        for metric, summary in group['metrics'].items():
+            rows.append({
+                'label': group['label'],
+                'metric': METRIC_LABELS[metric],
+                'count': summary['count'],
+                'mean': format_duration(summary['mean_seconds']),
+                'percentiles': [format_duration(summary[f'p{pct}_seconds']) for pct in PERCENTILES],
+            })
+    
+    return render(request, 'customer_service/support_analytics.html', {
+        'rows': rows,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'group_by': group_by,
+        'percentiles': PERCENTILES,
     })
 
+@staff_member_required
+def support_analytics_data(request):
+    """The SLA report as JSON, with durations in seconds"""
+    date_from, date_to, group_by = analytics_params(request)
+    return JsonResponse({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'group_by': group_by,
+        'groups': sla_report(date_from, date_to, group_by),
+    })
+
+@staff_member_required
+def export_requests(request):
+    """Stream service requests and their status history as CSV or NDJSON"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in CONTENT_TYPES:
+        export_format = 'csv'
+    
+    # Apply the same filters as the dashboard, but export every match
+    requests = filter_requests(
+        ServiceRequest.objects.all(),
+        search=request.GET.get('search', ''),
+        status=request.GET.get('status', ''),
+        date_from=request.GET.get('date_from', ''),
+        date_to=request.GET.get('date_to', ''),
+    )
+    
+    response = StreamingHttpResponse(stream_export(requests, export_format),
+                                     content_type=CONTENT_TYPES[export_format])
+    filename = f"service_requests_{timezone.now():%Y%m%d_%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @staff_member_required
 def support_request_detail(request, request_number):
     """View for support staff to see details of a service request"""
-    # Get the service request
-    service_request = get_object_or_404(ServiceRequest, request_number=request_number)
+    # Get the service request along with everything the page displays about it
+    try:
+        service_request = ServiceRequest.objects.select_related('customer__profile', 'assigned_to').get(
+            request_number=request_number
+        )
+    except ServiceRequest.DoesNotExist:
+        return archived_request_detail(request, request_number)
+    service_types.attach([service_request])
     
     # Get status updates for this request
-    status_updates = service_request.status_updates.all().order_by('-created_at')
+    status_updates = service_request.status_updates.select_related('updated_by').order_by('-created_at')
     
     # Get attachments for this request
     attachments = service_request.attachments.all()
@@ -130,19 +515,19 @@ def support_request_detail(request, request_number):
     if request.method == 'POST':
         status_form = RequestStatusUpdateForm(request.POST, service_request=service_request)
         if status_form.is_valid():
-            status_update = status_form.save(commit=False)
-            status_update.service_request = service_request
-            status_update.previous_status = service_request.status
-            status_update.updated_by = request.user
-            
-            # Update the service request status
-            service_request.status = status_update.new_status
-            service_request.save()
-            
-            # Save the status update
-            status_update.save()
-            
-            messages.success(request, f'Status updated to {status_update.get_new_status_display()}')
+            try:
+                # Only applies if nobody changed the request since the form was rendered
+                status_update = apply_changes(
+                    service_request, request.user,
+                    expected_status=service_request.status,
+                    expected_version=status_form.cleaned_data['version'],
+                    notes=status_form.cleaned_data['notes'],
+                    status=status_form.cleaned_data['new_status'],
+                )
+            except TransitionConflict:
+                messages.warning(request, CONFLICT_MESSAGE)
+            else:
+                messages.success(request, f'Status updated to {status_update.get_new_status_display()}')
             return redirect('support_request_detail', request_number=request_number)
     else:
         status_form = RequestStatusUpdateForm(service_request=service_request)
@@ -150,14 +535,43 @@ def support_request_detail(request, request_number):
     # Create form for updating the request
     update_form = SupportRequestUpdateForm(instance=service_request)
     
+    # Other reports of the same incident
+    duplicates = duplicates_of(service_request)
+    
     return render(request, 'customer_service/support_request_detail.html', {
         'service_request': service_request,
         'status_updates': status_updates,
         'attachments': attachments,
         'status_form': status_form,
-        'update_form': update_form
+        'update_form': update_form,
+        'duplicates': duplicates.select_related('customer')[:DUPLICATES_SHOWN],
+        'duplicate_count': duplicates.count(),
     })
 
+def archived_request_detail(request, request_number):
+    """Read-only view of an archived request for support staff"""
+    service_request = get_object_or_404(
+        ArchivedServiceRequest.objects.select_related('customer__profile', 'assigned_to'),
+        request_number=request_number
+    )
+    service_types.attach([service_request])
+    
+    return render(request, 'customer_service/support_request_detail.html', {
+        'service_request': service_request,
+        'status_updates': service_request.status_updates.select_related('updated_by').order_by('-created_at'),
+        'attachments': service_request.attachments.all(),
+        'archived': True
+    })
+
+@staff_member_required
+@require_POST
+def restore_archived_request(request, request_number):
+    """View for support staff to move an archived request back into the working tables"""
+    if restore_request(request_number) is None:
+        raise Http404('No archived request found')
+    messages.success(request, f'Service request {request_number} has been restored')
+    return redirect('support_request_detail', request_number=request_number)
+
 @staff_member_required
 def update_request(request, request_number):
     """View for support staff to update a service request"""
@@ -165,23 +579,30 @@ def update_request(request, request_number):
     service_request = get_object_or_404(ServiceRequest, request_number=request_number)
     
     if request.method == 'POST':
+        # Get the old values before the form copies the new ones onto the instance
+        old_status = service_request.status
+        old_assigned_to_id = service_request.assigned_to_id
         form = SupportRequestUpdateForm(request.POST, instance=service_request)
         if form.is_valid():
-            # Get the old status before saving
-            old_status = service_request.status
-            
-            # Save the form
-            updated_request = form.save()
-            
-            # If status has changed, create a status update
-            if old_status != updated_request.status:
-                RequestStatusUpdate.objects.create(
-                    service_request=updated_request,
-                    previous_status=old_status,
-                    new_status=updated_request.status,
-                    updated_by=request.user,
-                    notes=request.POST.get('status_notes', '')
-                )
+            changes = {name: form.cleaned_data[name] for name in ('status', 'priority', 'assigned_to', 'support_notes')}
+            try:
+                with transaction.atomic():
+                    # Write only the edited fields, and only if nobody else changed the request meanwhile
+                    apply_changes(
+                        service_request, request.user,
+                        expected_status=old_status,
+                        expected_version=form.cleaned_data['version'],
+                        notes=request.POST.get('status_notes', ''),
+                        **changes
+                    )
+                    
+                    # Let a newly assigned staff member know, unless they assigned themselves
+                    if service_request.assigned_to_id not in (None, old_assigned_to_id, request.user.pk):
+                        enqueue('notifications.request_assigned', request_id=service_request.pk,
+                                assigned_by_id=request.user.pk)
+            except TransitionConflict:
+                messages.warning(request, CONFLICT_MESSAGE)
+                return redirect('update_request', request_number=request_number)
             
             messages.success(request, f'Service request {service_request.request_number} has been updated')
             return redirect('support_request_detail', request_number=request_number)
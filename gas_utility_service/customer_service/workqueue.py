@@ -0,0 +1,54 @@
+"""
+"Claim next request" work queue for support staff.
+
+``claim_next_request`` hands a member of staff the most urgent unassigned
+pending request (emergency, high, medium, low; oldest first within a
+priority), assigns it to them and moves it to in progress. The candidate
+is the first entry of ``servicerequest_queue_idx``, so a claim reads one
+index entry however long the backlog is.
+
+On databases with row locks the candidate is locked with SKIP LOCKED, so
+concurrent claimers each get a different row without waiting on each
+other. Elsewhere (SQLite) the claim is still exclusive because it goes
+through ``apply_changes``, which only writes if the row still has the
+version the claimer read; a claimer that loses the race moves on to the
+next candidate.
+"""
+from django.db import connection, transaction
+
+from .models import ServiceRequest
+from .transitions import TransitionConflict, apply_changes
+
+CLAIM_ATTEMPTS = 5
+CLAIM_NOTES = 'Claimed from the work queue'
+
+
+def queue():
+    """Unassigned pending requests in the order the work queue hands them out"""
+    return (ServiceRequest.objects.filter(status='pending', assigned_to__isnull=True)
+            .order_by('priority_rank', 'created_at'))
+
+
+def claim_next_request(user):
+    """Assign the next request in the queue to ``user`` and start work on it
+
+    Returns the claimed ServiceRequest, or None if the queue is empty.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            candidates = queue()
+            if connection.features.has_select_for_update_skip_locked:
+                # Requests another member of staff is claiming are skipped instead of waited on
+                candidates = candidates.select_for_update(skip_locked=True, of=('self',))
+            service_request = candidates.first()
+            if service_request is None:
+                return None
+            try:
+                apply_changes(service_request, user, expected_status='pending',
+                              expected_version=service_request.version, notes=CLAIM_NOTES,
+                              status='in_progress', assigned_to=user)
+            except TransitionConflict:
+                # Someone else claimed or changed it first; try the next one
+                continue
+        return service_request
+    return None
@@ -0,0 +1,17 @@
+"""
+Helpers for async views.
+
+Under ASGI an async view runs on the event loop, where the lazy
+``request.user`` set by AuthenticationMiddleware can't be evaluated: it
+would load the session and user synchronously and raise
+SynchronousOnlyOperation. ``aresolve_user`` loads both through the async
+auth and session APIs and puts the real user back on the request, so
+templates and context processors can use it without touching the database.
+"""
+
+
+async def aresolve_user(request):
+    """Load the request's user asynchronously and return it"""
+    user = await request.auser()
+    request.user = user
+    return user
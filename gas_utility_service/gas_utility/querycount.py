@@ -0,0 +1,110 @@
+"""
+Query accounting for views.
+
+``QueryRecorder`` hooks into the database connection and records how many
+queries run, how long they take and which of them repeat. The middleware
+applies it to every request and reports the totals in response headers and
+the log, which makes per-row queries introduced by template changes easy to
+spot.
+"""
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Collapse literals and placeholder lists so queries that differ only in
+# their parameters share a fingerprint
+_FINGERPRINT_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+\b'), '?'),
+    (re.compile(r'%s|\?'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """Return a normalized form of ``sql`` with all parameters replaced by ``?``"""
+    for pattern, replacement in _FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryRecorder:
+    """Context manager recording the queries run on one or more connections"""
+
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.queries = []
+        self._stack = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __enter__(self):
+        for alias in self.aliases:
+            wrapper = connections[alias].execute_wrapper(self)
+            wrapper.__enter__()
+            self._stack.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._stack:
+            self._stack.pop().__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """Fingerprints of queries run more than once, with their counts"""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+class QueryCountMiddleware:
+    """Record query counts, duplicates and SQL time for every request
+
+    Totals are added to the response as ``X-Query-Count``, ``X-Query-Time``
+    (milliseconds) and ``X-Query-Duplicates`` headers. Requests whose count
+    exceeds ``QUERY_COUNT_WARNING_THRESHOLD`` or that repeat one query shape
+    ``QUERY_DUPLICATE_WARNING_THRESHOLD`` times are logged as warnings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_COUNT_WARNING_THRESHOLD', 50)
+        self.duplicate_threshold = getattr(settings, 'QUERY_DUPLICATE_WARNING_THRESHOLD', 3)
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f"{recorder.total_time * 1000:.1f}"
+        response['X-Query-Duplicates'] = str(sum(duplicates.values()) - len(duplicates))
+
+        repeated = {sql: count for sql, count in duplicates.items() if count >= self.duplicate_threshold}
+        if recorder.count > self.threshold or repeated:
+            logger.warning(
+                '%s %s ran %d queries in %.1fms',
+                request.method, request.path, recorder.count, recorder.total_time * 1000,
+            )
+            for sql, count in repeated.items():
+                logger.warning('  %dx %s', count, sql)
+        return response
@@ -2,6 +2,7 @@
 Django settings for gas_utility project.
 """
 
+import copy
 import os
 from pathlib import Path
 
@@ -60,12 +61,68 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gas_utility.wsgi.application'
 
-# Database
-DATABASES = {
-    'default': {
+# Database. DB_PROFILE picks one of:
+#   sqlite         a local SQLite file tuned for many concurrent writers (the
+#                  default): WAL journal so readers never block the writer,
+#                  synchronous=NORMAL, a busy timeout so writers queue instead
+#                  of failing with "database is locked", and BEGIN IMMEDIATE so
+#                  a transaction takes the write lock up front rather than
+#                  failing when it tries to upgrade a read lock
+#   sqlite-legacy  SQLite with the library defaults, kept for comparison
+#   postgres       PostgreSQL through a psycopg connection pool (DB_POOL=0
+#                  keeps one persistent connection per worker instead)
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse, so a restarted database server doesn't fail the next request
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+SQLITE_PATH = os.environ.get('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3'))
+SQLITE_BUSY_TIMEOUT_SECONDS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_SECONDS', 20))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': SQLITE_PATH,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT_SECONDS,
+            'transaction_mode': 'IMMEDIATE',
+            # Run on every new connection
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
+    },
+    'sqlite-legacy': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'gas_utility'),
+        'USER': os.environ.get('POSTGRES_USER', 'gas_utility'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # Pooled connections are returned to the pool after each request,
+        # which doesn't combine with persistent connections
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
+    },
+}
+DATABASES = {
+    'default': DATABASE_PROFILES[DB_PROFILE],
 }
 
 # Password validation
@@ -108,3 +165,157 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
+
+# Support dashboard pagination
+SUPPORT_DASHBOARD_PAGE_SIZE = 25
+SUPPORT_DASHBOARD_MAX_PAGE_SIZE = 200
+
+# Full-text search. Leave SEARCH_BACKEND unset to pick the backend matching
+# the database engine (SQLite FTS5 or Postgres tsvector)
+SEARCH_BACKEND = None
+# Maximum number of ranked matches a dashboard or API search lists. The
+# dashboard notes when more matched, and the API sets X-Search-Truncated
+SEARCH_MAX_RESULTS = 1000
+
+# Query accounting: adds X-Query-* headers to responses and logs views that
+# run too many or duplicated queries. The middleware is sync-only, so under
+# ASGI it makes Django run the whole request synchronously; turn it off
+# (QUERY_ACCOUNTING=0) when measuring async throughput
+QUERY_ACCOUNTING = os.environ.get('QUERY_ACCOUNTING', '1' if DEBUG else '0') == '1'
+QUERY_COUNT_WARNING_THRESHOLD = 50
+QUERY_DUPLICATE_WARNING_THRESHOLD = 3
+if QUERY_ACCOUNTING:
+    MIDDLEWARE.insert(0, 'gas_utility.querycount.QueryCountMiddleware')
+
+# Chunked attachment uploads. Partial files are kept outside MEDIA_ROOT so
+# they are never served, but on the same filesystem so finished uploads can
+# be moved into place
+CHUNKED_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'upload_tmp')
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# Unfinished upload sessions older than this are removed by cleanup_uploads
+CHUNKED_UPLOAD_EXPIRY_HOURS = 48
+
+# How attachment downloads are served once access has been checked:
+#   'django'           - stream from Django (sendfile() where the server supports it)
+#   'x-accel-redirect' - hand off to nginx via an internal location that maps
+#                        ATTACHMENT_ACCEL_PREFIX to MEDIA_ROOT
+#   'x-sendfile'       - hand off to Apache/lighttpd with the file's full path
+ATTACHMENT_SERVE_MODE = 'django'
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Attachment post-processing (content type detection, EXIF stripping and
+# thumbnails). Work runs on a thread pool of ATTACHMENT_WORKERS threads after
+# the request commits; 0 processes attachments inline. Anything missed is
+# picked up by the process_attachments command
+ATTACHMENT_WORKERS = 2
+ATTACHMENT_MAX_FILES = 10
+ATTACHMENT_PROCESSING_MAX_ATTEMPTS = 3
+ATTACHMENT_PROCESSING_TIMEOUT_MINUTES = 15
+
+# Background task queue. Tasks are stored and `manage.py runworker` processes
+# them, retrying failures with exponential backoff. With TASK_QUEUE_EAGER=1
+# they run in the process that queued them instead, once its transaction
+# commits; failures are logged and never undo the write
+TASK_QUEUE_EAGER = os.environ.get('TASK_QUEUE_EAGER') == '1'
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF_SECONDS = 5
+TASK_RETRY_BACKOFF_MAX_SECONDS = 15 * 60
+# Running tasks whose worker hasn't finished them after this long are requeued
+TASK_LOCK_TIMEOUT_SECONDS = 10 * 60
+
+# Notification emails are printed to the console unless a mail server is configured
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'support@gas-utility.local'
+
+# Live dashboard feed. Each open stream checks the change log every
+# LIVE_FEED_POLL_INTERVAL seconds and ends after LIVE_FEED_STREAM_SECONDS, when
+# the browser reconnects and resumes from the last event it received
+LIVE_FEED_POLL_INTERVAL = 1.0
+LIVE_FEED_STREAM_SECONDS = 300
+LIVE_FEED_KEEPALIVE_SECONDS = 15
+LIVE_FEED_LONG_POLL_SECONDS = 25
+LIVE_FEED_RETRY_MS = 3000
+LIVE_FEED_BATCH_SIZE = 100
+# Change log entries older than this are removed by prune_request_changes
+LIVE_FEED_RETENTION_HOURS = 24
+
+# Caching. CACHE_BACKEND selects per-process memory ('locmem'), a directory
+# shared by all processes ('file', CACHE_LOCATION is the path) or a
+# Redis-compatible server ('redis', CACHE_LOCATION is a redis:// URL). Run
+# more than one server process only with a shared backend, or a change made
+# through one process won't invalidate pages cached by the others
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache') if CACHE_BACKEND == 'file' else ''),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+    },
+}
+if CACHE_BACKEND != 'redis':
+    # Eviction for the memory and file backends: once MAX_ENTRIES is reached,
+    # 1/CULL_FREQUENCY of the entries are dropped. Redis evicts according to
+    # the server's maxmemory-policy instead (allkeys-lru works well)
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        'CULL_FREQUENCY': int(os.environ.get('CACHE_CULL_FREQUENCY', 3)),
+    }
+
+# Rendered fragments of the customer pages, invalidated through version
+# tokens whenever the data they show changes
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Request numbers. The default generator is time-ordered (ULID-style) and
+# needs no database access; BlockRequestNumberGenerator issues a plain
+# sequence, reserving REQUEST_NUMBER_BLOCK_SIZE numbers per thread at a time
+REQUEST_NUMBER_GENERATOR = os.environ.get(
+    'REQUEST_NUMBER_GENERATOR', 'customer_service.numbering.TimeOrderedRequestNumberGenerator'
+)
+REQUEST_NUMBER_BLOCK_SIZE = 100
+# Blocks are reserved on a connection of their own, so a reservation commits
+# at once even if the transaction that needed it rolls back. SQLite allows
+# one writer per file, so SQLite profiles keep the blocks in a file next to
+# the main database; after migrating the default database, create it with
+# `manage.py migrate --database sequences`. The time-ordered generator
+# needs none of this
+SEQUENCE_DATABASE = 'sequences'
+if REQUEST_NUMBER_GENERATOR.endswith('.BlockRequestNumberGenerator'):
+    DATABASES[SEQUENCE_DATABASE] = copy.deepcopy(DATABASES['default'])
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        DATABASES[SEQUENCE_DATABASE]['NAME'] = f'{SQLITE_PATH}-sequences'
+    DATABASE_ROUTERS = ['customer_service.numbering.SequenceRouter']
+
+# Archival. archive_requests moves requests that have been completed or
+# cancelled for longer than ARCHIVE_AFTER_DAYS into the archive tables,
+# ARCHIVE_BATCH_SIZE per transaction
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = 500
+
+# Automatic assignment. With AUTO_ASSIGN_NEW_REQUESTS on, new requests go to
+# the least loaded active staff member who handles their service type, from
+# an in-process view of the workloads reloaded every
+# ASSIGNMENT_REFRESH_SECONDS. assign_requests assigns anything still waiting,
+# ASSIGNMENT_BATCH_SIZE per transaction
+AUTO_ASSIGN_NEW_REQUESTS = os.environ.get('AUTO_ASSIGN_NEW_REQUESTS', '0') == '1'
+ASSIGNMENT_REFRESH_SECONDS = int(os.environ.get('ASSIGNMENT_REFRESH_SECONDS', 60))
+ASSIGNMENT_BATCH_SIZE = 500
+
+# JSON API page sizes (clients pick up to API_MAX_PAGE_SIZE with page_size=)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Near-duplicate detection. Requests of the same service type created within
+# DUPLICATE_WINDOW_HOURS of each other whose description and address are at
+# least DUPLICATE_SIMILARITY alike (estimated Jaccard similarity of their
+# words) are grouped into one incident cluster. backfill_duplicate_signatures
+# signs DUPLICATE_BATCH_SIZE requests per transaction
+DUPLICATE_SIMILARITY = float(os.environ.get('DUPLICATE_SIMILARITY', 0.6))
+DUPLICATE_WINDOW_HOURS = int(os.environ.get('DUPLICATE_WINDOW_HOURS', 72))
+DUPLICATE_BATCH_SIZE = 500
@@ -0,0 +1,52 @@
+"""
+Test helpers for asserting per-view query budgets.
+"""
+from customer_service.registry import service_types
+
+from .querycount import QueryRecorder
+
+
+class QueryBudgetMixin:
+    """Mixin for TestCase classes that check how many queries a URL runs"""
+
+    def _request(self, method, url, data=None):
+        # In a running process the service type registry is already loaded
+        service_types.all()
+        with QueryRecorder() as recorder:
+            response = getattr(self.client, method)(url, data or {})
+        return response, recorder
+
+    def _describe(self, recorder):
+        lines = [f'  {sql}' for sql, _ in recorder.queries]
+        return '\n'.join(lines)
+
+    def assertQueryBudget(self, url, budget, method='get', data=None):
+        """Request ``url`` and fail if it runs more than ``budget`` queries"""
+        response, recorder = self._request(method, url, data)
+        if recorder.count > budget:
+            self.fail(
+                f'{method.upper()} {url} ran {recorder.count} queries, budget is {budget}:\n'
+                f'{self._describe(recorder)}'
+            )
+        return response
+
+    def assertConstantQueries(self, url, seed, sizes=(1, 5, 10), method='get', data=None):
+        """Check that ``url`` runs the same number of queries as more rows are seeded
+
+        ``seed(n)`` is called before each request to add ``n`` more rows of
+        whatever data the view displays. ``url`` may be a callable returning
+        the URL, for views whose address depends on the seeded rows.
+        """
+        counts = []
+        for size in sizes:
+            seed(size)
+            target = url() if callable(url) else url
+            response, recorder = self._request(method, target, data)
+            self.assertLess(response.status_code, 400, f'{method.upper()} {target} returned {response.status_code}')
+            counts.append(recorder.count)
+        if len(set(counts)) != 1:
+            self.fail(
+                f'{method.upper()} {target} query count grew with the data: '
+                f'{dict(zip(sizes, counts))}\n{self._describe(recorder)}'
+            )
+        return counts[0]
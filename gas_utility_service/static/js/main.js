@@ -56,4 +56,281 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
+
+    // Send attachments through the chunked upload endpoints so large files
+    // survive flaky connections, then submit the form with their upload ids
+    const uploadForm = document.querySelector('form[data-chunked-upload-url]');
+    if (uploadForm) {
+        uploadForm.addEventListener('submit', function(event) {
+            const fileInput = uploadForm.querySelector('input[type="file"]');
+            if (!fileInput || !fileInput.files.length || uploadForm.dataset.uploaded) {
+                return;
+            }
+            event.preventDefault();
+
+            const progress = document.getElementById('upload-progress');
+            const submitButton = uploadForm.querySelector('button[type="submit"]');
+            submitButton.disabled = true;
+
+            const files = Array.from(fileInput.files);
+            files.reduce(function(previous, file, index) {
+                return previous.then(function() {
+                    return uploadInChunks(uploadForm.dataset.chunkedUploadUrl, file, function(sent) {
+                        if (progress) {
+                            const done = Math.round(((index + sent / Math.max(file.size, 1)) / files.length) * 100);
+                            progress.classList.remove('d-none');
+                            progress.querySelector('.progress-bar').style.width = done + '%';
+                        }
+                    }).then(function(uploadId) {
+                        const hidden = document.createElement('input');
+                        hidden.type = 'hidden';
+                        hidden.name = 'upload_ids';
+                        hidden.value = uploadId;
+                        uploadForm.appendChild(hidden);
+                    });
+                });
+            }, Promise.resolve()).then(function() {
+                // The files have been sent already, so don't post them again
+                fileInput.disabled = true;
+                uploadForm.dataset.uploaded = 'true';
+                uploadForm.submit();
+            }).catch(function(error) {
+                submitButton.disabled = false;
+                alert('Your attachment could not be uploaded: ' + error.message);
+            });
+        });
+    }
+
+    // Keep the support dashboard current without reloading the page
+    const liveTable = document.getElementById('live-requests');
+    if (liveTable) {
+        watchDashboard(liveTable);
+    }
 });
+
+function getCookie(name) {
+    const match = document.cookie.match(new RegExp('(^|;\\s*)' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[2]) : null;
+}
+
+// Upload a file in chunks, resuming from the server's offset after failures.
+// Resolves with the upload id once the file has been finalized.
+function uploadInChunks(startUrl, file, onProgress) {
+    const headers = {'X-CSRFToken': getCookie('csrftoken')};
+    const maxRetries = 5;
+
+    function request(url, options) {
+        return fetch(url, Object.assign({credentials: 'same-origin', headers: headers}, options));
+    }
+
+    function sendFrom(session, offset, retries) {
+        if (offset >= file.size) {
+            return request(session.url + 'finalize/', {method: 'POST'}).then(function(response) {
+                if (!response.ok) {
+                    throw new Error('Upload could not be completed');
+                }
+                return session.upload_id;
+            });
+        }
+        const chunk = file.slice(offset, offset + session.chunk_size);
+        return request(session.url, {
+            method: 'PATCH',
+            headers: Object.assign({'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream'}, headers),
+            body: chunk
+        }).then(function(response) {
+            return response.json().then(function(data) {
+                if (!response.ok && response.status !== 409) {
+                    throw new Error(data.error || 'Upload failed');
+                }
+                onProgress(data.offset);
+                return sendFrom(session, data.offset, maxRetries);
+            });
+        }, function() {
+            // Connection dropped: wait, ask the server where to resume from and carry on
+            if (retries <= 0) {
+                throw new Error('Connection lost');
+            }
+            return new Promise(function(resolve) {
+                setTimeout(resolve, (maxRetries - retries + 1) * 1000);
+            }).then(function() {
+                return request(session.url, {method: 'GET'});
+            }).then(function(response) {
+                return response.json();
+            }).then(function(data) {
+                return sendFrom(session, data.offset, retries - 1);
+            }, function() {
+                return sendFrom(session, offset, retries - 1);
+            });
+        });
+    }
+
+    const body = new FormData();
+    body.append('filename', file.name);
+    body.append('size', file.size);
+    return request(startUrl, {method: 'POST', body: body}).then(function(response) {
+        return response.json().then(function(data) {
+            if (!response.ok) {
+                throw new Error(data.error || 'Upload could not be started');
+            }
+            data.url = startUrl + data.upload_id + '/';
+            return sendFrom(data, 0, maxRetries);
+        });
+    });
+}
+
+// Follow the dashboard feed, over Server-Sent Events where possible and by
+// long polling otherwise, and patch each change into the table
+function watchDashboard(tbody) {
+    let cursor = parseInt(tbody.dataset.cursor, 10) || 0;
+
+    function apply(change) {
+        if (change.id <= cursor) {
+            return;
+        }
+        cursor = change.id;
+        applyDashboardChange(tbody, change);
+    }
+
+    function poll() {
+        fetch(tbody.dataset.pollUrl + '?after=' + cursor, {credentials: 'same-origin'}).then(function(response) {
+            if (!response.ok) {
+                throw new Error('Feed unavailable');
+            }
+            return response.json();
+        }).then(function(data) {
+            data.events.forEach(apply);
+            poll();
+        }).catch(function() {
+            setTimeout(poll, 5000);
+        });
+    }
+
+    if (!window.EventSource) {
+        poll();
+        return;
+    }
+    const source = new EventSource(tbody.dataset.feedUrl + '?after=' + cursor);
+    let opened = false;
+    let failures = 0;
+    source.addEventListener('open', function() {
+        opened = true;
+        failures = 0;
+    });
+    source.addEventListener('change', function(event) {
+        apply(JSON.parse(event.data));
+    });
+    source.addEventListener('error', function() {
+        // The browser reconnects by itself after the server ends a stream;
+        // give up on SSE only if it never manages to connect
+        failures += 1;
+        if (!opened && failures >= 3) {
+            source.close();
+            poll();
+        }
+    });
+}
+
+const STATUS_BADGES = {
+    pending: 'bg-warning text-dark',
+    in_progress: 'bg-info',
+    on_hold: 'bg-secondary',
+    completed: 'bg-success',
+    cancelled: 'bg-danger'
+};
+
+const PRIORITY_BADGES = {
+    low: 'bg-success',
+    medium: 'bg-info',
+    high: 'bg-warning text-dark',
+    emergency: 'bg-danger'
+};
+
+function badge(text, classes) {
+    const span = document.createElement('span');
+    span.className = 'badge ' + (classes || '');
+    span.textContent = text;
+    return span;
+}
+
+function adjustStat(status, delta) {
+    const stat = document.querySelector('[data-stat="' + status + '"]');
+    if (stat) {
+        stat.textContent = Math.max((parseInt(stat.textContent, 10) || 0) + delta, 0);
+    }
+}
+
+function buildRequestRow(request) {
+    const row = document.createElement('tr');
+    row.dataset.requestNumber = request.request_number;
+    row.classList.add('table-info');
+
+    function cell(content) {
+        const td = document.createElement('td');
+        if (typeof content === 'string') {
+            td.textContent = content;
+        } else {
+            td.appendChild(content);
+        }
+        row.appendChild(td);
+        return td;
+    }
+
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.className = 'form-check-input';
+    checkbox.name = 'request_numbers';
+    checkbox.value = request.request_number;
+    checkbox.setAttribute('form', 'bulk-form');
+    cell(checkbox);
+    cell(request.request_number);
+    cell(request.customer + ' (' + request.account_number + ')');
+    cell(request.service_type);
+    cell(badge(request.status_display, STATUS_BADGES[request.status])).dataset.field = 'status';
+    cell(badge(request.priority_display, PRIORITY_BADGES[request.priority]));
+    cell(request.created_at);
+    if (request.assigned_to) {
+        cell(request.assigned_to);
+    } else {
+        const unassigned = document.createElement('span');
+        unassigned.className = 'text-muted';
+        unassigned.textContent = 'Unassigned';
+        cell(unassigned);
+    }
+    const link = document.createElement('a');
+    link.href = request.url;
+    link.className = 'btn btn-sm btn-outline-primary';
+    link.innerHTML = '<i class="fas fa-eye"></i> View';
+    cell(link);
+    return row;
+}
+
+function applyDashboardChange(tbody, change) {
+    const request = change.request;
+    const existing = tbody.querySelector('tr[data-request-number="' + CSS.escape(request.request_number) + '"]');
+
+    if (change.kind === 'created') {
+        adjustStat(change.new_status, 1);
+        if (existing) {
+            return;
+        }
+        const empty = tbody.querySelector('tr[data-empty-row]');
+        if (empty) {
+            empty.remove();
+        }
+        tbody.insertBefore(buildRequestRow(request), tbody.firstChild);
+        // Keep the page the same length; older rows are on the next page
+        const pageSize = parseInt(tbody.dataset.pageSize, 10);
+        while (pageSize && tbody.rows.length > pageSize) {
+            tbody.deleteRow(-1);
+        }
+        return;
+    }
+
+    adjustStat(change.previous_status, -1);
+    adjustStat(change.new_status, 1);
+    if (existing) {
+        const statusCell = existing.querySelector('[data-field="status"]');
+        statusCell.replaceChildren(badge(request.status_display, STATUS_BADGES[request.status]));
+        existing.classList.add('table-info');
+    }
+}